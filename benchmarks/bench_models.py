@@ -0,0 +1,113 @@
+"""
+Memory per object and set build/diff time of `TrackData` and `Item`.
+
+Compares the previous plain classes with a per-instance `__dict__` and
+tuple-building `__hash__` against the slotted models with a cached hash.
+
+    python -m benchmarks.bench_models [--count 100000] [--repeat 5]
+"""
+
+import argparse
+import statistics
+import time
+import tracemalloc
+
+from datetime import datetime, timedelta
+from playlist.models import Item
+from scraper.models import TrackData
+
+
+class _PlainTrackData:
+    spotify_uri: str = None
+    source: str = None
+    source_id: str = None
+
+    def __init__(self, track_name=None, artist_name=None, track_date=None, genre=None):
+        self.title = track_name
+        self.artist_name = artist_name
+        self.release_date = track_date
+        self.genre = genre
+
+    def __hash__(self) -> int:
+        return hash((self.title, self.artist_name))
+
+    def __eq__(self, other) -> bool:
+        return self.title == other.title and self.artist_name == other.artist_name
+
+
+class _PlainItem:
+    def __init__(self, id: str, release_date: str = None):
+        self.id = id
+        self.release_date = None
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    def __eq__(self, other) -> bool:
+        return self.id == other.id
+
+
+def _track_args(count: int):
+    now = datetime.now()
+    return [
+        (f"Track {i} (Extended Mix)", f"Artist {i % 500}", now - timedelta(hours=i))
+        for i in range(count)
+    ]
+
+
+def _item_args(count: int):
+    return [(f"spotify:track:{i:022d}", "2024-05-01") for i in range(count)]
+
+
+def _build(cls, args):
+    tracemalloc.start()
+    objects = [cls(*arg) for arg in args]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return objects, size
+
+
+def _time(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def _measure(cls, args, repeat: int):
+    # The argument tuples are allocated before tracing, only the objects count
+    objects, size = _build(cls, args)
+    half = len(objects) // 2
+    # Overlapping halves, like a playlist diffed against new releases
+    current = objects[:half]
+    incoming = objects[half // 2 :]
+
+    build = _time(lambda: set(incoming), repeat)
+    current_set, incoming_set = set(current), set(incoming)
+    diff = _time(
+        lambda: (incoming_set - current_set, current_set - incoming_set), repeat
+    )
+    return size / len(objects), build, diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'model':<22}{'bytes/object':>14}{'set build ms':>14}{'set diff ms':>13}")
+    for name, cls, make_args in [
+        ("TrackData (plain)", _PlainTrackData, _track_args),
+        ("TrackData (slotted)", TrackData, _track_args),
+        ("Item (plain)", _PlainItem, _item_args),
+        ("Item (slotted)", Item, _item_args),
+    ]:
+        per_object, build, diff = _measure(cls, make_args(args.count), args.repeat)
+        print(f"{name:<22}{per_object:>14.0f}{build * 1000:>14.1f}{diff * 1000:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
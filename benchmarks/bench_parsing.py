@@ -0,0 +1,84 @@
+"""
+Per-page parse time and memory of the scraper pages.
+
+Compares the previous full `html.parser` tree with the strained parse the
+scrapers use now, on both parser backends.
+
+    python -m benchmarks.bench_parsing [--repeat 20]
+"""
+
+import argparse
+import statistics
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+from benchmarks import fixtures
+from scraper import HardstyleDotCom, ReleaseHardstyle
+from utils.parsing import PARSER
+
+
+def _pages():
+    return [
+        (
+            "releasehardstyle list",
+            fixtures.releasehardstyle_list(100),
+            ReleaseHardstyle.LIST_STRAINER,
+        ),
+        (
+            "releasehardstyle detail",
+            fixtures.releasehardstyle_detail(1),
+            ReleaseHardstyle.DETAIL_STRAINER,
+        ),
+        (
+            "hardstyle.com list",
+            fixtures.hardstylecom_list(1),
+            HardstyleDotCom.LIST_STRAINER,
+        ),
+        (
+            "hardstyle.com detail",
+            fixtures.hardstylecom_detail(1),
+            HardstyleDotCom.DETAIL_STRAINER,
+        ),
+    ]
+
+
+def _measure(content: bytes, parser: str, strainer, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        BeautifulSoup(content, parser, parse_only=strainer)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    soup = BeautifulSoup(content, parser, parse_only=strainer)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del soup
+
+    return statistics.median(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    variants = [("html.parser", False), ("html.parser", True)]
+    if PARSER != "html.parser":
+        variants += [(PARSER, False), (PARSER, True)]
+
+    print(f"{'page':<26}{'parser':<14}{'strained':<10}{'ms/page':>10}{'peak KiB':>10}")
+    for name, html, strainer in _pages():
+        content = html.encode()
+        for backend, strained in variants:
+            median, peak = _measure(
+                content, backend, strainer if strained else None, args.repeat
+            )
+            print(
+                f"{name:<26}{backend:<14}{str(strained):<10}{median * 1000:>10.2f}{peak / 1024:>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Offline end-to-end benchmark of `main.sync`.
+
+Scraper pages are replayed from fixtures through `web_request` and
+`SpotifyAPI` talks to a local mock server. Every scenario runs in a fresh
+process and reports wall time, requests per host and peak RSS.
+
+    python -m benchmarks.bench_sync [--scenarios 50:100 500:1000 5000:10000]
+        [--modes sequential pipeline] [--latency 0.01] [--rate-429 0.01]
+        [--json results.json]
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+# Settings sync would otherwise pick up from the environment
+_SYNC_ENV = (
+    "HTTP_CACHE_PATH",
+    "SEEN_STORE_PATH",
+    "RESOLUTION_CACHE_PATH",
+    "SPOTIFY_TOKEN_CACHE_PATH",
+    "TRACK_INDEX_PATH",
+    "CATALOG_PATH",
+    "PLAYLIST_RETENTION_DAYS",
+    "PLAYLIST_ORDER",
+    "SPOTIFY_PLAYLIST_CACHE_PATH",
+    "SYNC_JOURNAL_PATH",
+)
+
+
+def run_scenario(
+    releases: int,
+    playlist_size: int,
+    mode: str,
+    latency: float,
+    rate_429: float,
+    recorded_dir: str = None,
+) -> dict:
+    """
+    Run one sync against fixtures and the mock server, in the current process.
+    """
+    logging.disable(logging.WARNING)
+
+    import main
+    from benchmarks import fixtures, replay
+    from benchmarks.spotify_mock import SpotifyMock
+    from playlist import Spotify
+    from scraper import ReleaseHardstyle
+    from utils.http import HttpClient, set_client
+
+    for name in _SYNC_ENV:
+        os.environ.pop(name, None)
+    os.environ["SPOTIFY_REFRESH_TOKEN"] = "benchmark"
+    os.environ["SYNC_MODE"] = mode
+
+    client = HttpClient(pool_maxsize=16)
+    set_client(client)
+
+    # Spread the releases so all of them fall within the two day window
+    per_day = releases // 2 + 1
+    adapter = replay.install(
+        client, replay.FixtureSite(releases, per_day, recorded_dir=recorded_dir)
+    )
+
+    mock = SpotifyMock(playlist_size, latency=latency, rate_429=rate_429).start()
+    spotify = Spotify(
+        client_id="benchmark",
+        client_secret="benchmark",
+        playlist_id="benchmark",
+        api_url=mock.api_url,
+        accounts_url=mock.accounts_url,
+    )
+    scraper = ReleaseHardstyle(
+        from_date=fixtures.release_date(releases - 1, per_day),
+        max_workers=8,
+        requests_per_second=0,
+        max_in_flight=8,
+    )
+
+    start = time.perf_counter()
+    error = None
+    try:
+        main.sync(scraper=scraper, spotify=spotify)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    wall = time.perf_counter() - start
+    mock.stop()
+
+    return {
+        "releases": releases,
+        "playlist_size": playlist_size,
+        "mode": mode,
+        "wall_seconds": round(wall, 3),
+        "requests": {**adapter.counts, **mock.host_counts()},
+        "spotify_endpoints": dict(mock.counts),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mib": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "error": error,
+    }
+
+
+def _run_in_child(queue, kwargs):
+    queue.put(run_scenario(**kwargs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        default=["50:100", "500:1000", "5000:10000"],
+        help="releases:playlist_size pairs",
+    )
+    parser.add_argument(
+        "--modes", nargs="+", default=["sequential"], choices=["sequential", "pipeline"]
+    )
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--recorded-dir", default=None)
+    parser.add_argument("--json", default=None, help="Write the results to a file")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+
+    print(
+        f"{'releases':>9}{'playlist':>10}{'mode':>12}{'wall s':>9}{'rss MiB':>9}  requests"
+    )
+    for scenario in args.scenarios:
+        releases, playlist_size = (int(value) for value in scenario.split(":"))
+        for mode in args.modes:
+            queue = context.Queue()
+            process = context.Process(
+                target=_run_in_child,
+                args=(
+                    queue,
+                    {
+                        "releases": releases,
+                        "playlist_size": playlist_size,
+                        "mode": mode,
+                        "latency": args.latency,
+                        "rate_429": args.rate_429,
+                        "recorded_dir": args.recorded_dir,
+                    },
+                ),
+            )
+            process.start()
+            result = queue.get()
+            process.join()
+            results.append(result)
+
+            print(
+                f"{releases:>9}{playlist_size:>10}{mode:>12}{result['wall_seconds']:>9.2f}"
+                f"{result['peak_rss_mib']:>9.1f}  {result['requests']}"
+            )
+            if result["error"]:
+                print(f"{'':>9}failed: {result['error']}", file=sys.stderr)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Offline check and timing of importing a backfill file into the catalog:
+every track is stored once, importing again changes nothing, and linked
+releases within the window show up in the catalog's playlist diff.
+
+    python -m benchmarks.check_backfill [--count 20000]
+"""
+
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+
+from datetime import datetime, timedelta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=20000)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    from catalog import Catalog
+    from scraper.backfill import FIELDS, import_backfill
+    from scraper.models import TrackData
+
+    now = datetime.now()
+    tracks = [
+        TrackData(
+            f"Title {i}",
+            f"Artist {i % 500}",
+            now - timedelta(days=i % 365),
+            # Every tenth release links its Spotify track
+            spotify_uri=f"spotify:track:{i:022d}" if i % 10 == 0 else None,
+            source="hardstylecom",
+            source_id=str(i),
+        )
+        for i in range(args.count)
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "backfill.jsonl")
+        with open(path, "w") as f:
+            for track in tracks:
+                f.write(json.dumps(dict(zip(FIELDS, track.to_row()))) + "\n")
+
+        catalog = Catalog(os.path.join(directory, "catalog.db"))
+        try:
+            start = time.perf_counter()
+            imported = import_backfill(path, catalog)
+            elapsed = time.perf_counter() - start
+            assert imported == args.count, f"imported {imported} of {args.count}"
+            assert catalog.stats()["tracks"] == args.count
+
+            import_backfill(path, catalog)
+            assert catalog.stats()["tracks"] == args.count, "import is not idempotent"
+
+            known = catalog.get_many("hardstylecom", ["0", "1"])
+            assert known["0"].spotify_uri == tracks[0].spotify_uri
+            assert known["1"] == tracks[1]
+
+            window = {"hardstylecom": now - timedelta(days=30)}
+            expected = {
+                track.spotify_uri
+                for track in tracks
+                if track.spotify_uri and track.release_date >= window["hardstylecom"]
+            }
+            added = {item.id for item in catalog.releases_not_in_playlist(window)}
+            assert added == expected, f"{len(added)} releases, {len(expected)} expected"
+        finally:
+            catalog.close()
+
+    print(
+        f"Imported {args.count} backfilled tracks in {elapsed:.2f}s"
+        f" ({args.count / elapsed:.0f} tracks/s), checks passed"
+    )
+
+
+if __name__ == "__main__":
+    main()
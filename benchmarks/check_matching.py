@@ -0,0 +1,73 @@
+"""
+Offline check of track matching against the mock server: an indexed track
+must not stand in for another version of its title, and an indexed track
+too old for the scrape window must not keep a new namesake from being
+searched.
+
+    python -m benchmarks.check_matching
+"""
+
+import logging
+import os
+
+from datetime import datetime, timedelta
+
+
+def main():
+    logging.disable(logging.WARNING)
+
+    from benchmarks.spotify_mock import SpotifyMock
+    from playlist import Spotify
+    from playlist.track_index import TrackIndex, match_score
+    from utils.http import HttpClient
+
+    # Another version of a title is never a match
+    for title, candidate in (
+        ("Dragonborn Part 2", "Dragonborn"),
+        ("Dragonborn Pt. II", "Dragonborn Part 1"),
+        ("Lose Control", "Lose Control (Remix)"),
+        ("Lose Control", "Lose Control - VIP"),
+    ):
+        score = match_score(title, "Headhunterz", candidate, ["Headhunterz"])
+        assert score == 0, f"{title!r} matches {candidate!r} at {score:.2f}"
+    assert match_score("Dragonborn Part 2", "", "Dragonborn (Part 2)", []) == 1
+
+    index = TrackIndex()
+    index.add("spotify:track:dragonborn", "Dragonborn", ["Headhunterz"], "2019-03-01")
+    index.add(
+        "spotify:track:remix", "Lose Control (Remix)", ["Someone Else"], "2024-01-01"
+    )
+    index.add("spotify:track:losing", "Losing Control", ["Someone Else"], "2024-01-01")
+    assert index.lookup("Dragonborn Part 2", "Headhunterz") is None
+    assert index.lookup("Lose Control", "") is None
+    assert index.lookup("Dragonborn", "Headhunterz").uri == "spotify:track:dragonborn"
+
+    os.environ["SPOTIFY_REFRESH_TOKEN"] = "check"
+    mock = SpotifyMock(playlist_size=0, not_found_every=0).start()
+    try:
+        spotify = Spotify(
+            client_id="check",
+            client_secret="check",
+            playlist_id="check",
+            http=HttpClient(),
+            api_url=mock.api_url,
+            accounts_url=mock.accounts_url,
+            track_index=index,
+        )
+        from_date = datetime.now() - timedelta(days=2)
+
+        # A new namesake of an old indexed track is searched
+        for title in ("Dragonborn Part 2", "Dragonborn"):
+            searches = mock.counts["search"]
+            item = spotify.resolve_track(title, "Headhunterz", from_date)
+            assert item is not None, f"{title!r} was not resolved"
+            assert item.id != "spotify:track:dragonborn", f"{title!r} hit the index"
+            assert mock.counts["search"] == searches + 1, f"{title!r} not searched"
+    finally:
+        mock.stop()
+
+    print("Track matching checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Deterministic stand-ins for the pages the scrapers read.
+
+The pages follow the markup the scrapers select on (list entries, detail info
+containers, `span.date`, `a.linkTitle`) and are padded with the navigation,
+scripts and sidebars of the real sites, so parse times are comparable.
+"""
+
+from datetime import datetime, timedelta
+
+RELEASEHARDSTYLE_HOST = "releasehardstyle.nl"
+HARDSTYLECOM_HOST = "hardstyle.com"
+HARDSTYLECOM_PAGE_SIZE = 30
+
+
+def _chrome(body: str) -> str:
+    nav = "".join(
+        f'<li class="menu-item"><a href="/category/{i}/">Category {i}</a></li>'
+        for i in range(120)
+    )
+    scripts = "".join(
+        f"<script>window.__data_{i} = {{'id': {i}, 'items': [{', '.join(str(j) for j in range(40))}]}};</script>"
+        for i in range(15)
+    )
+    sidebar = "".join(
+        f'<div class="widget"><h3>Popular {i}</h3><p>{"Lorem ipsum dolor sit amet. " * 8}</p></div>'
+        for i in range(25)
+    )
+    return (
+        "<!DOCTYPE html><html><head><title>Hardstyle</title>"
+        '<meta charset="utf-8"><link rel="stylesheet" href="/style.css">'
+        f"{scripts}</head><body><header><nav><ul>{nav}</ul></nav></header>"
+        f"<main>{body}</main><aside>{sidebar}</aside><footer>{nav}</footer>"
+        "</body></html>"
+    )
+
+
+def release_date(index: int, per_day: int = 4, now: datetime = None) -> datetime:
+    """
+    Release date of the `index`-th newest fixture release.
+    """
+    now = now or datetime.now()
+    return (now - timedelta(days=index // per_day)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+def _spotify_link(index: int, unresolved_every: int) -> str:
+    # Releases that are not on Spotify yet link to an empty track id
+    if unresolved_every and index % unresolved_every == 0:
+        return "https://open.spotify.com/track/"
+    return f"https://open.spotify.com/track/fixture{index:08d}"
+
+
+def releasehardstyle_list(
+    count: int, offset: int = 0, unresolved_every: int = 0
+) -> str:
+    entries = "".join(
+        f'<div class="releasetracker-list-entry" targetid="{i}">'
+        f'<img src="/covers/{i}.jpg" alt="cover"><span class="artists">Artist {i}</span>'
+        f'<span class="title">Release {i}</span>'
+        f'<a id="releasetracker-a" href="{_spotify_link(i, unresolved_every)}">Spotify</a>'
+        "</div>"
+        for i in range(offset, offset + count)
+    )
+    upcoming = "".join(
+        f'<div class="releasetracker-list-entry upcoming" targetid="u{i}"><span>Soon {i}</span></div>'
+        for i in range(10)
+    )
+    return _chrome(
+        f'<div class="releasetracker-list-container">{upcoming}</div>'
+        f'<div class="releasetracker-list-container">{entries}</div>'
+    )
+
+
+def releasehardstyle_detail(index: int, per_day: int = 4) -> str:
+    date = release_date(index, per_day).strftime("%d %b %Y")
+    related = "".join(
+        f'<div class="related"><a href="/release/{index + j}/">Related {j}</a></div>'
+        for j in range(1, 20)
+    )
+    return _chrome(
+        '<div class="releasetracker_details"><div class="releasetracker_details-info_container">'
+        '<div class="releasetracker_details-info_container-inner">'
+        f"<p>Title: Artist {index} - Release {index}</p>"
+        f"<p>Label: Label {index % 7}</p>"
+        f"<p>Release date: {date}</p>"
+        f"</div></div>{related}</div>"
+    )
+
+
+def hardstylecom_list(page: int, page_size: int = HARDSTYLECOM_PAGE_SIZE) -> str:
+    tracks = []
+    for i in range((page - 1) * page_size, page * page_size):
+        mix = "Extended Remix" if i % 3 == 0 else "Extended Mix"
+        tracks.append(
+            '<div class="trackContent">'
+            f'<a class="linkTitle" href="/en/track/{i}" title="Track {i}">Track {i}</a>'
+            f'<a class="linkTitle" href="/en/track/{i}" title="{mix}">{mix}</a>'
+            f'<span class="artists"><a class="highlight" href="/en/artist/{i}" title="Artist {i}">Artist {i}</a></span>'
+            '<div class="player"><button class="play">Play</button></div>'
+            "</div>"
+        )
+    return _chrome(f'<div class="trackList">{"".join(tracks)}</div>')
+
+
+def hardstylecom_detail(index: int, per_day: int = 5) -> str:
+    date = release_date(index, per_day).strftime("%d.%m.%Y")
+    return _chrome(
+        f'<div class="trackDetail"><h1>Track {index}</h1>'
+        f'<div class="info"><span class="label">Label {index % 7}</span>'
+        f'<span class="date">{date}</span></div>'
+        f'<p>{"Description of the track. " * 30}</p></div>'
+    )
@@ -0,0 +1,123 @@
+"""
+Serve scraper pages from fixtures instead of the network.
+
+A `FixtureAdapter` is mounted on the shared HTTP client for the scraper hosts,
+so `web_request` (rate limiter, cache and retries included) runs unchanged.
+Pages recorded with `record()` take precedence over the generated ones.
+"""
+
+import hashlib
+import os
+import re
+import threading
+
+from collections import Counter
+from typing import Iterable, Optional
+from urllib.parse import urlparse
+from requests import Response
+from requests.adapters import BaseAdapter
+from benchmarks import fixtures
+from utils.http import HttpClient
+
+
+def _recorded_path(directory: str, url: str) -> str:
+    return os.path.join(directory, hashlib.sha1(url.encode()).hexdigest() + ".html")
+
+
+def record(urls: Iterable[str], directory: str):
+    """
+    Download pages so they can be replayed later.
+
+    :param urls: Pages to record.
+    :param directory: Directory the pages are written to.
+    """
+    from utils.utils import web_request
+
+    os.makedirs(directory, exist_ok=True)
+    for url in urls:
+        with open(_recorded_path(directory, url), "wb") as f:
+            f.write(web_request(url).content)
+
+
+class FixtureSite:
+    """
+    Routes scraper URLs to fixture pages.
+
+    :param releases: Number of releases on the releasehardstyle.nl list page.
+    :param per_day: Releases per day, controls the release dates.
+    :param unresolved_every: Every n-th release has no Spotify link and has to
+        be searched, 0 for none.
+    :param recorded_dir: Optional directory of recorded pages.
+    """
+
+    def __init__(
+        self,
+        releases: int,
+        per_day: int = 4,
+        unresolved_every: int = 4,
+        recorded_dir: str = None,
+    ):
+        self.releases = releases
+        self.per_day = per_day
+        self.unresolved_every = unresolved_every
+        self.recorded_dir = recorded_dir
+
+    def page(self, url: str) -> Optional[str]:
+        if self.recorded_dir and os.path.exists(_recorded_path(self.recorded_dir, url)):
+            with open(_recorded_path(self.recorded_dir, url)) as f:
+                return f.read()
+
+        if match := re.search(r"releasehardstyle\.nl/release/(\d+)/", url):
+            return fixtures.releasehardstyle_detail(int(match.group(1)), self.per_day)
+        if re.search(r"releasehardstyle\.nl/releases/", url):
+            return fixtures.releasehardstyle_list(
+                self.releases, unresolved_every=self.unresolved_every
+            )
+        if match := re.search(r"hardstyle\.com/en/tracks\?page=(\d+)", url):
+            return fixtures.hardstylecom_list(int(match.group(1)))
+        if match := re.search(r"hardstyle\.com/en/track/(\d+)", url):
+            return fixtures.hardstylecom_detail(int(match.group(1)), self.per_day)
+        return None
+
+
+class FixtureAdapter(BaseAdapter):
+    """
+    Transport adapter answering from a `FixtureSite` and counting the
+    requests per host.
+    """
+
+    def __init__(self, site: FixtureSite):
+        super().__init__()
+        self.site = site
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs) -> Response:
+        with self._lock:
+            self.counts[urlparse(request.url).netloc] += 1
+
+        page = self.site.page(request.url)
+
+        response = Response()
+        response.url = request.url
+        response.request = request
+        response.status_code = 200 if page is not None else 404
+        response.headers["Content-Type"] = "text/html; charset=utf-8"
+        response._content = (page or "").encode()
+        response.encoding = "utf-8"
+        return response
+
+    def close(self):
+        pass
+
+
+def install(client: HttpClient, site: FixtureSite) -> FixtureAdapter:
+    """
+    Answer the scraper hosts of `client` from `site`.
+
+    :return: The mounted adapter, for its request counts.
+    """
+    adapter = FixtureAdapter(site)
+    for host in (fixtures.RELEASEHARDSTYLE_HOST, fixtures.HARDSTYLECOM_HOST):
+        client.session.mount(f"https://{host}/", adapter)
+    return adapter
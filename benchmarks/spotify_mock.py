@@ -0,0 +1,246 @@
+"""
+Local stand-in for the Spotify accounts and Web API endpoints used by
+`SpotifyAPI`: token, search, playlist read and playlist mutations.
+
+Latency and 429 responses can be injected to see how a sync behaves against
+a slow or throttling API.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import zlib
+
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, payload: dict = None, headers: dict = None):
+        body = json.dumps(payload or {}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(raw or b"{}")
+        return parse_qs(raw.decode())
+
+    def _handle(self, method: str):
+        mock = self.server.mock
+        url = urlparse(self.path)
+        body = self._body() if method in ("POST", "PUT", "DELETE") else {}
+        endpoint = mock.count(method, url.path)
+
+        if mock.latency:
+            time.sleep(mock.latency)
+
+        if endpoint != "token" and mock.throttle():
+            return self._send(
+                429,
+                {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                {"Retry-After": str(mock.retry_after)},
+            )
+
+        status, payload = mock.dispatch(method, url.path, parse_qs(url.query), body)
+        self._send(status, payload)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+class SpotifyMock:
+    """
+    In-memory Spotify playlist behind a local HTTP server.
+
+    :param playlist_size: Number of items the playlist starts with.
+    :param latency: Seconds added to every response.
+    :param rate_429: Fraction of API requests answered with 429.
+    :param retry_after: Retry-After seconds sent with a 429.
+    :param not_found_every: Roughly every n-th search finds nothing, 0 for none.
+    :param seed: Seed of the 429 injection.
+    """
+
+    def __init__(
+        self,
+        playlist_size: int = 100,
+        latency: float = 0.0,
+        rate_429: float = 0.0,
+        retry_after: int = 1,
+        not_found_every: int = 10,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.not_found_every = not_found_every
+        self.playlist = [f"spotify:track:existing{i:08d}" for i in range(playlist_size)]
+        self.snapshot = 0
+        self.counts = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def api_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/v1"
+
+    @property
+    def accounts_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "SpotifyMock":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, method: str, path: str) -> str:
+        if path == "/api/token":
+            endpoint = "token"
+        elif path == "/v1/search":
+            endpoint = "search"
+        elif path.endswith("/tracks") and path.startswith("/v1/playlists/"):
+            endpoint = f"playlist_tracks_{method.lower()}"
+        else:
+            endpoint = f"{method.lower()} {re.sub(r'/[A-Za-z0-9]{8,}', '/{id}', path)}"
+
+        with self._lock:
+            self.counts[endpoint] += 1
+        return endpoint
+
+    def throttle(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.rate_429
+
+    def host_counts(self) -> dict:
+        token = self.counts["token"]
+        return {
+            "accounts.spotify.com": token,
+            "api.spotify.com": sum(self.counts.values()) - token,
+        }
+
+    def _track(self, uri: str, name: str = None) -> dict:
+        return {
+            "uri": uri,
+            "id": uri.rsplit(":", 1)[-1],
+            "name": name or uri.rsplit(":", 1)[-1],
+            "artists": [{"name": "Fixture Artist"}],
+            "album": {"release_date": datetime.now().strftime("%Y-%m-%d")},
+        }
+
+    def dispatch(self, method: str, path: str, query: dict, body: dict):
+        if path == "/api/token":
+            return 200, {
+                "access_token": f"mock-token-{time.time()}",
+                "token_type": "Bearer",
+                "expires_in": 3600,
+            }
+
+        if path == "/v1/search":
+            q = query.get("q", [""])[0]
+            limit = int(query.get("limit", ["5"])[0])
+            checksum = zlib.crc32(q.encode())
+            if self.not_found_every and checksum % self.not_found_every == 0:
+                return 200, {"tracks": {"items": []}}
+            # The exact title ranks second, behind an edit of it
+            title = re.sub(r"^track:|\s*artist:.*$", "", q)
+            names = [f"{title} (Radio Edit)", title] + [
+                f"{title} (Live {i})" for i in range(2, limit)
+            ]
+            items = [
+                self._track(f"spotify:track:search{checksum:010d}{i}", name)
+                for i, name in enumerate(names[:limit])
+            ]
+            return 200, {"tracks": {"items": items}}
+
+        if path == "/v1/tracks":
+            ids = query.get("ids", [""])[0].split(",")
+            return 200, {"tracks": [self._track(f"spotify:track:{id_}") for id_ in ids]}
+
+        match = re.fullmatch(r"/v1/playlists/([^/]+)(/tracks)?", path)
+        if match is None:
+            return 404, {"error": {"status": 404, "message": "Not found"}}
+
+        with self._lock:
+            if not match.group(2):
+                return 200, {
+                    "snapshot_id": f"snapshot-{self.snapshot}",
+                    "tracks": {"total": len(self.playlist)},
+                }
+            return self._playlist_tracks(method, query, body)
+
+    def _playlist_tracks(self, method: str, query: dict, body: dict):
+        if method == "GET":
+            offset = int(query.get("offset", ["0"])[0])
+            limit = int(query.get("limit", ["100"])[0])
+            items = [
+                {"added_at": "2024-01-01T00:00:00Z", "track": self._track(uri)}
+                for uri in self.playlist[offset : offset + limit]
+            ]
+            return 200, {
+                "items": items,
+                "total": len(self.playlist),
+                "offset": offset,
+                "limit": limit,
+            }
+
+        if method == "POST":
+            uris = body.get("uris", [])
+            if len(uris) > 100:
+                return 400, {"error": {"status": 400, "message": "Too many ids"}}
+            position = body.get("position")
+            if position is None:
+                self.playlist.extend(uris)
+            else:
+                self.playlist[position:position] = uris
+        elif method == "DELETE":
+            tracks = body.get("tracks", [])
+            if len(tracks) > 100:
+                return 400, {"error": {"status": 400, "message": "Too many ids"}}
+            removed = {track["uri"] for track in tracks}
+            self.playlist = [uri for uri in self.playlist if uri not in removed]
+        elif method == "PUT":
+            start = body["range_start"]
+            length = body.get("range_length", 1)
+            insert_before = body["insert_before"]
+            block = self.playlist[start : start + length]
+            rest = self.playlist[:start] + self.playlist[start + length :]
+            if insert_before > start:
+                insert_before -= length
+            self.playlist = rest[:insert_before] + block + rest[insert_before:]
+
+        self.snapshot += 1
+        return 200 if method != "POST" else 201, {
+            "snapshot_id": f"snapshot-{self.snapshot}"
+        }
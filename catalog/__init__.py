@@ -0,0 +1 @@
+from catalog.catalog import Catalog
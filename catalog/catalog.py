@@ -0,0 +1,260 @@
+import logging
+import time
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from playlist.models import Item
+from scraper.models import TrackData
+from scraper.seen_store import SeenStore
+
+logger = logging.getLogger("hardstyle_watcher.catalog")
+
+
+class Catalog(SeenStore):
+    """
+    Seen store that also keeps the playlist as last read or written, so the
+    playlist diff is two indexed queries: releases within the window that
+    are not in the playlist, and playlist items that are not releases within
+    the window.
+
+    Scrapers use it as their seen store, so one database holds the scraped
+    releases and what they resolved to. `SpotifyAPI` uses it as its
+    playlist store: the playlist is only read again when its snapshot
+    changed since the last run, and the applied changes are written back.
+
+    :param path: Path of the SQLite database.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        with self._lock:
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS playlist_items (
+                    position INTEGER PRIMARY KEY,
+                    uri TEXT NOT NULL,
+                    release_date TEXT,
+                    added_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS playlist_items_uri
+                    ON playlist_items (uri);
+
+                CREATE TABLE IF NOT EXISTS playlist_state (
+                    playlist_id TEXT PRIMARY KEY,
+                    snapshot_id TEXT,
+                    applied_fingerprint TEXT,
+                    applied_snapshot_id TEXT,
+                    synced_at REAL NOT NULL
+                );
+                """)
+
+    def upsert_track(self, track: TrackData, item: Optional[Item] = None):
+        """
+        Store a scraped track and what it resolved to. A known resolution is
+        kept when the track did not resolve this time.
+
+        :param track: Track with `source` and `source_id` set.
+        :param item: Playlist item the track resolved to, if any.
+        """
+        if item is None:
+            self.add(track)
+        else:
+            # Only a URI the scraped page carried counts as linked
+            self.add(
+                track.replace(spotify_uri=item.id),
+                item.release_date,
+                linked=track.spotify_uri == item.id,
+            )
+
+    def resolution(self, track: TrackData) -> Optional[Item]:
+        """
+        Spotify item an earlier run resolved the track to, looked up by its
+        source id and otherwise by its normalized key.
+
+        :param track: Scraped track.
+        :return: The resolved item, None if the track was never resolved.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT spotify_uri, spotify_release_date FROM seen"
+                " WHERE source = ? AND source_id = ? AND spotify_uri IS NOT NULL",
+                (track.source, track.source_id),
+            ).fetchone()
+            if row is None:
+                row = self._db.execute(
+                    "SELECT spotify_uri, spotify_release_date FROM seen"
+                    " WHERE key = ? AND spotify_uri IS NOT NULL",
+                    (track.key,),
+                ).fetchone()
+        return Item(*row) if row is not None else None
+
+    def set_release_dates(self, items: Iterable[Item]):
+        """
+        Store the Spotify release dates of resolved items.
+
+        :param items: Items with their release date filled in.
+        """
+        with self._lock:
+            self._db.executemany(
+                "UPDATE seen SET spotify_release_date = ? WHERE spotify_uri = ?",
+                ((item.release_date, item.id) for item in items if item.release_date),
+            )
+            self._db.commit()
+
+    def clear_resolutions(self, items: Iterable[Item]):
+        """
+        Forget that tracks resolved to the given items, e.g. because the
+        Spotify release turned out to be too old.
+
+        :param items: Items to unlink.
+        """
+        with self._lock:
+            self._db.executemany(
+                "UPDATE seen SET spotify_uri = NULL, spotify_release_date = NULL"
+                " WHERE spotify_uri = ?",
+                ((item.id,) for item in items),
+            )
+            self._db.commit()
+
+    def load_playlist(
+        self, playlist_id: str
+    ) -> Optional[Tuple[Optional[str], List[Item], Optional[Tuple[str, str]]]]:
+        """
+        The playlist as last stored, see `save_playlist`.
+
+        :param playlist_id: Id of the playlist.
+        :return: Snapshot id, items in playlist order and the applied
+            (fingerprint, snapshot id), None if another playlist or none
+            was stored.
+        """
+        with self._lock:
+            state = self._db.execute(
+                "SELECT snapshot_id, applied_fingerprint, applied_snapshot_id"
+                " FROM playlist_state WHERE playlist_id = ?",
+                (playlist_id,),
+            ).fetchone()
+        if state is None:
+            return None
+        snapshot_id, fingerprint, applied_snapshot_id = state
+        return (
+            snapshot_id,
+            self.playlist(),
+            (fingerprint, applied_snapshot_id) if fingerprint else None,
+        )
+
+    def save_playlist(
+        self,
+        playlist_id: str,
+        snapshot_id: Optional[str],
+        items: List[Item],
+        applied: Optional[Tuple[str, str]] = None,
+    ):
+        """
+        Store the playlist as read from Spotify or as changed by a sync.
+
+        :param playlist_id: Id of the playlist.
+        :param snapshot_id: Snapshot the items are the content of, None
+            when it is unknown and the playlist must be read again.
+        :param items: Items in playlist order.
+        :param applied: Fingerprint of the last applied sync and the
+            snapshot it resulted in.
+        """
+        fingerprint, applied_snapshot_id = applied or (None, None)
+        with self._lock:
+            self._db.execute("DELETE FROM playlist_state")
+            self._db.execute("DELETE FROM playlist_items")
+            self._db.executemany(
+                "INSERT INTO playlist_items VALUES (?, ?, ?, ?)",
+                ((position, *item.to_row()) for position, item in enumerate(items)),
+            )
+            self._db.execute(
+                "INSERT INTO playlist_state VALUES (?, ?, ?, ?, ?)",
+                (
+                    playlist_id,
+                    snapshot_id,
+                    fingerprint,
+                    applied_snapshot_id,
+                    time.time(),
+                ),
+            )
+            self._db.commit()
+
+    def playlist(self) -> List[Item]:
+        """
+        Last known playlist items, in playlist order.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT uri, release_date, added_at FROM playlist_items"
+                " ORDER BY position"
+            ).fetchall()
+        return [Item(*row) for row in rows]
+
+    @staticmethod
+    def _releases_in(windows: Dict[str, datetime]):
+        """
+        Query of the resolved releases within the window, one row per
+        release: when sources resolved a release to different URIs, a URI
+        the page linked wins over a searched one, then the newest record.
+        """
+        clause = " OR ".join("(source = ? AND release_date >= ?)" for _ in windows)
+        params = [
+            value
+            for source, from_date in windows.items()
+            for value in (source, from_date.isoformat())
+        ]
+        query = (
+            "SELECT spotify_uri, spotify_release_date, release_date FROM"
+            " (SELECT spotify_uri, spotify_release_date, release_date,"
+            " ROW_NUMBER() OVER (PARTITION BY release_key"
+            " ORDER BY linked DESC, seen_at DESC) AS rank"
+            f" FROM seen WHERE ({clause or '0'}) AND spotify_uri IS NOT NULL)"
+            " WHERE rank = 1"
+        )
+        return query, params
+
+    def releases_not_in_playlist(self, windows: Dict[str, datetime]) -> List[Item]:
+        """
+        Resolved releases within the window that are not in the playlist.
+
+        :param windows: Start of the window per source.
+        :return: Items to add, newest release first.
+        """
+        releases, params = self._releases_in(windows)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT spotify_uri, MAX(spotify_release_date)"
+                f" FROM ({releases})"
+                " WHERE spotify_uri NOT IN (SELECT uri FROM playlist_items)"
+                " GROUP BY spotify_uri ORDER BY MAX(release_date) DESC",
+                params,
+            ).fetchall()
+        return [Item(*row) for row in rows]
+
+    def playlist_items_outside(self, windows: Dict[str, datetime]) -> List[Item]:
+        """
+        Playlist items that are not a resolved release within the window,
+        e.g. releases older than the window's start.
+
+        :param windows: Start of the window per source.
+        :return: Items to remove, once each.
+        """
+        releases, params = self._releases_in(windows)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT uri, release_date, added_at FROM playlist_items"
+                f" WHERE uri NOT IN (SELECT spotify_uri FROM ({releases}))"
+                " GROUP BY uri ORDER BY MIN(position)",
+                params,
+            ).fetchall()
+        return [Item(*row) for row in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            (tracks,) = self._db.execute("SELECT COUNT(*) FROM seen").fetchone()
+            (resolved,) = self._db.execute(
+                "SELECT COUNT(*) FROM seen WHERE spotify_uri IS NOT NULL"
+            ).fetchone()
+            (playlist,) = self._db.execute(
+                "SELECT COUNT(*) FROM playlist_items"
+            ).fetchone()
+        return {"tracks": tracks, "resolved": resolved, "playlist": playlist}
@@ -0,0 +1,2 @@
+from daemon.file_lock import file_lock
+from daemon.sync_daemon import SyncDaemon
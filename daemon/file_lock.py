@@ -0,0 +1,29 @@
+import fcntl
+
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+@contextmanager
+def file_lock(path: Optional[str]) -> Iterator[bool]:
+    """
+    Hold an exclusive lock on a file without waiting for it, so processes
+    syncing the same playlist (a cron job, a daemon) never overlap.
+
+    :param path: Lock file, created when missing. None locks nothing.
+    :return: Context yielding whether the lock was acquired.
+    """
+    if path is None:
+        yield True
+        return
+
+    with open(path, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
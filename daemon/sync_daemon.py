@@ -0,0 +1,143 @@
+import logging
+import random
+import signal
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+from daemon.file_lock import file_lock
+
+logger = logging.getLogger("hardstyle_watcher.daemon")
+
+
+class SyncDaemon:
+    """
+    Runs a sync on a schedule in a long-running process, so connections,
+    tokens and caches stay warm between runs.
+
+    Runs start every `interval` seconds, shifted by up to `jitter` seconds
+    either way. A run that takes longer than the interval is followed by the
+    next one right away, missed runs are not made up for. SIGTERM and SIGINT
+    stop the daemon after the current run, a second signal stops it at once.
+
+    Runs never overlap: within the process a lock guards the run, across
+    processes (e.g. a cron job next to the daemon) an exclusive lock on
+    `lock_path`. A run that finds the lock held is skipped.
+
+    :param run: Function performing one sync.
+    :param interval: Seconds between the starts of two runs.
+    :param jitter: Maximum number of seconds a start is moved.
+    :param lock_path: Lock file shared with other processes syncing the
+        same playlist.
+    """
+
+    def __init__(
+        self,
+        run: Callable[[], None],
+        interval: float,
+        jitter: float = 0.0,
+        lock_path: Optional[str] = None,
+    ):
+        self.run = run
+        self.interval = interval
+        self.jitter = jitter
+        self.lock_path = lock_path
+        self.runs = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._previous_handlers = {}
+
+    def stop(self):
+        """
+        Stop after the current run.
+        """
+        self._stopped.set()
+
+    @property
+    def stopped(self) -> bool:
+        return self._stopped.is_set()
+
+    def _handle_signal(self, signum, frame):
+        logger.info(f"Received {signal.Signals(signum).name}, stopping after this run")
+        self.stop()
+        # A second signal gets the default treatment
+        for handled, handler in self._previous_handlers.items():
+            signal.signal(handled, handler)
+
+    def _install_signal_handlers(self):
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            self._previous_handlers[signum] = signal.signal(signum, self._handle_signal)
+
+    def _restore_signal_handlers(self):
+        for signum, handler in self._previous_handlers.items():
+            signal.signal(signum, handler)
+        self._previous_handlers = {}
+
+    @contextmanager
+    def exclusive(self) -> Iterator[bool]:
+        """
+        Hold the run locks, yields whether they were acquired.
+        """
+        if not self._lock.acquire(blocking=False):
+            yield False
+            return
+
+        try:
+            with file_lock(self.lock_path) as acquired:
+                yield acquired
+        finally:
+            self._lock.release()
+
+    def run_once(self) -> bool:
+        """
+        Perform one run unless another one is in progress. Errors are
+        logged, the daemon keeps going.
+
+        :return: Whether the run took place.
+        """
+        with self.exclusive() as acquired:
+            if not acquired:
+                logger.warning("Another sync is still running, skipping this one")
+                return False
+
+            start = time.monotonic()
+            self.runs += 1
+            try:
+                self.run()
+            except Exception:
+                self.failures += 1
+                logger.exception(f"Sync {self.runs} failed")
+            else:
+                logger.info(
+                    f"Sync {self.runs} took {time.monotonic() - start:.1f}s,"
+                    f" {self.failures} failed so far"
+                )
+            return True
+
+    def _next_start(self, previous_start: float) -> float:
+        next_start = previous_start + self.interval
+        if self.jitter:
+            next_start += random.uniform(-self.jitter, self.jitter)
+        # Overran the interval, start now instead of catching up
+        return max(next_start, time.monotonic())
+
+    def run_forever(self):
+        """
+        Run now and then on the schedule until stopped.
+        """
+        self._install_signal_handlers()
+        logger.info(f"Syncing every {self.interval:.0f}s (jitter {self.jitter:.0f}s)")
+        try:
+            while not self.stopped:
+                start = time.monotonic()
+                self.run_once()
+
+                wait = self._next_start(start) - time.monotonic()
+                if wait > 0:
+                    logger.info(f"Next sync in {wait:.0f}s")
+                    self._stopped.wait(wait)
+        finally:
+            self._restore_signal_handlers()
+            logger.info(f"Daemon stopped after {self.runs} syncs")
@@ -0,0 +1 @@
+from journal.sync_journal import JournalState, SyncJournal
@@ -0,0 +1,150 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from typing import List, NamedTuple, Optional
+from playlist.models import Item
+from scraper.models import TrackData
+from utils.files import atomic_write
+
+logger = logging.getLogger("hardstyle_watcher.journal")
+
+
+class JournalState(NamedTuple):
+    """
+    What an unfinished run got done before it stopped.
+    """
+
+    started_at: float
+    # Scraped tracks, None when the run stopped while scraping
+    scraped: Optional[List[TrackData]]
+    # Resolved and enriched items, None when the run stopped before
+    resolved: Optional[List[Item]]
+
+
+class SyncJournal:
+    """
+    Write-ahead journal of a sync run, so a run that crashed is resumed
+    instead of started over.
+
+    The journal is a JSON lines file: one record per completed step (the
+    scraped tracks, the resolved items), one per applied mutation batch with
+    the snapshot it produced, and a final one when the run finished. Every
+    record is flushed to disk before the run moves on. A record cut short
+    by a crash is ignored.
+
+    A run that finds an unfinished journal younger than `max_age` resumes
+    it: steps that completed are taken from the journal, the playlist diff
+    is computed against the playlist as it is now, so batches that were
+    applied are not applied again. The planned diffs and applied batches
+    are not needed for that, they are kept as a record of what the run
+    changed.
+
+    :param path: Path of the journal file.
+    :param max_age: Seconds after which an unfinished run is not resumed,
+        its scrape would be outdated.
+    """
+
+    def __init__(self, path: str, max_age: float = 3600):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+    def _read(self) -> List[dict]:
+        if not os.path.exists(self.path):
+            return []
+
+        records = []
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # Cut short by a crash, nothing after it was written
+                    break
+        return records
+
+    def _append(self, record: dict):
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def begin(self) -> Optional[JournalState]:
+        """
+        Resume the unfinished run, or start a new one.
+
+        :return: State of the resumed run, None when a new run started.
+        """
+        records = self._read()
+        if (
+            records
+            and records[0]["step"] == "start"
+            and records[-1]["step"] != "done"
+            and time.time() - records[0]["at"] < self.max_age
+        ):
+            state = JournalState(records[0]["at"], None, None)
+            applied = 0
+            for record in records[1:]:
+                if record["step"] == "scraped":
+                    state = state._replace(
+                        scraped=[TrackData.from_row(row) for row in record["tracks"]]
+                    )
+                elif record["step"] == "resolved":
+                    state = state._replace(
+                        resolved=[Item.from_row(row) for row in record["items"]]
+                    )
+                elif record["step"] == "batch":
+                    applied += 1
+            logger.info(
+                f"Resuming the sync started at {time.ctime(state.started_at)}:"
+                f" scraped {state.scraped is not None},"
+                f" resolved {state.resolved is not None},"
+                f" {applied} batches applied"
+            )
+            return state
+
+        if records and records[-1]["step"] != "done":
+            logger.warning("Not resuming an unfinished sync that is too old")
+
+        with atomic_write(self.path) as f:
+            f.write(json.dumps({"step": "start", "at": time.time()}) + "\n")
+        return None
+
+    def record_scraped(self, tracks: List[TrackData]):
+        self._append({"step": "scraped", "tracks": [t.to_row() for t in tracks]})
+
+    def record_resolved(self, items: List[Item]):
+        self._append({"step": "resolved", "items": [i.to_row() for i in items]})
+
+    def record_planned(self, to_remove: List[Item], to_add: List[Item]):
+        self._append(
+            {
+                "step": "planned",
+                "remove": [item.id for item in to_remove],
+                "add": [item.id for item in to_add],
+            }
+        )
+
+    def record_batch(self, operation: str, items: List[Item], snapshot_id: str):
+        """
+        Record an applied mutation batch.
+
+        :param operation: "remove", "add" or "reorder".
+        :param items: Items of the batch.
+        :param snapshot_id: Playlist version the batch produced.
+        """
+        self._append(
+            {
+                "step": "batch",
+                "operation": operation,
+                "uris": [item.id for item in items],
+                "snapshot_id": snapshot_id,
+            }
+        )
+
+    def finish(self):
+        self._append({"step": "done", "at": time.time()})
@@ -32,9 +32,6 @@ class HardstyleDotComScavengerHardstyle:
         track_data = []
         web = requests.Session()
         for track in album_tracks:
-            track_object = TrackData()
-            track_object.genre = Genre.Hardstyle
-
             track_node = track.find_all("a", class_="linkTitle")
 
             track_detail_url = track_node[0].get("href")
@@ -57,8 +54,11 @@ class HardstyleDotComScavengerHardstyle:
 
             artist = self._extract_artist(track)
 
-            track_object.title = f"{title} {mix_type}" if mix_type else title
-            track_object.artist_name = artist
+            track_object = TrackData(
+                track_name=f"{title} {mix_type}" if mix_type else title,
+                artist_name=artist,
+                genre=Genre.Hardstyle,
+            )
 
             track_data.append(track_object)
 
@@ -1,77 +1,573 @@
+import argparse
 import logging
 import sys
 import os
 
-from scraper import HardstyleDotCom, ReleaseHardstyle
+from scraper import (
+    Backfill,
+    BaseScraper,
+    HardstyleDotCom,
+    MultiSourceScraper,
+    ReleaseHardstyle,
+    import_backfill,
+)
+from catalog import Catalog
+from daemon import SyncDaemon, file_lock
+from journal import SyncJournal
+from scraper.models import TrackData
+from scraper.seen_store import SeenStore
+from pipeline import SyncPipeline
 from playlist import Spotify
+from playlist.resolution_cache import ResolutionCache
+from playlist.track_index import TrackIndex
 from playlist.models import Item
 from datetime import datetime, timedelta
+from functools import partial
+from typing import List, Optional, Union
 from dotenv import load_dotenv
+from utils.cache import HttpCache, get_cache, set_cache
+from utils.http import get_client
+from utils.metrics import metrics
+from utils.retry import retry_policy
 
-current_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-
-logging.basicConfig(
-    level=logging.NOTSET,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(f"logs/hardstyle_watcher_{current_datetime}.log"),
-    ],
-)
 logger = logging.getLogger("hardstyle_watcher.main")
 load_dotenv()
 
 
-def sync():
-    logger.info("Starting sync")
+def setup_logging():
+    current_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
-    #
-    # 1. Init Scraper
-    # scraper = HardstyleDotCom(from_date=datetime.now() - timedelta(days=7))
-    scraper = ReleaseHardstyle(from_date=datetime.now() - timedelta(days=2))
+    # force, importing the playlist package already configured the root logger
+    logging.basicConfig(
+        level=logging.NOTSET,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        handlers=[
+            logging.StreamHandler(sys.stdout),
+            logging.FileHandler(f"logs/hardstyle_watcher_{current_datetime}.log"),
+        ],
+        force=True,
+    )
 
-    #
-    # 2. Fetch track list
-    track_list = scraper.fetch_tracks()
 
-    #
-    # 3. Init Playlist Service
-    client_id = os.getenv("SPOTIFY_CLIENT_ID")
-    client_secret = os.getenv("SPOTIFY_CLIENT_SECRET")
-    spotify = Spotify(
-        client_id=client_id,
-        client_secret=client_secret,
+# Scrapers by source name
+SCRAPERS = {scraper.SOURCE: scraper for scraper in (ReleaseHardstyle, HardstyleDotCom)}
+
+# Searched tracks released on Spotify before this are not added
+RESOLVE_WINDOW = timedelta(days=7)
+
+
+def _known_resolution(catalog: Catalog, track: TrackData) -> Optional[Item]:
+    # Linked by the scraped page, the release date is fetched in a batch
+    # with the others, see `_enrich_linked`
+    if track.spotify_uri:
+        # Scraped links carry the bare track id
+        if track.spotify_uri.startswith("spotify:"):
+            return Item(id=track.spotify_uri)
+        return Item(id=f"spotify:track:{track.spotify_uri}")
+
+    # Resolved by an earlier run
+    if catalog is not None:
+        return catalog.resolution(track)
+    return None
+
+
+def _record_resolution(
+    seen_store: SeenStore,
+    catalog: Catalog,
+    track: TrackData,
+    track_id: Optional[Item],
+    searched: bool,
+):
+    if searched and not track_id:
+        logger.warning(f"Track not found: {track}")
+    if not track.source_id:
+        return
+
+    # The catalog is the seen store, it keeps every track for the diff
+    if catalog is not None:
+        catalog.upsert_track(track, track_id)
+    elif searched and track_id and seen_store is not None:
+        seen_store.set_spotify_uri(
+            track.source, track.source_id, track_id.id, track_id.release_date
+        )
+
+
+def _forget_resolutions(
+    seen_store: SeenStore, catalog: Catalog, tracks: List[TrackData]
+):
+    # Resolutions of superseded records would bring their Spotify release
+    # back next to the one that replaced them
+    store = catalog or seen_store
+    if store is None:
+        return
+    for track in tracks:
+        if track.source_id:
+            store.set_spotify_uri(track.source, track.source_id, None)
+
+
+def _resolve_track(
+    spotify: Spotify, seen_store: SeenStore, catalog: Catalog, track: TrackData
+) -> Optional[Item]:
+    track_id = _known_resolution(catalog, track)
+    searched = track_id is None
+    if searched:
+        track_id = spotify.resolve_track(
+            track.title,
+            track.artist_name,
+            from_date=datetime.now() - RESOLVE_WINDOW,
+        )
+
+    _record_resolution(seen_store, catalog, track, track_id, searched)
+    return track_id
+
+
+def _resolve_tracks(
+    spotify: Spotify, seen_store: SeenStore, catalog: Catalog, tracks: List[TrackData]
+) -> List[Item]:
+    """
+    Resolve tracks in one batch: known resolutions first, the rest is
+    searched concurrently, see `SpotifyAPI.resolve_tracks`.
+
+    :return: The resolved items, in track order.
+    """
+    known = [_known_resolution(catalog, track) for track in tracks]
+    batch = spotify.resolve_tracks(
+        [track for track, track_id in zip(tracks, known) if track_id is None],
+        from_date=datetime.now() - RESOLVE_WINDOW,
+    )
+    if batch.failed:
+        logger.warning(f"Failed to resolve {len(batch.failed)} tracks")
+
+    searched = iter(batch.items)
+    track_ids = []
+    for track, track_id in zip(tracks, known):
+        if track_id is None:
+            track_id = next(searched)
+            _record_resolution(seen_store, catalog, track, track_id, True)
+        else:
+            _record_resolution(seen_store, catalog, track, track_id, False)
+
+        if track_id:
+            track_ids.append(track_id)
+    return track_ids
+
+
+def _enrich_linked(
+    spotify: Spotify, catalog: Catalog, track_list: List[Item]
+) -> List[Item]:
+    """
+    Fetch the release dates of tracks that came with a Spotify link and drop
+    the ones released before the resolve window, like searched tracks are.
+    """
+    linked = {item for item in track_list if not item.release_date}
+    if not linked:
+        return track_list
+
+    from_date = datetime.now() - RESOLVE_WINDOW
+    enriched = spotify.enrich_items(track_list)
+    too_old = [
+        item
+        for item in enriched
+        if item in linked
+        and item.effective_date() is not None
+        and item.effective_date() < from_date
+    ]
+    if too_old:
+        logger.info(
+            f"Dropping {len(too_old)} linked tracks released before {from_date}"
+        )
+
+    if catalog is not None:
+        catalog.set_release_dates(item for item in enriched if item in linked)
+        catalog.clear_resolutions(too_old)
+
+    too_old = set(too_old)
+    return [item for item in enriched if item not in too_old]
+
+
+def _open_seen_store() -> Optional[SeenStore]:
+    # Opt-in incremental mode, releases processed by earlier runs are
+    # taken from the store instead of being fetched again. The catalog is a
+    # seen store that also keeps the playlist, the playlist diff is then
+    # computed from indexed queries
+    seen_store_path = os.getenv("SEEN_STORE_PATH")
+    catalog_path = os.getenv("CATALOG_PATH")
+    if catalog_path:
+        if seen_store_path and seen_store_path != catalog_path:
+            logger.warning(
+                f"Ignoring SEEN_STORE_PATH, the catalog {catalog_path} is the"
+                " seen store. Point CATALOG_PATH at the seen store to keep it."
+            )
+        return Catalog(catalog_path)
+    return SeenStore(seen_store_path) if seen_store_path else None
+
+
+def _close(*stores):
+    for store in stores:
+        if store is not None:
+            store.close()
+
+
+def _build_spotify(keep_playlist: bool = False) -> Spotify:
+    resolution_cache_path = os.getenv("RESOLUTION_CACHE_PATH")
+    return Spotify(
+        client_id=os.getenv("SPOTIFY_CLIENT_ID"),
+        client_secret=os.getenv("SPOTIFY_CLIENT_SECRET"),
         redirect_uri="http://localhost:8080",
         playlist_id=os.getenv("SPOTIFY_PLAYLIST_ID"),
+        resolution_cache=(
+            ResolutionCache(resolution_cache_path) if resolution_cache_path else None
+        ),
+        token_cache_path=os.getenv("SPOTIFY_TOKEN_CACHE_PATH"),
+        # Filled from the playlist read and search results, persisted
+        # between runs when a path is configured
+        track_index=TrackIndex(os.getenv("TRACK_INDEX_PATH")),
+        keep_playlist=keep_playlist,
+        max_in_flight=int(os.getenv("SPOTIFY_MAX_IN_FLIGHT", "8")),
+        # Opt-in, a playlist that did not change since the last run is not
+        # read again
+        playlist_cache_path=os.getenv("SPOTIFY_PLAYLIST_CACHE_PATH") or None,
     )
 
+
+def sync(
+    scraper: Union[BaseScraper, MultiSourceScraper] = None,
+    spotify: Spotify = None,
+    seen_store: SeenStore = None,
+    catalog: Catalog = None,
+):
+    """
+    Scrape new releases, resolve them on Spotify and sync the playlist.
+
+    :param scraper: Scraper to use instead of the one configured here.
+    :param spotify: Playlist service to use instead of one built from the
+        environment.
+    :param seen_store: Seen store to use instead of one opened from the
+        environment.
+    :param catalog: Catalog to use instead of one opened from the
+        environment. It is the seen store as well.
+    """
+    # Stores opened here are closed here, passed ones belong to the caller
+    opened = []
+    if seen_store is None and catalog is None:
+        seen_store = _open_seen_store()
+        opened.append(seen_store)
+    if spotify is None:
+        spotify = _build_spotify()
+        opened += [spotify.resolution_cache, spotify.track_index]
+
+    try:
+        _sync(scraper, spotify, seen_store, catalog)
+    finally:
+        _close(*opened)
+
+
+def _sync(
+    scraper: Optional[Union[BaseScraper, MultiSourceScraper]],
+    spotify: Spotify,
+    seen_store: Optional[SeenStore],
+    catalog: Optional[Catalog],
+):
+    logger.info("Starting sync")
+
+    # Metrics are recorded when a report is requested
+    metrics_json_path = os.getenv("METRICS_JSON_PATH")
+    metrics_prom_path = os.getenv("METRICS_PROM_PATH")
+    metrics.enabled = bool(metrics_json_path or metrics_prom_path)
+    metrics.reset()
+
+    # Retries of all hosts share one time budget per run
+    retry_policy.start_run(float(os.getenv("SYNC_RETRY_DEADLINE", "300")))
+
+    # Opt-in persistent response cache for the scraped pages
+    cache_path = os.getenv("HTTP_CACHE_PATH")
+    if cache_path and get_cache() is None:
+        set_cache(
+            HttpCache(
+                cache_path,
+                ttls=ReleaseHardstyle.CACHE_TTLS + HardstyleDotCom.CACHE_TTLS,
+                max_bytes=int(os.getenv("HTTP_CACHE_MAX_MB", "256")) * 1024 * 1024,
+            )
+        )
+
+    if seen_store is None:
+        seen_store = catalog
+    if catalog is None and isinstance(seen_store, Catalog):
+        catalog = seen_store
+
     #
-    # 4. Fetch playlist
-    playlist_data = spotify.get_playlist()
+    # 1. Init Scrapers, several sources are scraped concurrently
+    if scraper is None:
+        sources = os.getenv("SCRAPER_SOURCES", ReleaseHardstyle.SOURCE).split(",")
+        scrapers = [
+            SCRAPERS[source](
+                from_date=datetime.now() - SCRAPERS[source].SYNC_WINDOW,
+                seen_store=seen_store,
+            )
+            for source in (source.strip() for source in sources)
+        ]
+        scraper = scrapers[0] if len(scrapers) == 1 else MultiSourceScraper(scrapers)
 
     #
-    # 5. For each fetched track, retrieve the Spotify URI
-    new_track_list = []
-    for track in track_list:
-        if track.spotify_uri:
-            new_track_list.append(Item(id=track.spotify_uri))
-            continue
-        else:
-            track_id = spotify.get_track(
-                f"track:{track.title}" + " " + f"artist:{track.artist_name}",
-                from_date=datetime.now() - timedelta(days=7),
+    # 2. Init Playlist Service
+    # The catalog keeps the playlist, it is read again only when it changed
+    if catalog is not None and spotify.playlist_store is not catalog:
+        spotify.use_playlist_store(catalog)
+
+    # Opt-in write-ahead journal, a run that stopped halfway is resumed
+    # from its last completed step
+    journal_path = os.getenv("SYNC_JOURNAL_PATH")
+    journal = (
+        SyncJournal(
+            journal_path,
+            max_age=float(os.getenv("SYNC_JOURNAL_MAX_AGE_MINUTES", "60")) * 60,
+        )
+        if journal_path
+        else None
+    )
+    resumed = journal.begin() if journal is not None else None
+
+    if resumed is not None and resumed.resolved is not None:
+        #
+        # 3-6. Scraped, resolved and enriched by the resumed run
+        with metrics.span("playlist_read"):
+            playlist_data = spotify.get_playlist()
+        new_track_list = resumed.resolved
+    else:
+        if os.getenv("SYNC_MODE") == "pipeline" and (
+            resumed is None or resumed.scraped is None
+        ):
+            #
+            # 3-5. Stream scraped tracks into the resolvers while
+            #   the playlist is read concurrently
+            pipeline = SyncPipeline(
+                # Merged sources also report the records they superseded
+                source=getattr(scraper, "iter_releases", scraper.iter_tracks),
+                resolve=partial(_resolve_track, spotify, seen_store, catalog),
+                read_playlist=spotify.get_playlist,
+                resolve_concurrency=int(os.getenv("SYNC_RESOLVE_CONCURRENCY", "4")),
             )
-            if track_id:
-                new_track_list.append(track_id)
+            with metrics.span("pipeline"):
+                playlist_data, new_track_list = pipeline.run()
+            _forget_resolutions(seen_store, catalog, pipeline.superseded)
+        else:
+            #
+            # 3. Fetch track list
+            if resumed is not None and resumed.scraped is not None:
+                track_list = resumed.scraped
             else:
-                logger.warning(f"Track not found: {track}")
+                with metrics.span("scrape"):
+                    track_list = scraper.fetch_tracks()
+                if journal is not None:
+                    journal.record_scraped(track_list)
+
+            #
+            # 4. Fetch playlist
+            with metrics.span("playlist_read"):
+                playlist_data = spotify.get_playlist()
+
+            #
+            # 5. Retrieve the Spotify URIs, searches run concurrently
+            with metrics.span("resolve"):
+                new_track_list = _resolve_tracks(
+                    spotify, seen_store, catalog, track_list
+                )
+
+        #
+        # 6. Fetch the missing release dates in batches
+        with metrics.span("enrich"):
+            new_track_list = _enrich_linked(spotify, catalog, new_track_list)
+        if journal is not None:
+            journal.record_resolved(new_track_list)
 
     #
-    # 6. Compare the fetched tracks with the playlist
-    #   and remove tracks that are older than from_date
+    # 7. Compare the fetched tracks with the playlist
+    #   and remove tracks that aged out of the retention window
     #   and add new tracks
-    spotify.sync_playlist(playlist_data, new_track_list)
+    retention_days = os.getenv("PLAYLIST_RETENTION_DAYS")
+    retention_cutoff = (
+        datetime.now() - timedelta(days=int(retention_days)) if retention_days else None
+    )
+    # Opt-in release order, newest first
+    ordered = os.getenv("PLAYLIST_ORDER") == "newest_first"
+    windows = {
+        source.SOURCE: source.from_date
+        for source in getattr(scraper, "scrapers", [scraper])
+    }
+    # Releases are dated by day, so are the windows
+    fingerprint = spotify.sync_fingerprint(
+        new_track_list,
+        ordered,
+        catalog is not None,
+        retention_cutoff.date() if retention_cutoff else None,
+        sorted((source, from_date.date()) for source, from_date in windows.items()),
+    )
+    # The diff is computed against the playlist as it is now, batches a
+    # resumed run applied already are not part of it
+    spotify.journal = journal
+    try:
+        with metrics.span("playlist_write"):
+            if spotify.is_synced(fingerprint):
+                logger.info("Playlist and releases unchanged since the last sync")
+                complete = True
+            elif catalog is not None:
+                complete = spotify.sync_playlist_from_catalog(
+                    catalog, playlist_data, windows, retention_cutoff, ordered=ordered
+                )
+            else:
+                complete = spotify.sync_playlist(
+                    playlist_data, new_track_list, retention_cutoff, ordered=ordered
+                )
+    finally:
+        spotify.journal = None
+
+    # A write with failed batches is finished by the next run
+    if complete:
+        spotify.mark_synced(fingerprint)
+        if journal is not None:
+            journal.finish()
+    else:
+        logger.warning("Not all playlist changes were applied")
+
+    logger.info(f"HTTP connection reuse per host: {get_client().stats()}")
+    if get_cache() is not None:
+        logger.info(f"HTTP cache: {get_cache().stats()}")
+    if spotify.resolution_cache is not None:
+        logger.info(f"Resolution cache: {spotify.resolution_cache.stats()}")
+    if spotify.track_index is not None:
+        logger.info(f"Track index: {spotify.track_index.stats()}")
+    if catalog is not None:
+        logger.info(f"Catalog: {catalog.stats()}")
+
+    if metrics_json_path:
+        metrics.write_json(metrics_json_path)
+    if metrics_prom_path:
+        metrics.write_prometheus(metrics_prom_path)
+
+
+def backfill(
+    source: str, from_date: datetime, output_path: str, parallel_shards: int = 4
+) -> int:
+    """
+    Scrape all releases of a source since `from_date` into a JSON lines
+    file. An interrupted backfill resumes when run again with the same
+    arguments.
+
+    :param source: Name of the scraper source, see `SCRAPERS`.
+    :param from_date: Start of the window.
+    :param output_path: JSON lines file the tracks are written to.
+    :param parallel_shards: Number of shards scraped at the same time.
+    :return: Number of tracks written.
+    """
+    seen_store = _open_seen_store()
+    try:
+        scraper = SCRAPERS[source](from_date=from_date, seen_store=seen_store)
+        return Backfill(scraper, output_path, parallel_shards=parallel_shards).run()
+    finally:
+        _close(seen_store)
+
+
+def import_backfill_file(input_path: str) -> int:
+    """
+    Import a backfill output file into the configured catalog or seen store.
+
+    :param input_path: JSON lines file written by `backfill`.
+    :return: Number of tracks imported.
+    """
+    seen_store = _open_seen_store()
+    if seen_store is None:
+        raise ValueError("Set CATALOG_PATH or SEEN_STORE_PATH to import a backfill")
+    try:
+        return import_backfill(input_path, seen_store)
+    finally:
+        _close(seen_store)
+
+
+def daemon(interval: float, jitter: float = 0.0, lock_path: str = None):
+    """
+    Sync on a schedule until SIGTERM or SIGINT. The Spotify client with its
+    tokens, connections, caches and last read playlist and the seen store
+    live as long as the process.
+
+    :param interval: Seconds between the starts of two syncs.
+    :param jitter: Maximum number of seconds a start is moved.
+    :param lock_path: Lock file guarding against overlapping syncs of other
+        processes.
+    """
+    seen_store = _open_seen_store()
+    spotify = _build_spotify(keep_playlist=True)
+
+    try:
+        SyncDaemon(
+            partial(sync, spotify=spotify, seen_store=seen_store),
+            interval=interval,
+            jitter=jitter,
+            lock_path=lock_path,
+        ).run_forever()
+    finally:
+        _close(seen_store, spotify.resolution_cache, spotify.track_index)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Hardstyle playlist sync")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("sync", help="Scrape new releases and sync the playlist")
+
+    backfill_parser = commands.add_parser(
+        "backfill", help="Scrape a long window of releases into a file"
+    )
+    backfill_parser.add_argument("--source", required=True, choices=SCRAPERS)
+    backfill_parser.add_argument(
+        "--from",
+        dest="from_date",
+        required=True,
+        type=datetime.fromisoformat,
+        help="Start of the window, e.g. 2024-01-01",
+    )
+    backfill_parser.add_argument("--output", required=True)
+    backfill_parser.add_argument("--parallel-shards", type=int, default=4)
+
+    import_parser = commands.add_parser(
+        "import-backfill", help="Import a backfill file into the catalog"
+    )
+    import_parser.add_argument("--input", required=True)
+
+    daemon_parser = commands.add_parser(
+        "daemon", help="Keep running and sync on a schedule"
+    )
+    daemon_parser.add_argument(
+        "--interval",
+        type=float,
+        default=float(os.getenv("DAEMON_INTERVAL_MINUTES", "60")),
+        help="Minutes between syncs",
+    )
+    daemon_parser.add_argument(
+        "--jitter",
+        type=float,
+        default=float(os.getenv("DAEMON_JITTER_MINUTES", "5")),
+        help="Maximum number of minutes a sync is moved",
+    )
+    daemon_parser.add_argument(
+        "--lock-file",
+        default=os.getenv("SYNC_LOCK_PATH") or None,
+        help="Lock file shared with other processes syncing the playlist",
+    )
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    sync()
+    args = parse_args()
+    setup_logging()
+    if args.command == "backfill":
+        backfill(args.source, args.from_date, args.output, args.parallel_shards)
+    elif args.command == "import-backfill":
+        import_backfill_file(args.input)
+    elif args.command == "daemon":
+        daemon(args.interval * 60, args.jitter * 60, args.lock_file)
+    else:
+        # Cron runs skip when a daemon or an earlier run is still syncing
+        with file_lock(os.getenv("SYNC_LOCK_PATH") or None) as acquired:
+            if acquired:
+                sync()
+            else:
+                logger.warning("Another sync is still running, skipping this one")
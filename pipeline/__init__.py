@@ -0,0 +1 @@
+from pipeline.sync_pipeline import SyncPipeline
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import time
+
+from typing import Callable, Iterable, List, Optional, Tuple
+from playlist.models import Item
+from scraper.models import TrackData
+from utils.metrics import metrics
+
+logger = logging.getLogger("hardstyle_watcher.pipeline")
+
+
+class StageStats:
+    """
+    Timing of a pipeline stage: when it started and finished, how long its
+    workers were busy and how many items it handled.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def wall(self) -> float:
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.items} items, {self.wall:.2f}s wall, {self.busy:.2f}s busy"
+
+
+class SyncPipeline:
+    """
+    Streaming scrape -> resolve pipeline with a concurrent playlist read.
+
+    Scraped tracks flow through a bounded queue into `resolve_concurrency`
+    resolver workers as soon as they are parsed, while the playlist is read
+    at the same time. A full queue blocks the scraper (backpressure), so the
+    end-to-end time approaches the slowest stage instead of the sum.
+
+    :param source: Function returning an iterator of scraped tracks, e.g.
+        `scraper.iter_tracks`, or of (track, superseded track) pairs, see
+        `MultiSourceScraper.iter_releases`. The item a superseded track
+        resolved to is dropped.
+    :param resolve: Function turning a track into a playlist item, None when
+        it could not be resolved. Called from worker threads.
+    :param read_playlist: Function returning the current playlist items.
+    :param resolve_concurrency: Number of resolver workers.
+    :param queue_size: Capacity of the queue between scraper and resolvers.
+    """
+
+    def __init__(
+        self,
+        source: Callable[[], Iterable[TrackData]],
+        resolve: Callable[[TrackData], Optional[Item]],
+        read_playlist: Callable[[], List[Item]],
+        resolve_concurrency: int = 4,
+        queue_size: int = 50,
+    ):
+        self.source = source
+        self.resolve = resolve
+        self.read_playlist = read_playlist
+        self.resolve_concurrency = resolve_concurrency
+        self.queue_size = queue_size
+        self.stats = {
+            name: StageStats(name) for name in ("scrape", "resolve", "playlist")
+        }
+        # Tracks another source's record of the release replaced
+        self.superseded: List[TrackData] = []
+        self._dropped = set()
+
+    async def _scrape(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        stats = self.stats["scrape"]
+
+        def produce():
+            # Queue index of each track
+            seen = {}
+            tracks = iter(self.source())
+            while True:
+                start = time.perf_counter()
+                entry = next(tracks, None)
+                stats.busy += time.perf_counter() - start
+                if entry is None:
+                    break
+
+                track, superseded = entry if isinstance(entry, tuple) else (entry, None)
+                if superseded is not None and superseded in seen:
+                    # Its item is dropped once resolved, it may be in flight
+                    self.superseded.append(superseded)
+                    self._dropped.add(seen.pop(superseded))
+                # Scrapers may emit a track more than once
+                elif track in seen:
+                    continue
+                seen[track] = stats.items
+
+                # Blocks while the queue is full
+                asyncio.run_coroutine_threadsafe(
+                    queue.put((stats.items, track)), loop
+                ).result()
+                stats.items += 1
+
+        stats.started_at = time.perf_counter()
+        try:
+            await asyncio.to_thread(produce)
+        finally:
+            stats.finished_at = time.perf_counter()
+            for _ in range(self.resolve_concurrency):
+                await queue.put(None)
+
+    async def _resolve_worker(self, queue: asyncio.Queue, results: list):
+        stats = self.stats["resolve"]
+        while True:
+            entry = await queue.get()
+            if entry is None:
+                break
+
+            index, track = entry
+            start = time.perf_counter()
+            try:
+                item = await asyncio.to_thread(self.resolve, track)
+            except Exception as e:
+                logger.warning(f"Failed to resolve {track.title}: {e}")
+                item = None
+            stats.busy += time.perf_counter() - start
+            stats.items += 1
+
+            if item is not None:
+                results.append((index, item))
+
+    async def _resolve(self, queue: asyncio.Queue, results: list):
+        stats = self.stats["resolve"]
+        stats.started_at = time.perf_counter()
+        await asyncio.gather(
+            *(
+                self._resolve_worker(queue, results)
+                for _ in range(self.resolve_concurrency)
+            )
+        )
+        stats.finished_at = time.perf_counter()
+
+    async def _read_playlist(self) -> List[Item]:
+        stats = self.stats["playlist"]
+        stats.started_at = time.perf_counter()
+        playlist_data = await asyncio.to_thread(self.read_playlist)
+        stats.finished_at = time.perf_counter()
+        stats.busy = stats.wall
+        stats.items = len(playlist_data)
+        return playlist_data
+
+    async def run_async(self) -> Tuple[List[Item], List[Item]]:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        results = []
+
+        start = time.perf_counter()
+        _, _, playlist_data = await asyncio.gather(
+            self._scrape(queue),
+            self._resolve(queue, results),
+            self._read_playlist(),
+        )
+
+        for stats in self.stats.values():
+            logger.info(f"Stage {stats}")
+            metrics.add_span(f"pipeline_{stats.name}", stats.wall)
+        logger.info(f"Pipeline finished in {time.perf_counter() - start:.2f}s")
+
+        # Keep the scrape order
+        new_track_list = [
+            item
+            for index, item in sorted(results, key=lambda r: r[0])
+            if index not in self._dropped
+        ]
+        if self._dropped:
+            logger.info(f"Dropped {len(self._dropped)} superseded tracks")
+        return playlist_data, new_track_list
+
+    def run(self) -> Tuple[List[Item], List[Item]]:
+        """
+        Run the pipeline.
+
+        :return: The current playlist items and the resolved scraped tracks.
+        """
+        return asyncio.run(self.run_async())
@@ -18,11 +18,11 @@ class BasePlaylistService(ABC):
         raise NotImplementedError
 
     @abstractmethod
-    def remove_playlist_items(self):
+    def remove_playlist_items(self, tracks: List[Item]):
         raise NotImplementedError
 
     @abstractmethod
-    def add_playlist_items(self):
+    def add_playlist_items(self, tracks: List[Item]):
         raise NotImplementedError
 
     @abstractmethod
@@ -1 +1,3 @@
 from playlist.models.item import Item
+from playlist.models.mutation import MutationResult
+from playlist.models.resolution import BatchResolution
@@ -1,20 +1,80 @@
 from datetime import datetime
-from enum import Enum
+from typing import Optional, Tuple
 
 
 class Item:
+    """
+    Immutable playlist item, identified by its Spotify URI.
+
+    :param id: Spotify URI of the track.
+    :param release_date: Release date as returned by Spotify, e.g. "2024-05-01".
+    :param added_at: When the track was added to the playlist, e.g.
+        "2024-05-02T10:00:00Z".
+    """
+
+    __slots__ = ("id", "release_date", "added_at")
+
     id: str
-    release_date: datetime
+    release_date: Optional[str]
+    added_at: Optional[str]
 
-    def __init__(self, id: str, release_date: str = None):
-        self.id = id
-        self.release_date = None
+    def __init__(self, id: str, release_date: str = None, added_at: str = None):
+        object.__setattr__(self, "id", id)
+        object.__setattr__(self, "release_date", release_date)
+        object.__setattr__(self, "added_at", added_at)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Item is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Item is immutable")
 
     def __hash__(self) -> int:
         return hash(self.id)
 
     def __eq__(self, other) -> bool:
+        if not isinstance(other, Item):
+            return NotImplemented
         return self.id == other.id
 
     def __str__(self) -> str:
         return self.id
+
+    def __repr__(self) -> str:
+        return (
+            f"Item(id={self.id!r}, release_date={self.release_date!r},"
+            f" added_at={self.added_at!r})"
+        )
+
+    def __reduce__(self):
+        return Item.from_row, (self.to_row(),)
+
+    def to_row(self) -> Tuple[str, Optional[str], Optional[str]]:
+        return self.id, self.release_date, self.added_at
+
+    def replace(self, **changes) -> "Item":
+        """
+        Copy of the item with the given fields changed.
+        """
+        return Item(**{**dict(zip(self.__slots__, self.to_row())), **changes})
+
+    def effective_date(self) -> Optional[datetime]:
+        """
+        Release date of the item, falling back to when it was added. Spotify
+        gives release dates with day, month or year precision.
+
+        :return: The date, None if the item has neither.
+        """
+        for value in (self.release_date, self.added_at):
+            if not value:
+                continue
+            for date_format in ("%Y-%m-%d", "%Y-%m", "%Y"):
+                try:
+                    return datetime.strptime(value[:10], date_format)
+                except ValueError:
+                    continue
+        return None
+
+    @classmethod
+    def from_row(cls, row) -> "Item":
+        return cls(*row)
@@ -0,0 +1,10 @@
+from typing import List, NamedTuple, Optional
+from playlist.models.item import Item
+
+
+class MutationResult(NamedTuple):
+    # snapshot_id of the playlist after the last applied batch
+    snapshot_id: Optional[str]
+    applied: int
+    # Batches that still failed after retrying
+    failed: List[List[Item]]
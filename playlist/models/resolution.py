@@ -0,0 +1,10 @@
+from typing import List, NamedTuple, Optional, Tuple
+from playlist.models.item import Item
+from scraper.models import TrackData
+
+
+class BatchResolution(NamedTuple):
+    # Item per input track, None when not found, too old or failed
+    items: List[Optional[Item]]
+    # Tracks whose resolution raised, with the error
+    failed: List[Tuple[TrackData, Exception]]
@@ -0,0 +1,187 @@
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Tuple
+from playlist.models import Item
+
+
+class Move(NamedTuple):
+    """
+    Reorder of a contiguous range, in the terms of the reorder endpoint:
+    positions refer to the playlist before the move.
+    """
+
+    range_start: int
+    range_length: int
+    insert_before: int
+    # The moved items, for logging and failure reports
+    items: List[Item]
+
+
+class Insert(NamedTuple):
+    position: int
+    items: List[Item]
+
+
+class _Extra:
+    """
+    Stand-in for an item that is left where it is: duplicates and items
+    that are not part of the target, e.g. because their removal failed.
+    """
+
+    __slots__ = ("item",)
+
+    def __init__(self, item: Item):
+        self.item = item
+
+
+def release_order(items: List[Item], positions: Dict[Item, int]) -> List[Item]:
+    """
+    Order items newest release first. Items without a date go last, items
+    released on the same day keep their playlist order and new items go
+    before them.
+
+    :param items: Items to order.
+    :param positions: Current playlist position of the items in the playlist.
+    :return: The ordered items.
+    """
+
+    def _key(item: Item):
+        date = item.effective_date()
+        return (
+            date is None,
+            -(date or datetime.min).toordinal(),
+            positions.get(item, -1),
+        )
+
+    return sorted(items, key=_key)
+
+
+def longest_increasing_subsequence(values: List[int]) -> List[int]:
+    """
+    Longest strictly increasing subsequence, O(n log n).
+
+    :param values: Distinct values.
+    :return: Indices of the subsequence in `values`, ascending.
+    """
+    # tails[k]: index of the smallest value ending an increasing
+    # subsequence of length k + 1
+    tails: List[int] = []
+    tail_values: List[int] = []
+    previous = [-1] * len(values)
+
+    for i, value in enumerate(values):
+        k = bisect_left(tail_values, value)
+        if k > 0:
+            previous[i] = tails[k - 1]
+        if k == len(tails):
+            tails.append(i)
+            tail_values.append(value)
+        else:
+            tails[k] = i
+            tail_values[k] = value
+
+    indices = []
+    i = tails[-1] if tails else -1
+    while i != -1:
+        indices.append(i)
+        i = previous[i]
+    return indices[::-1]
+
+
+def plan_reorder(
+    current: List[Item], target: List[Item]
+) -> Tuple[List[Move], List[Insert], List[Item]]:
+    """
+    Plan the reorders and inserts turning the playlist into `target`.
+
+    Items of the playlist that are in the longest run already in target
+    order stay where they are, the others are moved right behind their
+    predecessor in the target, consecutive ones as a single range. New items
+    are then inserted behind their predecessor, consecutive ones in one
+    insert. Items in `current` but not in `target` are left in place.
+
+    Moves must be applied in order, then the inserts in order.
+
+    :param current: Playlist items in playlist order.
+    :param target: Desired playlist items in the desired order.
+    :return: Moves, inserts and the resulting playlist.
+    """
+    # Only the first occurrence of an item is ordered
+    sim = []
+    position = {}
+    for item in current:
+        if item in position:
+            sim.append(_Extra(item))
+        else:
+            position[item] = len(sim)
+            sim.append(item)
+
+    target = list(dict.fromkeys(target))
+    rank = {item: i for i, item in enumerate(target)}
+    for i, item in enumerate(sim):
+        if isinstance(item, Item) and item not in rank:
+            del position[item]
+            sim[i] = _Extra(item)
+
+    in_current_order = sorted(position, key=position.__getitem__)
+    stay = {
+        in_current_order[i]
+        for i in longest_increasing_subsequence(
+            [rank[item] for item in in_current_order]
+        )
+    }
+
+    # 1. Move the items out of order behind their predecessor
+    kept = [item for item in target if item in position]
+    moves = []
+    previous = None
+    i = 0
+    while i < len(kept):
+        item = kept[i]
+        j = i + 1
+        if item not in stay:
+            # Extend the range with the next items that follow it
+            start = sim.index(item)
+            while (
+                j < len(kept)
+                and kept[j] not in stay
+                and start + j - i < len(sim)
+                and sim[start + j - i] == kept[j]
+            ):
+                j += 1
+
+            length = j - i
+            after = sim.index(previous) + 1 if previous is not None else 0
+            # Already behind its predecessor
+            if not start <= after <= start + length:
+                block = sim[start : start + length]
+                moves.append(Move(start, length, after, block))
+                del sim[start : start + length]
+                if after > start:
+                    after -= length
+                sim[after:after] = block
+
+        previous = kept[j - 1]
+        i = j
+
+    # 2. Insert the new items behind their predecessor
+    inserts = []
+    previous = None
+    i = 0
+    while i < len(target):
+        j = i + 1
+        if target[i] not in position:
+            while j < len(target) and target[j] not in position:
+                j += 1
+            after = sim.index(previous) + 1 if previous is not None else 0
+            inserts.append(Insert(after, target[i:j]))
+            sim[after:after] = target[i:j]
+
+        previous = target[j - 1]
+        i = j
+
+    return (
+        moves,
+        inserts,
+        [item.item if isinstance(item, _Extra) else item for item in sim],
+    )
@@ -0,0 +1,144 @@
+import logging
+import sqlite3
+import threading
+import time
+
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger("hardstyle_watcher.playlist.resolution_cache")
+
+
+class CachedResolution(NamedTuple):
+    # None for a cached "not found"
+    uri: Optional[str]
+    release_date: Optional[str]
+
+
+class ResolutionCache:
+    """
+    Persistent cache of Spotify search results keyed by a normalized
+    (title, artist) query.
+
+    Found tracks and "not found" answers get separate TTLs, so tracks Spotify
+    does not have yet are searched again on a slower schedule. Once more than
+    `max_entries` are stored the least recently used ones are evicted. Hits
+    only note their access time in memory, it is written with the next
+    `put` or on `close`.
+
+    :param path: Path of the SQLite database.
+    :param positive_ttl: Seconds a found track is reused.
+    :param negative_ttl: Seconds a "not found" answer is reused.
+    :param max_entries: Maximum number of stored queries.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        positive_ttl: float = 90 * 24 * 3600,
+        negative_ttl: float = 24 * 3600,
+        max_entries: int = 50000,
+    ):
+        self.path = path
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._stats = {
+            "hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "stored": 0,
+            "evicted": 0,
+        }
+        # Access times of the hits since the last write, by query
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS resolutions (
+                query TEXT PRIMARY KEY,
+                uri TEXT,
+                release_date TEXT,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS resolutions_accessed_at
+                ON resolutions (accessed_at);
+            """)
+
+    def get(self, query: str) -> Optional[CachedResolution]:
+        """
+        Look up a query.
+
+        :param query: Normalized query, see `utils.normalize.normalize_query`.
+        :return: The cached resolution, None when the query is not cached or
+            expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT uri, release_date FROM resolutions"
+                " WHERE query = ? AND expires_at > ?",
+                (query, now),
+            ).fetchone()
+
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+
+            self._stats["hits" if row[0] else "negative_hits"] += 1
+            self._touched[query] = now
+
+        return CachedResolution(*row)
+
+    def put(self, query: str, uri: Optional[str], release_date: Optional[str] = None):
+        """
+        Store the result of a search.
+
+        :param query: Normalized query.
+        :param uri: Spotify URI of the match, None if nothing was found.
+        :param release_date: Release date of the match as returned by Spotify.
+        """
+        now = time.time()
+        ttl = self.positive_ttl if uri else self.negative_ttl
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO resolutions VALUES (?, ?, ?, ?, ?)",
+                (query, uri, release_date, now + ttl, now),
+            )
+            self._stats["stored"] += 1
+            self._touched.pop(query, None)
+            self._write_touched()
+            self._evict()
+            self._db.commit()
+
+    def _write_touched(self):
+        if not self._touched:
+            return
+        self._db.executemany(
+            "UPDATE resolutions SET accessed_at = ? WHERE query = ?",
+            ((accessed_at, query) for query, accessed_at in self._touched.items()),
+        )
+        self._touched = {}
+
+    def _evict(self):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM resolutions").fetchone()
+        if count <= self.max_entries:
+            return
+
+        excess = count - self.max_entries
+        self._db.execute(
+            "DELETE FROM resolutions WHERE query IN"
+            " (SELECT query FROM resolutions ORDER BY accessed_at LIMIT ?)",
+            (excess,),
+        )
+        self._stats["evicted"] += excess
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self):
+        with self._lock:
+            self._write_touched()
+            self._db.commit()
+            self._db.close()
@@ -1,14 +1,36 @@
 import webbrowser
 import requests
 import base64
+import hashlib
+import json
 import os
 import logging
+import time
 
 from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+from contextlib import closing, nullcontext
 from playlist import BasePlaylistService
+from playlist.resolution_cache import CachedResolution, ResolutionCache
+from playlist.token_manager import TokenManager
+from playlist.track_index import TrackIndex, match_score
+from scraper.models import TrackData
 from urllib.parse import urlencode
 from dotenv import load_dotenv
-from playlist.models import Item
+from playlist.models import BatchResolution, Item, MutationResult
+from playlist.ordering import Move, plan_reorder, release_order
+from utils.concurrency import map_ordered
+from utils.files import atomic_write
+from utils.http import HttpClient, get_client
+from utils.metrics import metrics
+from utils.normalize import normalize_query
+from utils.rate_limit import AdaptiveConcurrency
+from utils.retry import circuit_breaker, is_failure_status
+from utils.utils import retry_with_backoff
+
+if TYPE_CHECKING:
+    from catalog import Catalog
+    from journal import SyncJournal
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger("hardstyle_watcher.playlist.spotifyapi")
@@ -17,12 +39,48 @@ load_dotenv()
 
 class SpotifyAPI(BasePlaylistService):
 
+    # Maximum page size of the playlist items endpoint
+    PLAYLIST_PAGE_SIZE = 100
+    # Maximum number of items per add/remove request
+    MUTATION_BATCH_SIZE = 100
+    # Metric names of the playlist mutations
+    MUTATION_ENDPOINTS = {
+        "DELETE": "playlist_remove",
+        "POST": "playlist_add",
+        "PUT": "playlist_reorder",
+    }
+    # Maximum number of ids per several tracks request
+    TRACKS_BATCH_SIZE = 50
+    # Name and artists feed the track index
+    PLAYLIST_ITEM_FIELDS = (
+        "items(added_at,track(name,artists(name),album(release_date),uri))"
+    )
+    # Minimum score of a search result, see `match_score`
+    SEARCH_MIN_SCORE = 0.4
+
+    API_URL = "https://api.spotify.com/v1"
+    ACCOUNTS_URL = "https://accounts.spotify.com"
+
     client_id: str
     client_secret: str
     redirect_uri: str
-    _access_token: str
+    api_url: str
+    accounts_url: str
+    _tokens: TokenManager
     _refresh_token: str
     _authorization_code: str
+    _http: HttpClient
+    resolution_cache: ResolutionCache
+    track_index: TrackIndex
+    keep_playlist: bool
+    playlist_cache_path: str
+    # Fingerprint of the last applied sync and the snapshot it left
+    _applied: Optional[Tuple[str, str]]
+    _in_flight: AdaptiveConcurrency
+    # Set for the write phase of a journaled sync
+    journal: Optional["SyncJournal"]
+    # Last read playlist, (snapshot_id, items)
+    _playlist: Optional[Tuple[str, List[Item]]]
 
     def __init__(
         self,
@@ -31,18 +89,45 @@ class SpotifyAPI(BasePlaylistService):
         authorization_code: str = None,
         redirect_uri: str = None,
         playlist_id: str = None,
+        http: HttpClient = None,
+        resolution_cache: ResolutionCache = None,
+        token_cache_path: str = None,
+        api_url: str = None,
+        accounts_url: str = None,
+        track_index: TrackIndex = None,
+        keep_playlist: bool = False,
+        max_in_flight: int = 8,
+        playlist_cache_path: str = None,
+        playlist_store: "Catalog" = None,
     ):
         super().__init__(playlist_id)
+        self.api_url = api_url or self.API_URL
+        self.accounts_url = accounts_url or self.ACCOUNTS_URL
+        self._http = http or get_client()
+        self.resolution_cache = resolution_cache
+        self.track_index = track_index
+        # Long-running processes keep the playlist between reads, with a
+        # cache path or a store it is also kept between runs
+        self.keep_playlist = (
+            keep_playlist or bool(playlist_cache_path) or playlist_store is not None
+        )
+        self.playlist_cache_path = playlist_cache_path
+        self.playlist_store = playlist_store
+        self._playlist = None
+        self._applied = None
+        self._load_playlist()
+        # Shared by all API requests, lowered while Spotify answers 429
+        self._in_flight = AdaptiveConcurrency(max_in_flight)
+        self.journal = None
         self.client_id = client_id
         self.client_secret = client_secret
         self.redirect_uri = redirect_uri
         self._authorization_code = authorization_code
 
-        # TODO Handle refresh token better, store the
-        # expiration time and refresh the token when needed
+        # The access token is requested lazily and renewed shortly before
+        # it expires, or when the API answers 401
         self._refresh_token = os.getenv("SPOTIFY_REFRESH_TOKEN")
-        self._access_token = os.getenv("SPOTIFY_ACCESS_TOKEN")
-        self._refresh_authentication()
+        self._tokens = TokenManager(self._request_token, cache_path=token_cache_path)
 
     @property
     def authorization_code(self):
@@ -52,9 +137,80 @@ class SpotifyAPI(BasePlaylistService):
 
     @property
     def access_token(self):
-        if not self._access_token:
-            self._authenticate()
-        return self._access_token
+        return self._tokens.get()
+
+    def _request_token(self) -> dict:
+        if not self._refresh_token:
+            return self._authenticate()
+        return self._refresh_authentication()
+
+    def _send(self, endpoint: str, method: str, url: str, **kwargs):
+        circuit_breaker.check(url)
+        # Token requests go to the accounts host, which is not capped
+        with self._in_flight.slot() if endpoint != "token" else nullcontext():
+            start = time.perf_counter()
+            try:
+                r = self._http.request(method, url, **kwargs)
+            except Exception as e:
+                metrics.record_request(
+                    endpoint, url, time.perf_counter() - start, error=e
+                )
+                circuit_breaker.record_error(url, e)
+                raise
+        metrics.record_request(endpoint, url, time.perf_counter() - start, r)
+        circuit_breaker.record_response(url, r)
+        if endpoint != "token":
+            self._in_flight.record(r.status_code == 429)
+        return r
+
+    @retry_with_backoff(tries=4, delay=1, backoff=2)
+    def _request(
+        self, method: str, url: str, endpoint: str = "api", **kwargs
+    ) -> requests.Response:
+        """
+        Make an authorized request to the Web API. A 401 answer invalidates
+        the access token and the request is retried once with a new one.
+        Rate limited (429) and server error answers are retried with backoff,
+        respecting Retry-After. Adds (POST) and reorders (PUT) are not
+        idempotent, they are only retried on 429 and 503, see
+        `RetryPolicy`.
+
+        :param method: HTTP method.
+        :param url: URL to make the request to.
+        :param endpoint: Name of the endpoint, used to group the metrics.
+        :param kwargs: Arguments passed on to the HTTP client.
+        :return: Response object.
+        """
+        access_token = self.access_token
+        r = self._send(
+            endpoint, method, url, headers=self._auth_headers(access_token), **kwargs
+        )
+
+        # Check if the request failed due to an unauthorized error
+        if r.status_code == 401:
+            logger.info("Access token expired, refreshing token...")
+            self._tokens.invalidate(access_token)
+
+            # Retry the request with the new access token
+            r = self._send(
+                endpoint,
+                method,
+                url,
+                headers=self._auth_headers(self.access_token),
+                **kwargs,
+            )
+
+        if is_failure_status(r.status_code):
+            r.raise_for_status()
+
+        return r
+
+    @staticmethod
+    def _auth_headers(access_token: str) -> dict:
+        return {
+            "Authorization": "Bearer " + access_token,
+            "Content-Type": "application/json",
+        }
 
     # TODO Remove this, listen to the callback url and
     # extract the code from the url
@@ -66,9 +222,7 @@ class SpotifyAPI(BasePlaylistService):
             "scope": "user-read-private playlist-modify-private playlist-read-collaborative playlist-modify-private playlist-modify-public",
         }
 
-        webbrowser.open(
-            "https://accounts.spotify.com/authorize?" + urlencode(auth_headers)
-        )
+        webbrowser.open(f"{self.accounts_url}/authorize?" + urlencode(auth_headers))
 
     def _authenticate(self):
         encoded_credentials = base64.b64encode(
@@ -86,8 +240,10 @@ class SpotifyAPI(BasePlaylistService):
             "redirect_uri": "http://localhost:8080",
         }
 
-        r = requests.post(
-            "https://accounts.spotify.com/api/token",
+        r = self._send(
+            "token",
+            "POST",
+            f"{self.accounts_url}/api/token",
             data=token_data,
             headers=token_headers,
         )
@@ -100,9 +256,12 @@ class SpotifyAPI(BasePlaylistService):
 
         results = r.json()
 
-        self._access_token = results["access_token"]
         self._refresh_token = results["refresh_token"]
 
+        return results
+
+    # Repeating a refresh only issues another access token
+    @retry_with_backoff(tries=3, delay=1, backoff=2, idempotent=True)
     def _refresh_authentication(self):
         encoded_credentials = base64.b64encode(
             self.client_id.encode() + b":" + self.client_secret.encode()
@@ -118,12 +277,14 @@ class SpotifyAPI(BasePlaylistService):
             "refresh_token": self._refresh_token,
         }
 
-        r = requests.post(
-            "https://accounts.spotify.com/api/token",
+        r = self._send(
+            "token",
+            "POST",
+            f"{self.accounts_url}/api/token",
             data=token_data,
             headers=token_headers,
         )
-        logger.info(f"Refreshing Spotify authentication {token_data}")
+        logger.info("Refreshing Spotify authentication")
         try:
             r.raise_for_status()
         except requests.exceptions.HTTPError as e:
@@ -132,155 +293,842 @@ class SpotifyAPI(BasePlaylistService):
 
         results = r.json()
 
-        self._access_token = results["access_token"]
+        # Spotify may rotate the refresh token
+        self._refresh_token = results.get("refresh_token", self._refresh_token)
+
+        return results
+
+    def _get_playlist_page(self, offset: int, fields: str) -> dict:
+        query_params = {
+            "fields": fields,
+            "offset": offset,
+            "limit": self.PLAYLIST_PAGE_SIZE,
+        }
+
+        r = self._request(
+            "GET",
+            f"{self.api_url}/playlists/{self.playlist_id}/tracks?"
+            + urlencode(query_params),
+            endpoint="playlist_read",
+        )
+
+        try:
+            r.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            logger.warning(f"Error fetching playlist page at offset {offset}: {e}")
+            raise e
+
+        return r.json()
+
+    def iter_playlist(self, max_concurrency: int = 4) -> Iterator[Item]:
+        """
+        Stream the items of the playlist in playlist order.
+
+        The first page tells the total, the remaining pages are fetched
+        concurrently. At most `max_concurrency` pages are held in memory.
+
+        :param max_concurrency: Number of pages requested at the same time.
+        :return: Iterator over the playlist items.
+        """
 
-    def get_playlist(self):
         def _parse_response(response):
-            result_list = []
             for item in response["items"]:
                 track = item["track"]
-                uri = track["uri"]
-                result_list.append(Item(id=uri))
+                # Tracks that are no longer available come back as null
+                if not track:
+                    continue
+                release_date = (track.get("album") or {}).get("release_date")
+                if self.track_index is not None:
+                    self.track_index.add(
+                        track["uri"],
+                        track.get("name"),
+                        [artist["name"] for artist in track.get("artists", [])],
+                        release_date,
+                    )
+                yield Item(
+                    id=track["uri"],
+                    release_date=release_date,
+                    added_at=item.get("added_at"),
+                )
+            if self.track_index is not None:
+                self.track_index.flush()
 
-            return result_list
+        first_page = self._get_playlist_page(0, "total," + self.PLAYLIST_ITEM_FIELDS)
+        yield from _parse_response(first_page)
 
-        user_headers = {
-            "Authorization": "Bearer " + self.access_token,
-            "Content-Type": "application/json",
-        }
+        offsets = range(
+            self.PLAYLIST_PAGE_SIZE, first_page["total"], self.PLAYLIST_PAGE_SIZE
+        )
+        with closing(
+            map_ordered(
+                lambda offset: self._get_playlist_page(
+                    offset, self.PLAYLIST_ITEM_FIELDS
+                ),
+                offsets,
+                max_workers=max_concurrency,
+            )
+        ) as pages:
+            for page in pages:
+                yield from _parse_response(page)
 
-        query_params = {
-            "fields": "items(added_at,track(album(release_date),uri))",
-        }
+    def get_snapshot_id(self) -> str:
+        """
+        Current version of the playlist, changes with every modification.
+        """
+        r = self._request(
+            "GET",
+            f"{self.api_url}/playlists/{self.playlist_id}?"
+            + urlencode({"fields": "snapshot_id"}),
+            endpoint="playlist_snapshot",
+        )
 
-        r = requests.get(
-            f"https://api.spotify.com/v1/playlists/{self.playlist_id}/tracks?"
-            + urlencode(query_params),
-            headers=user_headers,
+        try:
+            r.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            logger.warning(f"Error fetching the playlist snapshot: {e}")
+            raise e
+
+        return r.json()["snapshot_id"]
+
+    def get_playlist(self, max_concurrency: int = 4) -> List[Item]:
+        """
+        Read the playlist, with release dates filled in.
+
+        With `keep_playlist` the items are kept together with the snapshot
+        they were read at, and later reads of an unchanged playlist cost a
+        single snapshot request.
+
+        :param max_concurrency: Number of requests sent at the same time.
+        :return: The playlist items in playlist order.
+        """
+        snapshot_id = None
+        if self.keep_playlist:
+            snapshot_id = self.get_snapshot_id()
+            if self._playlist is not None and self._playlist[0] == snapshot_id:
+                logger.info(f"Playlist unchanged since snapshot {snapshot_id}")
+                return list(self._playlist[1])
+
+        items = list(self.iter_playlist(max_concurrency=max_concurrency))
+        logger.info(f"Read {len(items)} playlist items")
+        items = self.enrich_items(items, max_concurrency=max_concurrency)
+
+        # The snapshot was taken before the read, a change during the read
+        # makes the next read a full one
+        if self.keep_playlist:
+            self._set_kept_playlist((snapshot_id, items))
+        return items
+
+    def use_playlist_store(self, store: "Catalog"):
+        """
+        Keep the playlist in `store` between runs instead of the playlist
+        cache file, see `Catalog.save_playlist`.
+
+        :param store: Playlist store.
+        """
+        self.keep_playlist = True
+        self.playlist_store = store
+        self._playlist = None
+        self._applied = None
+        self._load_playlist()
+
+    def _load_playlist(self):
+        if self.playlist_store is not None:
+            stored = self.playlist_store.load_playlist(self.playlist_id)
+            if stored is not None:
+                snapshot_id, items, self._applied = stored
+                self._playlist = (snapshot_id, items)
+            return
+
+        if not self.playlist_cache_path or not os.path.exists(self.playlist_cache_path):
+            return
+
+        try:
+            with open(self.playlist_cache_path) as f:
+                cached = json.load(f)
+            if cached["playlist_id"] != self.playlist_id:
+                return
+            self._playlist = (
+                cached["snapshot_id"],
+                [Item.from_row(row) for row in cached["items"]],
+            )
+            self._applied = tuple(cached["applied"]) if cached["applied"] else None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(
+                f"Ignoring unreadable playlist cache {self.playlist_cache_path}: {e}"
+            )
+
+    def _save_playlist(self):
+        if self.playlist_store is not None:
+            snapshot_id, items = self._playlist or (None, [])
+            self.playlist_store.save_playlist(
+                self.playlist_id, snapshot_id, items, self._applied
+            )
+            return
+
+        if not self.playlist_cache_path:
+            return
+
+        with atomic_write(self.playlist_cache_path) as f:
+            json.dump(
+                {
+                    "playlist_id": self.playlist_id,
+                    "snapshot_id": self._playlist[0] if self._playlist else None,
+                    "items": (
+                        [item.to_row() for item in self._playlist[1]]
+                        if self._playlist
+                        else []
+                    ),
+                    "applied": self._applied,
+                },
+                f,
+            )
+
+    def _set_kept_playlist(self, playlist: Optional[Tuple[str, List[Item]]]):
+        self._playlist = playlist
+        self._save_playlist()
+
+    @staticmethod
+    def sync_fingerprint(items, *options) -> str:
+        """
+        Fingerprint of the desired playlist and the options it was synced
+        with, see `is_synced`.
+
+        :param items: Desired playlist items.
+        :param options: Anything else the write depends on, e.g. the day of
+            the retention cutoff.
+        """
+        digest = hashlib.sha256()
+        for uri in sorted({item.id for item in items}):
+            digest.update(uri.encode() + b"\n")
+        digest.update(repr(options).encode())
+        return digest.hexdigest()
+
+    def is_synced(self, fingerprint: str) -> bool:
+        """
+        Whether the last sync applied the same desired playlist and the
+        playlist has not changed since, so the write can be skipped. Needs a
+        playlist read of this run, see `get_playlist`.
+
+        :param fingerprint: Fingerprint of the desired playlist.
+        """
+        return (
+            self._playlist is not None
+            and self._applied is not None
+            and self._applied == (fingerprint, self._playlist[0])
+        )
+
+    def mark_synced(self, fingerprint: str):
+        """
+        Remember that the playlist holds the desired playlist of
+        `fingerprint`. Not remembered when a write failed.
+
+        :param fingerprint: Fingerprint of the desired playlist.
+        """
+        if self._playlist is not None:
+            self._applied = (fingerprint, self._playlist[0])
+            self._save_playlist()
+
+    def _update_kept_playlist(self, removed: List[Item], added: List[Item]):
+        if self._playlist is None or not (removed or added):
+            return
+
+        # Removal batches may run concurrently, so the snapshot they end at
+        # is asked for rather than taken from the last response
+        removed = set(removed)
+        items = added + [item for item in self._playlist[1] if item not in removed]
+        self._set_kept_playlist((self.get_snapshot_id(), items))
+
+    def _get_tracks_batch(self, uris: List[str]) -> List[dict]:
+        ids = ",".join(uri.rsplit(":", 1)[-1] for uri in uris)
+        r = self._request(
+            "GET",
+            f"{self.api_url}/tracks?" + urlencode({"ids": ids}),
+            endpoint="tracks",
         )
 
         try:
             r.raise_for_status()
         except requests.exceptions.HTTPError as e:
-            logger.warning(f"Error authenticating with Spotify: {e}")
+            logger.warning(f"Error fetching metadata of {len(uris)} tracks: {e}")
             raise e
 
-        results = r.json()
+        return r.json()["tracks"]
 
-        return _parse_response(results)
+    def get_tracks_metadata(
+        self, uris: List[str], max_concurrency: int = 4
+    ) -> Dict[str, Item]:
+        """
+        Fetch the release dates of tracks, at most 50 per request. Requests
+        are sent concurrently.
 
-    def remove_playlist_items(self, tracks: list[Item]):
-        def _build_payload(tracks: list[Item]):
-            track_uri_list = []
-            for track in tracks:
-                track_uri_list.append({"uri": track.id})
+        :param uris: Spotify track URIs.
+        :param max_concurrency: Number of requests sent at the same time.
+        :return: Items by URI, tracks Spotify does not know are left out.
+        """
+        uris = list(dict.fromkeys(uris))
+        batches = [
+            uris[i : i + self.TRACKS_BATCH_SIZE]
+            for i in range(0, len(uris), self.TRACKS_BATCH_SIZE)
+        ]
 
-            return track_uri_list
+        metadata = {}
+        with closing(
+            map_ordered(self._get_tracks_batch, batches, max_workers=max_concurrency)
+        ) as results:
+            for tracks in results:
+                for track in tracks:
+                    # Unknown ids come back as null
+                    if not track:
+                        continue
+                    release_date = (track.get("album") or {}).get("release_date")
+                    metadata[track["uri"]] = Item(track["uri"], release_date)
 
-        user_headers = {
-            "Authorization": "Bearer " + self.access_token,
-            "Content-Type": "application/json",
-        }
+        logger.info(
+            f"Fetched metadata of {len(metadata)}/{len(uris)} tracks"
+            f" in {len(batches)} requests"
+        )
+        return metadata
+
+    def enrich_items(self, items: List[Item], max_concurrency: int = 4) -> List[Item]:
+        """
+        Fill in the release date of items that lack one, e.g. tracks linked
+        by a scraped page, with batched metadata requests.
+
+        :param items: Items to enrich.
+        :param max_concurrency: Number of requests sent at the same time.
+        :return: The items in the same order, release dates filled in where
+            Spotify knows them.
+        """
+        # Items of the kept playlist are known already
+        metadata = {}
+        if self._playlist is not None:
+            metadata = {item.id: item for item in self._playlist[1]}
 
-        payload = {"tracks": _build_payload(tracks)}
+        # Local files have no metadata on Spotify
+        missing = [
+            item.id
+            for item in items
+            if not item.release_date
+            and item.id.startswith("spotify:track:")
+            and not (item.id in metadata and metadata[item.id].release_date)
+        ]
+        if missing:
+            metadata.update(
+                self.get_tracks_metadata(missing, max_concurrency=max_concurrency)
+            )
+        return [
+            (
+                item.replace(release_date=metadata[item.id].release_date)
+                if not item.release_date
+                and item.id in metadata
+                and metadata[item.id].release_date
+                else item
+            )
+            for item in items
+        ]
 
-        response = requests.delete(
-            f"https://api.spotify.com/v1/playlists/{self.playlist_id}/tracks",
+    def _apply_batch(self, method: str, payload: dict) -> Optional[str]:
+        r = self._request(
+            method,
+            f"{self.api_url}/playlists/{self.playlist_id}/tracks",
+            endpoint=self.MUTATION_ENDPOINTS[method],
             json=payload,
-            headers=user_headers,
         )
 
-    def add_playlist_items(self, tracks: list[Item]):
-        def _build_payload(tracks: list[Item]):
-            track_uri_list = []
-            for track in tracks:
-                track_uri_list.append(track.id)
+        try:
+            r.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            logger.warning(f"Error applying {method} batch to the playlist: {e}")
+            raise e
+
+        return r.json().get("snapshot_id")
+
+    def _try_batch(self, method: str, payload: dict):
+        # A batch that keeps failing is reported, the other batches go on
+        try:
+            return self._apply_batch(method, payload), None
+        except Exception as e:
+            logger.warning(f"Giving up on {method} batch: {e}")
+            return None, e
+
+    def _record_batch(self, operation: str, batch: List[Item], snapshot_id: str):
+        if self.journal is not None:
+            self.journal.record_batch(operation, batch, snapshot_id)
+
+    def _batches(self, tracks) -> List[List[Item]]:
+        tracks = list(tracks)
+        return [
+            tracks[i : i + self.MUTATION_BATCH_SIZE]
+            for i in range(0, len(tracks), self.MUTATION_BATCH_SIZE)
+        ]
+
+    def remove_playlist_items(
+        self, tracks: list[Item], snapshot_id: str = None, max_concurrency: int = 4
+    ) -> MutationResult:
+        """
+        Remove all occurrences of the given tracks, at most 100 per request.
+
+        Without a `snapshot_id` the batches are independent (removal is by
+        URI, not by position) and are sent concurrently. With a `snapshot_id`
+        they are applied one after another, each against the snapshot the
+        previous one produced.
+
+        :param tracks: Items to remove.
+        :param snapshot_id: Playlist version to apply the removals against.
+        :param max_concurrency: Number of concurrent batches when pipelining.
+        :return: Resulting snapshot_id and the batches that failed.
+        """
+
+        def _build_payload(tracks: list[Item], snapshot_id: str = None):
+            payload = {"tracks": [{"uri": track.id} for track in tracks]}
+            if snapshot_id:
+                payload["snapshot_id"] = snapshot_id
+            return payload
+
+        batches = self._batches(tracks)
+        failed = []
+
+        if snapshot_id is None:
+            results = map_ordered(
+                lambda batch: self._try_batch("DELETE", _build_payload(batch)),
+                batches,
+                max_workers=max_concurrency,
+            )
+            for batch, (batch_snapshot_id, error) in zip(batches, results):
+                if error is not None:
+                    failed.append(batch)
+                else:
+                    snapshot_id = batch_snapshot_id
+                    self._record_batch("remove", batch, snapshot_id)
+        else:
+            for batch in batches:
+                batch_snapshot_id, error = self._try_batch(
+                    "DELETE", _build_payload(batch, snapshot_id)
+                )
+                if error is not None:
+                    failed.append(batch)
+                else:
+                    snapshot_id = batch_snapshot_id
+                    self._record_batch("remove", batch, snapshot_id)
+
+        logger.info(
+            f"Removed {len(batches) - len(failed)}/{len(batches)} batches, snapshot {snapshot_id}"
+        )
+        return MutationResult(snapshot_id, len(batches) - len(failed), failed)
+
+    def add_playlist_items(
+        self, tracks: list[Item], position: int = 0
+    ) -> MutationResult:
+        """
+        Insert the tracks at `position`, at most 100 per request.
 
-            return track_uri_list
+        Batches are applied one after another, each inserted behind the
+        previous one, so the tracks keep the given order.
 
-        user_headers = {
-            "Authorization": "Bearer " + self.access_token,
-            "Content-Type": "application/json",
-        }
+        :param tracks: Items to add.
+        :param position: Playlist position of the first added track.
+        :return: Resulting snapshot_id and the batches that failed.
+        """
+        batches = self._batches(tracks)
+        snapshot_id = None
+        failed = []
 
-        req_body = {"uris": ["2jE9r0cUSWoOkFWrDQVU3d"], "position": 0}
-        print(req_body)
-        tracks_response = requests.post(
-            f"https://api.spotify.com/v1/playlists/{self.playlist_id}/tracks",
-            json=req_body,
-            headers=user_headers,
+        for batch in batches:
+            req_body = {"uris": [track.id for track in batch], "position": position}
+            batch_snapshot_id, error = self._try_batch("POST", req_body)
+            if error is not None:
+                failed.append(batch)
+                continue
+
+            snapshot_id = batch_snapshot_id
+            self._record_batch("add", batch, snapshot_id)
+            position += len(batch)
+
+        logger.info(
+            f"Added {len(batches) - len(failed)}/{len(batches)} batches, snapshot {snapshot_id}"
         )
-        print(tracks_response.json())
+        return MutationResult(snapshot_id, len(batches) - len(failed), failed)
 
-    def get_track(self, track_name: str, from_date: datetime = None):
-        logger.info(f"Gathering track uri for {track_name}")
+    def reorder_playlist_items(
+        self, moves: List[Move], snapshot_id: str = None
+    ) -> MutationResult:
+        """
+        Move ranges of the playlist, one request per move. Moves are applied
+        one after another, each against the snapshot the previous one
+        produced. A failed move invalidates the positions of the next ones,
+        so the remaining moves are given up.
 
-        def make_request():
-            user_headers = {
-                "Authorization": "Bearer " + self.access_token,
-                "Content-Type": "application/json",
+        :param moves: Moves as planned by `plan_reorder`.
+        :param snapshot_id: Playlist version to apply the first move against.
+        :return: Resulting snapshot_id and the items of the moves that were
+            not applied.
+        """
+        for applied, move in enumerate(moves):
+            payload = {
+                "range_start": move.range_start,
+                "range_length": move.range_length,
+                "insert_before": move.insert_before,
             }
+            if snapshot_id:
+                payload["snapshot_id"] = snapshot_id
 
-            user_params = {
-                "limit": 5,
-                "type": "track",
-                "market": "NL",
-            }
+            batch_snapshot_id, error = self._try_batch("PUT", payload)
+            if error is not None:
+                logger.warning(f"Reordered {applied}/{len(moves)} ranges")
+                return MutationResult(
+                    snapshot_id, applied, [move.items for move in moves[applied:]]
+                )
+            snapshot_id = batch_snapshot_id
+            self._record_batch("reorder", move.items, snapshot_id)
 
-            r = requests.get(
-                "https://api.spotify.com/v1/search?q=" + track_name,
-                params=user_params,
-                headers=user_headers,
-            )
-            return r
+        logger.info(f"Reordered {len(moves)} ranges, snapshot {snapshot_id}")
+        return MutationResult(snapshot_id, len(moves), [])
 
-        # First attempt to make the request
-        r = make_request()
-        self._refresh_authentication()
+    def _search_track(self, title: str, artist_name: str) -> Optional[CachedResolution]:
+        """
+        Search Spotify for a track. All returned candidates are scored against
+        the scraped title and artist and added to the track index.
 
-        # Check if the request failed due to an unauthorized error
-        if r.status_code == 401:
-            logger.info("Access token expired, refreshing token...")
-            self._refresh_authentication()  # Refresh the token
+        :param title: Track title.
+        :param artist_name: Artist name, may be empty.
+        :return: URI and release date of the best candidate, None if no
+            candidate scores at least `SEARCH_MIN_SCORE`.
+        """
+        track_name = f"track:{title}" + " " + f"artist:{artist_name}"
+        user_params = {
+            "q": track_name,
+            "limit": 5,
+            "type": "track",
+            "market": "NL",
+        }
 
-            # Retry the request with the new access token
-            r = make_request()
+        r = self._request(
+            "GET",
+            f"{self.api_url}/search",
+            endpoint="search",
+            params=user_params,
+        )
 
         try:
             r.raise_for_status()
         except requests.exceptions.HTTPError as e:
-            logger.warning(f"Error authenticating with Spotify: {e}")
+            logger.warning(f"Error searching Spotify for {track_name}: {e}")
             raise e
 
         results = r.json()
-        logger.info(f"Results: {results}")
+        logger.debug(f"Results: {results}")
+
+        best, best_score = None, 0.0
+        for candidate in results.get("tracks", {}).get("items", []):
+            if not candidate:
+                continue
+            artists = [artist["name"] for artist in candidate.get("artists", [])]
+            release_date = candidate.get("album", {}).get("release_date")
+            if self.track_index is not None:
+                self.track_index.add(
+                    candidate["uri"], candidate.get("name"), artists, release_date
+                )
+
+            # Ties keep Spotify's ranking
+            score = match_score(title, artist_name, candidate.get("name"), artists)
+            if score > best_score:
+                best, best_score = (
+                    CachedResolution(candidate["uri"], release_date),
+                    score,
+                )
+        if self.track_index is not None:
+            self.track_index.flush()
+
+        if best is None or best_score < self.SEARCH_MIN_SCORE:
+            logger.warning(f"No matching search result for {track_name}")
+            return None
+
+        return best
+
+    def _released_before(
+        self, track_name: str, release_date: str, from_date: datetime
+    ) -> bool:
+        if from_date is None or not release_date:
+            return False
 
+        # Try to retrieve year-month-day release date
         try:
-            track_uri = results["tracks"]["items"][0]["uri"]
-            release_date = results["tracks"]["items"][0]["album"]["release_date"]
-            # Try to retrieve year-month-day release date
-            try:
-                release_date = datetime.strptime(release_date, "%Y-%m-%d")
-                if release_date < from_date:
-                    logger.info(f"Track {track_name} is older than {from_date}")
-                    return None
-            except ValueError as e:
-                logger.warning(f"Error parsing release date: {e}")
-        except Exception as e:
-            logger.warning(f"Failed to gather track uri for {track_name}: {e}")
+            if datetime.strptime(release_date, "%Y-%m-%d") < from_date:
+                logger.info(f"Track {track_name} is older than {from_date}")
+                return True
+        except ValueError as e:
+            logger.warning(f"Error parsing release date: {e}")
+        return False
+
+    def get_track(
+        self, title: str, artist_name: str, from_date: datetime = None
+    ) -> Optional[Item]:
+        """
+        Search Spotify for a track, bypassing the resolution cache and the
+        track index.
+
+        :param title: Track title.
+        :param artist_name: Artist name, may be empty.
+        :param from_date: Tracks released before this date are not returned.
+        :return: Playlist item, None if the track was not found or is too old.
+        """
+        track_name = f"track:{title}" + " " + f"artist:{artist_name}"
+        logger.info(f"Gathering track uri for {track_name}")
+
+        result = self._search_track(title, artist_name)
+        if result is None:
+            return None
+
+        if self._released_before(track_name, result.release_date, from_date):
+            return None
+        logger.info(f"Gathered track uri {result.uri} for {track_name}")
+
+        return Item(id=result.uri, release_date=result.release_date)
+
+    def resolve_track(
+        self, title: str, artist_name: str, from_date: datetime = None
+    ) -> Optional[Item]:
+        """
+        Resolve a scraped track to a Spotify item. The resolution cache and
+        the track index are tried first, only true misses are searched.
+
+        :param title: Track title.
+        :param artist_name: Artist name, may be empty.
+        :param from_date: Tracks released before this date are not returned.
+        :return: Playlist item, None if the track was not found or is too old.
+        """
+        track_name = f"track:{title}" + " " + f"artist:{artist_name}"
+        query = normalize_query(title, artist_name)
+
+        result = None
+        if self.resolution_cache is not None:
+            result = self.resolution_cache.get(query)
+
+        if result is None and self.track_index is not None:
+            match = self.track_index.lookup(title, artist_name)
+            # An older indexed track may be a namesake of a new release,
+            # which only a search finds
+            if match is not None and not self._released_before(
+                track_name, match.release_date, from_date
+            ):
+                logger.info(f"Matched {track_name} to indexed track {match.title}")
+                result = CachedResolution(match.uri, match.release_date)
+
+        if result is None:
+            logger.info(f"Gathering track uri for {track_name}")
+            result = self._search_track(title, artist_name) or CachedResolution(
+                None, None
+            )
+            if self.resolution_cache is not None:
+                self.resolution_cache.put(query, result.uri, result.release_date)
+
+        if result.uri is None:
+            return None
+
+        if self._released_before(track_name, result.release_date, from_date):
             return None
-        logger.info(f"Gathered track uri {track_uri} for {track_name}")
+        logger.info(f"Gathered track uri {result.uri} for {track_name}")
+
+        return Item(id=result.uri, release_date=result.release_date)
+
+    def resolve_tracks(
+        self, tracks: List[TrackData], from_date: datetime = None
+    ) -> BatchResolution:
+        """
+        Resolve scraped tracks concurrently, see `resolve_track`.
+
+        Tracks with the same normalized title and artist are resolved once.
+        Searches run on up to `max_in_flight` threads and share the adaptive
+        cap on requests in flight, so a 429 slows the whole batch down
+        instead of failing it. A track that fails is reported and does not
+        abort the others.
+
+        :param tracks: Scraped tracks.
+        :param from_date: Tracks released before this date are not returned.
+        :return: Item per track in input order, and the tracks that failed.
+        """
+        queries = {}
+        for track in tracks:
+            queries.setdefault(track.key, track)
+
+        def _resolve(track: TrackData):
+            try:
+                return self.resolve_track(track.title, track.artist_name, from_date)
+            except Exception as e:
+                logger.warning(f"Failed to resolve {track.title}: {e}")
+                return e
+
+        with closing(
+            map_ordered(
+                _resolve,
+                queries.values(),
+                max_workers=self._in_flight.max_in_flight,
+                # Queue everything, the cap decides what is in flight
+                prefetch=len(queries),
+            )
+        ) as results:
+            resolved = dict(zip(queries, results))
+
+        items, failed = [], []
+        for track in tracks:
+            result = resolved[track.key]
+            if isinstance(result, Exception):
+                failed.append((track, result))
+                result = None
+            items.append(result)
+
+        logger.info(
+            f"Resolved {sum(item is not None for item in items)}/{len(tracks)}"
+            f" tracks with {len(queries)} distinct queries, {len(failed)} failed,"
+            f" {self._in_flight.throttled} throttled answers"
+        )
+        return BatchResolution(items, failed)
+
+    def _apply_diff(
+        self, to_remove: List[Item], to_add: List[Item]
+    ) -> Tuple[List[Item], List[Item]]:
+        """
+        Remove and add items, skipping empty diffs.
+
+        :return: The items that were removed and added.
+        """
+        if self.journal is not None:
+            self.journal.record_planned(to_remove, to_add)
+        removed, added = [], []
+
+        # Remove tracks
+        if to_remove:
+            result = self.remove_playlist_items(to_remove)
+            if result.failed:
+                logger.warning(f"{len(result.failed)} removal batches failed")
+            failed = {item for batch in result.failed for item in batch}
+            removed = [item for item in to_remove if item not in failed]
+
+        # Add tracks
+        if to_add:
+            result = self.add_playlist_items(to_add)
+            if result.failed:
+                logger.warning(f"{len(result.failed)} add batches failed")
+            failed = {item for batch in result.failed for item in batch}
+            added = [item for item in to_add if item not in failed]
 
-        return Item(id=track_uri)
+        if self.keep_playlist:
+            # A failed batch may still have been applied, read it again
+            if len(removed) < len(to_remove) or len(added) < len(to_add):
+                self._set_kept_playlist(None)
+            else:
+                self._update_kept_playlist(removed, added)
 
-    def sync_playlist(self, playlist_data, track_id_list):
+        return removed, added
+
+    def _apply_ordered_diff(
+        self, playlist_data: List[Item], to_remove: List[Item], to_add: List[Item]
+    ) -> Tuple[List[Item], List[Item]]:
+        """
+        Remove and add items and put the playlist in release order, newest
+        first, see `release_order`. Items that are already in order stay
+        where they are, see `plan_reorder`, so a few new releases cost a few
+        requests.
+
+        :param playlist_data: Current playlist items in playlist order.
+        :return: The items that were removed and added.
+        """
+        if self.journal is not None:
+            self.journal.record_planned(to_remove, to_add)
+        removed = []
+        if to_remove:
+            result = self.remove_playlist_items(to_remove)
+            if result.failed:
+                logger.warning(f"{len(result.failed)} removal batches failed")
+            failed = {item for batch in result.failed for item in batch}
+            removed = [item for item in to_remove if item not in failed]
+
+        remove = set(to_remove)
+        removed_set = set(removed)
+        current = [item for item in playlist_data if item not in removed_set]
+        positions = {}
+        for position, item in enumerate(current):
+            positions.setdefault(item, position)
+        target = release_order(
+            [item for item in positions if item not in remove]
+            + [item for item in to_add if item not in positions],
+            positions,
+        )
+        moves, inserts, final = plan_reorder(current, target)
+        logger.info(
+            f"Ordering the playlist: {len(moves)} moves, {len(inserts)} inserts"
+        )
+
+        added = []
+        complete = len(removed) == len(to_remove)
+        result = self.reorder_playlist_items(moves)
+        if result.failed:
+            complete = False
+            # Insert positions assume the moves were applied
+            inserts = []
+
+        for insert in inserts:
+            result = self.add_playlist_items(insert.items, position=insert.position)
+            failed = {item for batch in result.failed for item in batch}
+            added.extend(item for item in insert.items if item not in failed)
+            if failed:
+                complete = False
+                break
+
+        if self.keep_playlist:
+            if complete:
+                if moves or inserts or removed:
+                    self._set_kept_playlist((self.get_snapshot_id(), final))
+            else:
+                self._set_kept_playlist(None)
+
+        return removed, added
+
+    @staticmethod
+    def _aged_out(items, retention_cutoff: datetime) -> List[Item]:
+        # Items without any date are kept
+        return [
+            item
+            for item in items
+            if item.effective_date() is not None
+            and item.effective_date() < retention_cutoff
+        ]
+
+    def sync_playlist(
+        self,
+        playlist_data,
+        track_id_list,
+        retention_cutoff: datetime = None,
+        ordered: bool = False,
+    ):
+        """
+        Make the playlist hold the resolved tracks.
+
+        Without a `retention_cutoff` everything that was not resolved this
+        run is removed. With one, only items released (or, lacking a release
+        date, added) before the cutoff are removed and tracks released before
+        it are not added.
+
+        :param playlist_data: Current playlist items.
+        :param track_id_list: Resolved tracks.
+        :param retention_cutoff: Start of the retention window.
+        :param ordered: Also put the playlist in release order, newest first.
+            `playlist_data` must then be in playlist order.
+        :return: Whether all removals and additions were applied.
+        """
         # Convert lists to sets
         set_A = set(playlist_data)
         set_B = set(track_id_list)
 
+        if retention_cutoff is not None:
+            set_B -= set(self._aged_out(set_B, retention_cutoff))
+
         # Items in A but not in B
         # Need to get removed
-        only_in_A = set_A - set_B
+        if retention_cutoff is not None:
+            only_in_A = set(self._aged_out(set_A, retention_cutoff))
+        else:
+            only_in_A = set_A - set_B
         logger.info(f"Tracks to remove: {only_in_A}")
 
         # Items in B but not in A
@@ -288,8 +1136,53 @@ class SpotifyAPI(BasePlaylistService):
         only_in_B = set_B - set_A
         logger.info(f"Tracks to add: {only_in_B}")
 
-        # Remove tracks
-        self.remove_playlist_items(only_in_A)
+        if ordered:
+            removed, added = self._apply_ordered_diff(
+                playlist_data, list(only_in_A), list(only_in_B)
+            )
+        else:
+            removed, added = self._apply_diff(list(only_in_A), list(only_in_B))
+        return len(removed) == len(only_in_A) and len(added) == len(only_in_B)
 
-        # Add tracks
-        self.add_playlist_items(only_in_B)
+    def sync_playlist_from_catalog(
+        self,
+        catalog: "Catalog",
+        playlist_data: List[Item],
+        windows: Dict[str, datetime],
+        retention_cutoff: datetime = None,
+        ordered: bool = False,
+    ):
+        """
+        Sync the playlist with the releases in the catalog. The diff comes
+        from indexed catalog queries against the playlist it stores, which
+        is kept up to date as the playlist store, see `use_playlist_store`.
+
+        :param catalog: Catalog holding the resolved releases, the playlist
+            store of this client.
+        :param playlist_data: Current playlist items in playlist order, as
+            returned by `get_playlist`.
+        :param windows: Start of the window per scraper source.
+        :param retention_cutoff: Start of the retention window, see
+            `sync_playlist`.
+        :param ordered: Also put the playlist in release order, newest first.
+        :return: Whether all removals and additions were applied.
+        """
+        if self.playlist_store is not catalog:
+            raise ValueError("The catalog must be the playlist store")
+
+        if retention_cutoff is not None:
+            to_remove = self._aged_out(set(playlist_data), retention_cutoff)
+        else:
+            to_remove = catalog.playlist_items_outside(windows)
+        logger.info(f"Tracks to remove: {to_remove}")
+        to_add = catalog.releases_not_in_playlist(windows)
+        if retention_cutoff is not None:
+            aged_out = set(self._aged_out(to_add, retention_cutoff))
+            to_add = [item for item in to_add if item not in aged_out]
+        logger.info(f"Tracks to add: {to_add}")
+
+        if ordered:
+            removed, added = self._apply_ordered_diff(playlist_data, to_remove, to_add)
+        else:
+            removed, added = self._apply_diff(to_remove, to_add)
+        return len(removed) == len(to_remove) and len(added) == len(to_add)
@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from typing import Callable
+from utils.files import atomic_write
+
+logger = logging.getLogger("hardstyle_watcher.playlist.token_manager")
+
+
+class TokenManager:
+    """
+    Keeps an OAuth access token together with its expiry and refreshes it only
+    shortly before it expires or after the API rejected it.
+
+    Concurrent callers share a single in-flight refresh. Optionally the token
+    is persisted to `cache_path`, so back-to-back runs start without a token
+    request.
+
+    :param refresh: Function requesting a new token, returns the token
+        endpoint response (`access_token` and `expires_in`).
+    :param refresh_margin: Seconds before expiry at which the token is renewed.
+    :param cache_path: Optional JSON file the token and its expiry are stored in.
+    """
+
+    def __init__(
+        self,
+        refresh: Callable[[], dict],
+        refresh_margin: float = 60,
+        cache_path: str = None,
+    ):
+        self._refresh = refresh
+        self.refresh_margin = refresh_margin
+        self.cache_path = cache_path
+        self._access_token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _valid(self) -> bool:
+        return (
+            self._access_token is not None
+            and time.time() < self._expires_at - self.refresh_margin
+        )
+
+    def get(self) -> str:
+        """
+        Return a valid access token, refreshing it first when needed.
+        """
+        if self._valid():
+            return self._access_token
+
+        with self._lock:
+            # Another caller may have refreshed while we waited for the lock
+            if not self._valid():
+                self.set_from_response(self._refresh())
+            return self._access_token
+
+    def set_from_response(self, results: dict):
+        """
+        Store the token of a token endpoint response.
+
+        :param results: Parsed JSON of the token endpoint.
+        """
+        self._access_token = results["access_token"]
+        self._expires_at = time.time() + results.get("expires_in", 3600)
+        logger.info(f"Access token valid for {results.get('expires_in', 3600)}s")
+        self._save()
+
+    def invalidate(self, access_token: str):
+        """
+        Mark a token the API rejected as expired. Tokens that were replaced in
+        the meantime are left alone, so concurrent 401s cause one refresh.
+
+        :param access_token: The rejected token.
+        """
+        with self._lock:
+            if access_token == self._access_token:
+                self._expires_at = 0.0
+
+    def _load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+            self._access_token = cached["access_token"]
+            self._expires_at = cached["expires_at"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable token cache {self.cache_path}: {e}")
+
+    def _save(self):
+        if not self.cache_path:
+            return
+
+        # The token is a secret, the file is only readable by its owner
+        with atomic_write(self.cache_path, mode=0o600) as f:
+            json.dump(
+                {"access_token": self._access_token, "expires_at": self._expires_at},
+                f,
+            )
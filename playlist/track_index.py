@@ -0,0 +1,315 @@
+import json
+import logging
+import re
+import sqlite3
+import threading
+
+from collections import Counter
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set
+from utils.metrics import metrics
+from utils.normalize import normalize_text
+
+logger = logging.getLogger("hardstyle_watcher.playlist.track_index")
+
+# "(feat. X)", "ft. X", ... featured artists are not part of the title
+_FEATURING = re.compile(
+    r"[(\[]?\b(?:feat|ft|featuring)\b\.?\s[^)\]]*[)\]]?", re.IGNORECASE
+)
+# Words that join artist names rather than name an artist
+_ARTIST_JOINERS = frozenset({"feat", "ft", "featuring", "vs", "x", "and"})
+# Words naming another recording of a title, "X" and "X (Remix)" or
+# "X VIP" are different tracks
+_VERSION_WORDS = frozenset(
+    {"remix", "vip", "rework", "bootleg", "flip", "remake", "live", "acoustic"}
+)
+# "Part 2", "Pt. II", "Vol. 3", ... sequels are different tracks too
+_PART = re.compile(r"\b(?:part|pt|vol|volume|chapter)\s+(\d+|[ivx]+)\b")
+_ROMAN = {"i": "1", "ii": "2", "iii": "3", "iv": "4", "v": "5", "vi": "6"}
+
+
+class IndexedTrack(NamedTuple):
+    uri: str
+    title: str
+    artists: List[str]
+    release_date: Optional[str]
+
+
+def _normalize_title(title: str) -> str:
+    return normalize_text(_FEATURING.sub(" ", title or ""))
+
+
+def _artist_tokens(artists: Iterable[str]) -> FrozenSet[str]:
+    return frozenset(
+        token
+        for artist in artists
+        for token in normalize_text(artist).split()
+        if token not in _ARTIST_JOINERS
+    )
+
+
+# Version markers of a normalized title, e.g. {"remix", "part 2"}
+def _versions(title: str) -> FrozenSet[str]:
+    versions = {word for word in title.split() if word in _VERSION_WORDS}
+    versions.update(f"part {_ROMAN.get(part, part)}" for part in _PART.findall(title))
+    return frozenset(versions)
+
+
+def _trigrams(text: str) -> FrozenSet[str]:
+    padded = f"  {text} "
+    return frozenset(padded[i : i + 3] for i in range(len(padded) - 2))
+
+
+def _dice(shared: int, a: int, b: int) -> float:
+    return 2 * shared / (a + b) if a + b else 0.0
+
+
+def _score(
+    title_grams: FrozenSet[str],
+    query_versions: FrozenSet[str],
+    query_artists: FrozenSet[str],
+    candidate_grams: FrozenSet[str],
+    candidate_versions: FrozenSet[str],
+    candidate_artists: FrozenSet[str],
+) -> float:
+    if query_versions != candidate_versions:
+        return 0.0
+    title_score = _dice(
+        len(title_grams & candidate_grams), len(title_grams), len(candidate_grams)
+    )
+    if not query_artists:
+        return title_score
+    artist_score = len(query_artists & candidate_artists) / len(query_artists)
+    return 0.7 * title_score + 0.3 * artist_score
+
+
+def match_score(
+    title: str, artist_name: str, candidate_title: str, candidate_artists: List[str]
+) -> float:
+    """
+    Similarity of a scraped track and a Spotify track between 0 and 1.
+
+    Titles are compared by the trigrams of their normalized form, so
+    "Remix" and "(Remix)" or an added "feat. X" barely matter. Titles with
+    different version markers ("Remix", "VIP", "Part 2", ...) never match.
+    When the scraped track has an artist, the share of its artist names
+    found among the candidate's artists weighs in as well.
+
+    :param title: Scraped title.
+    :param artist_name: Scraped artist, may be empty.
+    :param candidate_title: Title of the Spotify track.
+    :param candidate_artists: Artist names of the Spotify track.
+    :return: Score, 1 for an exact match.
+    """
+    title = _normalize_title(title)
+    candidate_title = _normalize_title(candidate_title)
+    return _score(
+        _trigrams(title),
+        _versions(title),
+        _artist_tokens([artist_name] if artist_name else []),
+        _trigrams(candidate_title),
+        _versions(candidate_title),
+        _artist_tokens(candidate_artists),
+    )
+
+
+class TrackIndex:
+    """
+    In-memory fuzzy index of known Spotify tracks, filled from playlist
+    reads and search results, so most scraped tracks resolve without a
+    search request.
+
+    Tracks with the same normalized title are looked up directly. Otherwise
+    the title trigrams candidates share with the query are counted through
+    an inverted index, and only candidates sharing enough of them are
+    scored with `match_score`.
+
+    :param path: Optional path of a SQLite database that keeps the index
+        between runs. Added tracks are written to it by `flush`.
+    :param min_score: Minimum score of a match.
+    :param min_title_score: Minimum score of a match for tracks scraped
+        without an artist, which are matched on their title alone.
+    """
+
+    # Trigrams in more than this many tracks, or 0.5% of them, are frequent
+    MIN_FREQUENT = 50
+
+    def __init__(
+        self, path: str = None, min_score: float = 0.8, min_title_score: float = 0.95
+    ):
+        self.path = path
+        self.min_score = min_score
+        self.min_title_score = min_title_score
+        self._tracks: Dict[str, IndexedTrack] = {}
+        self._titles: Dict[str, Set[str]] = {}
+        self._grams: Dict[str, FrozenSet[str]] = {}
+        self._versions: Dict[str, FrozenSet[str]] = {}
+        self._artists: Dict[str, FrozenSet[str]] = {}
+        self._postings: Dict[str, Set[str]] = {}
+        self._stats = {"hits": 0, "misses": 0}
+        # Rows added since the last flush
+        self._pending: List[tuple] = []
+        self._lock = threading.Lock()
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS tracks (
+                    uri TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    artists TEXT NOT NULL,
+                    release_date TEXT
+                )
+                """)
+            for uri, title, artists, release_date in self._db.execute(
+                "SELECT uri, title, artists, release_date FROM tracks"
+            ):
+                self._index(IndexedTrack(uri, title, json.loads(artists), release_date))
+            logger.info(f"Loaded {len(self._tracks)} indexed tracks")
+
+    def __len__(self) -> int:
+        return len(self._tracks)
+
+    def _index(self, track: IndexedTrack):
+        previous = self._tracks.get(track.uri)
+        if previous is not None:
+            self._titles[_normalize_title(previous.title)].discard(track.uri)
+            for gram in self._grams[track.uri]:
+                self._postings[gram].discard(track.uri)
+
+        title = _normalize_title(track.title)
+        grams = _trigrams(title)
+        self._tracks[track.uri] = track
+        self._titles.setdefault(title, set()).add(track.uri)
+        self._grams[track.uri] = grams
+        self._versions[track.uri] = _versions(title)
+        self._artists[track.uri] = _artist_tokens(track.artists)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(track.uri)
+
+    def add(
+        self,
+        uri: str,
+        title: str,
+        artists: List[str],
+        release_date: Optional[str] = None,
+    ):
+        """
+        Add or update a known Spotify track. It is indexed right away and
+        stored with the next `flush`.
+
+        :param uri: Spotify URI.
+        :param title: Track name on Spotify.
+        :param artists: Artist names.
+        :param release_date: Album release date as returned by Spotify.
+        """
+        if not uri or not title:
+            return
+
+        track = IndexedTrack(uri, title, list(artists), release_date)
+        with self._lock:
+            if self._tracks.get(uri) == track:
+                return
+            self._index(track)
+            if self._db is not None:
+                self._pending.append(
+                    (uri, title, json.dumps(track.artists), release_date)
+                )
+
+    def flush(self):
+        """
+        Store the tracks added since the last flush, in one transaction.
+        """
+        with self._lock:
+            if self._db is None or not self._pending:
+                return
+            self._db.executemany(
+                "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?)", self._pending
+            )
+            self._db.commit()
+            self._pending = []
+
+    def _best(self, grams, versions, query_artists, uris):
+        best, best_score = None, 0.0
+        for uri in uris:
+            score = _score(
+                grams,
+                versions,
+                query_artists,
+                self._grams[uri],
+                self._versions[uri],
+                self._artists[uri],
+            )
+            if score > best_score:
+                best, best_score = self._tracks[uri], score
+        return best, best_score
+
+    def _candidates(self, grams, query_artists) -> List[str]:
+        # Lowest title score that can still reach the minimum score
+        title_threshold = (
+            (self.min_score - 0.3) / 0.7 if query_artists else self.min_title_score
+        )
+
+        # Trigrams shared by a large part of the index ("mix", "ext", ...)
+        # don't tell tracks apart, candidates are picked by the rest
+        frequent = max(self.MIN_FREQUENT, len(self._tracks) // 200)
+        postings = [self._postings.get(gram, ()) for gram in grams]
+        rare = [posting for posting in postings if len(posting) <= frequent]
+        if not rare:
+            rare = sorted(postings, key=len)[:3]
+
+        shared = Counter()
+        for posting in rare:
+            shared.update(posting)
+
+        # Dice >= t needs at least t * n / (2 - t) of the n trigrams
+        required = title_threshold * len(rare) / (2 - title_threshold)
+        return [uri for uri, count in shared.items() if count >= required]
+
+    def lookup(self, title: str, artist_name: str) -> Optional[IndexedTrack]:
+        """
+        Best matching known track.
+
+        :param title: Scraped title.
+        :param artist_name: Scraped artist, may be empty.
+        :return: The best match scoring at least `min_score`, or
+            `min_title_score` without an artist, None otherwise.
+        """
+        normalized = _normalize_title(title)
+        grams = _trigrams(normalized)
+        versions = _versions(normalized)
+        query_artists = _artist_tokens([artist_name] if artist_name else [])
+        min_score = self.min_score if query_artists else self.min_title_score
+        if not normalized:
+            return None
+
+        with self._lock:
+            # Most tracks differ only in punctuation or casing, their
+            # normalized titles are equal
+            best, best_score = self._best(
+                grams, versions, query_artists, self._titles.get(normalized, ())
+            )
+            if best_score < min_score:
+                best, best_score = self._best(
+                    grams,
+                    versions,
+                    query_artists,
+                    self._candidates(grams, query_artists),
+                )
+            if best_score < min_score:
+                best = None
+
+            self._stats["hits" if best else "misses"] += 1
+
+        metrics.inc("track_index_lookups_total", result="hit" if best else "miss")
+        return best
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"tracks": len(self._tracks), **self._stats}
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
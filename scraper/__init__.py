@@ -1,3 +1,5 @@
 from scraper.base import BaseScraper
 from scraper.hardstylecom import HardstyleDotCom
 from scraper.releasehardstyle import ReleaseHardstyle
+from scraper.multi_source import MultiSourceScraper
+from scraper.backfill import Backfill, import_backfill
@@ -0,0 +1,200 @@
+import json
+import logging
+import os
+
+from contextlib import closing
+from datetime import datetime
+from itertools import islice
+from typing import Iterator, List, Optional, Set
+from scraper.base import BaseScraper
+from scraper.models import TrackData
+from scraper.seen_store import SeenStore
+from utils.concurrency import map_ordered
+from utils.files import atomic_write
+from utils.metrics import metrics
+
+logger = logging.getLogger("hardstyle_watcher.scraper.backfill")
+
+# Field names of the JSON lines, in `TrackData.to_row` order
+FIELDS = (
+    "title",
+    "artist_name",
+    "release_date",
+    "genre",
+    "spotify_uri",
+    "source",
+    "source_id",
+)
+
+
+def read_backfill(path: str) -> Iterator[TrackData]:
+    """
+    Stream the tracks of a backfill output file.
+
+    :param path: Path of the JSON lines file.
+    :return: Iterator over the tracks.
+    """
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield TrackData.from_row(tuple(record[field] for field in FIELDS))
+
+
+def import_backfill(path: str, seen_store: SeenStore, batch_size: int = 1000) -> int:
+    """
+    Store the tracks of a backfill output file in a seen store, e.g. the
+    catalog, so syncs skip them and the catalog diff covers them.
+
+    :param path: Path of the JSON lines file.
+    :param seen_store: Store the tracks are added to.
+    :param batch_size: Number of tracks stored per transaction.
+    :return: Number of tracks imported.
+    """
+    tracks = read_backfill(path)
+    imported = 0
+    while True:
+        batch = list(islice(tracks, batch_size))
+        if not batch:
+            break
+        imported += seen_store.add_many(batch)
+    logger.info(f"Imported {imported} backfilled tracks from {path}")
+    return imported
+
+
+class Backfill:
+    """
+    Scrapes a long window of releases in shards, several at a time, and
+    streams the tracks to a JSON lines file.
+
+    The scraper splits its window (from `from_date` until now) into shards,
+    see `BaseScraper.backfill_shards`. Shards run in parallel under the rate
+    limit of the scraper's host and are written in shard order. After each
+    shard a checkpoint records the shards done and the size of the output,
+    so an interrupted backfill truncates the partial shard and resumes with
+    the next one. Only the shards in flight are held in memory.
+
+    Shards are pages or list ranges, new releases shift them between runs.
+    Tracks written by the previous shard are therefore skipped when they
+    show up again.
+
+    :param scraper: Scraper to backfill, its `from_date` starts the window.
+    :param output_path: JSON lines file the tracks are appended to.
+    :param checkpoint_path: Checkpoint file, defaults to the output path
+        with a ".checkpoint" suffix.
+    :param parallel_shards: Number of shards scraped at the same time.
+    """
+
+    def __init__(
+        self,
+        scraper: BaseScraper,
+        output_path: str,
+        checkpoint_path: str = None,
+        parallel_shards: int = 4,
+    ):
+        self.scraper = scraper
+        self.output_path = output_path
+        self.checkpoint_path = checkpoint_path or f"{output_path}.checkpoint"
+        self.parallel_shards = parallel_shards
+
+    def _load_checkpoint(self) -> Optional[dict]:
+        if not os.path.exists(self.checkpoint_path):
+            return None
+
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+
+        if (
+            checkpoint["source"] != self.scraper.SOURCE
+            or checkpoint["from_date"] != self.scraper.from_date.isoformat()
+        ):
+            raise ValueError(
+                f"Checkpoint {self.checkpoint_path} belongs to a backfill of"
+                f" {checkpoint['source']} from {checkpoint['from_date']}"
+            )
+        return checkpoint
+
+    def _save_checkpoint(self, checkpoint: dict):
+        with atomic_write(self.checkpoint_path) as f:
+            json.dump(checkpoint, f)
+
+    def _previous_shard_ids(self, checkpoint: dict) -> Set[str]:
+        # Ids of the last written shard, read back from the output
+        ids = set()
+        with open(self.output_path, "rb") as f:
+            f.seek(checkpoint["previous_offset"])
+            for line in f.read(
+                checkpoint["offset"] - checkpoint["previous_offset"]
+            ).splitlines():
+                if line.strip():
+                    ids.add(json.loads(line)["source_id"])
+        return ids
+
+    def _scrape_shard(self, shard) -> List[TrackData]:
+        with metrics.span("backfill_shard"):
+            return list(self.scraper.iter_shard(shard))
+
+    def run(self) -> int:
+        """
+        Run or resume the backfill.
+
+        :return: Number of tracks written by this run.
+        """
+        checkpoint = self._load_checkpoint()
+        if checkpoint is None:
+            shards = self.scraper.backfill_shards()
+            checkpoint = {
+                "source": self.scraper.SOURCE,
+                "from_date": self.scraper.from_date.isoformat(),
+                "started_at": datetime.now().isoformat(),
+                "shards": shards,
+                "done": 0,
+                "offset": 0,
+                "previous_offset": 0,
+            }
+            # Start from an empty output
+            open(self.output_path, "w").close()
+            self._save_checkpoint(checkpoint)
+            previous_ids = set()
+        else:
+            logger.info(
+                f"Resuming backfill at shard {checkpoint['done']} of"
+                f" {len(checkpoint['shards'])}"
+            )
+            # Drop the lines of a shard that was not checkpointed
+            with open(self.output_path, "ab") as f:
+                f.truncate(checkpoint["offset"])
+            previous_ids = self._previous_shard_ids(checkpoint)
+
+        shards = checkpoint["shards"][checkpoint["done"] :]
+        logger.info(f"Backfilling {len(shards)} shards of {self.scraper.SOURCE}")
+
+        written = 0
+        with open(self.output_path, "ab") as output, closing(
+            map_ordered(self._scrape_shard, shards, max_workers=self.parallel_shards)
+        ) as results:
+            for tracks in results:
+                shard_ids = set()
+                for track in tracks:
+                    if track.source_id in previous_ids or track.source_id in shard_ids:
+                        continue
+                    shard_ids.add(track.source_id)
+                    record = dict(zip(FIELDS, track.to_row()))
+                    output.write(json.dumps(record).encode() + b"\n")
+                output.flush()
+                os.fsync(output.fileno())
+                written += len(shard_ids)
+                previous_ids = shard_ids
+
+                checkpoint["done"] += 1
+                checkpoint["previous_offset"] = checkpoint["offset"]
+                checkpoint["offset"] = output.tell()
+                self._save_checkpoint(checkpoint)
+                metrics.inc("backfill_shards_total", source=self.scraper.SOURCE)
+                logger.info(
+                    f"Backfilled shard {checkpoint['done']} of"
+                    f" {len(checkpoint['shards'])}, {len(shard_ids)} tracks"
+                )
+
+        logger.info(f"Backfill of {self.scraper.SOURCE} complete, {written} tracks")
+        return written
@@ -1,15 +1,86 @@
 from abc import ABC, abstractmethod
-from datetime import datetime
-from typing import List
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Tuple
+from urllib.parse import urlparse
 from scraper.models import TrackData
+from scraper.seen_store import SeenStore
+from utils.rate_limit import rate_limiter
 
 
 class BaseScraper(ABC):
 
+    BASE_URL: str
+    SOURCE: str
+    # Window of releases a sync looks at, counted back from now
+    SYNC_WINDOW: timedelta
+    # (URL regex, seconds) pairs used by the HTTP response cache
+    CACHE_TTLS: List[Tuple[str, float]] = []
     from_date: datetime
+    max_workers: int
+    seen_store: SeenStore
+    known_block: int
 
-    def __init__(self, from_date: datetime):
+    def __init__(
+        self,
+        from_date: datetime,
+        max_workers: int = 4,
+        requests_per_second: float = 2.0,
+        max_in_flight: int = 4,
+        seen_store: SeenStore = None,
+        known_block: int = 5,
+    ):
         self.from_date = from_date
+        self.max_workers = max_workers
+
+        # Incremental mode: releases in the store are not fetched again and
+        # scanning stops after `known_block` consecutive known releases
+        self.seen_store = seen_store
+        self.known_block = known_block
+
+        # Politeness is enforced per host by the shared rate limiter,
+        # detail pages are fetched by up to `max_workers` threads
+        rate_limiter.configure(
+            urlparse(self.BASE_URL).netloc,
+            requests_per_second=requests_per_second,
+            max_in_flight=max_in_flight,
+        )
+
+    def _known_tracks(self, source_ids: Iterable[str]) -> Dict[str, TrackData]:
+        if self.seen_store is None:
+            return {}
+        return self.seen_store.get_many(self.SOURCE, source_ids)
+
+    def _known_tracks_in_window(self) -> List[TrackData]:
+        if self.seen_store is None:
+            return []
+        return self.seen_store.since(self.SOURCE, self.from_date)
+
+    def _remember(self, track: TrackData):
+        if self.seen_store is not None:
+            self.seen_store.add(track)
+
+    def iter_tracks(self) -> Iterator[TrackData]:
+        """
+        Stream the tracks as soon as they are parsed. May contain duplicates,
+        scrapers that can stream override this.
+        """
+        yield from self.fetch_tracks()
+
+    def backfill_shards(self) -> List:
+        """
+        Split the window into shards that can be scraped independently and
+        in parallel, newest first. Shards must be JSON serializable, they are
+        stored in the backfill checkpoint.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support backfills")
+
+    def iter_shard(self, shard) -> Iterator[TrackData]:
+        """
+        Stream the tracks of a shard that fall within the window.
+
+        :param shard: Shard as returned by `backfill_shards`.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support backfills")
 
     @abstractmethod
     def fetch_tracks(self) -> List[TrackData]:
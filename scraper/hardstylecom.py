@@ -1,12 +1,13 @@
 import logging
-import requests
-import time
 
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
 from scraper import BaseScraper
-from typing import List
+from typing import Dict, Generator, Iterator, List, Optional, Tuple
 from scraper.models import TrackData
 from datetime import datetime, timedelta
+from contextlib import closing
+from utils.concurrency import map_ordered
+from utils.parsing import parse_html
 from utils.utils import web_request
 
 logger = logging.getLogger("hardstyle_watcher.scraper.hardstylecom")
@@ -15,11 +16,29 @@ logger = logging.getLogger("hardstyle_watcher.scraper.hardstylecom")
 class HardstyleDotCom(BaseScraper):
 
     BASE_URL = "https://hardstyle.com/en/tracks"
+    SOURCE = "hardstylecom"
+    SYNC_WINDOW = timedelta(days=7)
+    # Only the nodes the scraper reads are built
+    LIST_STRAINER = SoupStrainer("div", class_="trackContent")
+    DETAIL_STRAINER = SoupStrainer("span", class_="date")
+    # Upper bound of the page search
+    MAX_PAGES = 100
+    # Per run memo of the list pages and release dates, shared by the
+    # page search and the scan
+    _list_pages: Dict[int, list]
+    _release_dates: Dict[str, datetime]
+    CACHE_TTLS = [
+        (r"hardstyle\.com/en/tracks\?", 10 * 60),
+        # Track details hardly change once published
+        (r"hardstyle\.com/", 30 * 24 * 3600),
+    ]
 
-    def _before_from_date(self, date_str: str) -> bool:
-        # Convert the date string to a datetime object
-        date_obj = datetime.strptime(date_str, "%d.%m.%Y")
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._list_pages = {}
+        self._release_dates = {}
 
+    def _before_from_date(self, date_obj: datetime) -> bool:
         # Check if the date is before from_date
         return date_obj < self.from_date
 
@@ -31,71 +50,218 @@ class HardstyleDotCom(BaseScraper):
 
         return track.find("span", class_="artists").text
 
-    def _extract_tracks_out_of_list(self, track_soup):
-        track_data = []
-        web = requests.Session()
+    def _fetch_release_date(self, track_detail_url: str) -> datetime:
+        # Extract the release date out of the track details
+        response_track_detail = web_request(
+            f"https://hardstyle.com{track_detail_url}", endpoint="detail_page"
+        )
+        soup_track_detail = parse_html(
+            response_track_detail.content, parse_only=self.DETAIL_STRAINER
+        )
+        release_date_str = soup_track_detail.find("span", class_="date").text
+        return datetime.strptime(release_date_str, "%d.%m.%Y")
 
-        for track in track_soup:
-            time.sleep(1)
-            track_object = TrackData()
+    def _list_release_date(self, track) -> Optional[datetime]:
+        # List layouts that show the release date save the detail request
+        node = track.find("span", class_="date")
+        if node is None:
+            return None
+        try:
+            return datetime.strptime(node.text.strip(), "%d.%m.%Y")
+        except ValueError:
+            return None
 
-            track_node = track.find_all("a", class_="linkTitle")
-            track_detail_url = track_node[0].get("href")
+    def _release_date(self, track, known: Dict[str, TrackData]) -> datetime:
+        detail_url = track.find("a", class_="linkTitle").get("href")
+        if detail_url in known:
+            return known[detail_url].release_date
 
-            # 1. Extract the release date out of the track details
-            print(f"https://hardstyle.com{track_detail_url}")
-            response_track_detail = web_request(
-                f"https://hardstyle.com{track_detail_url}"
+        if detail_url not in self._release_dates:
+            self._release_dates[detail_url] = self._list_release_date(
+                track
+            ) or self._fetch_release_date(detail_url)
+        return self._release_dates[detail_url]
+
+    def _fetch_list_page(self, page: int) -> list:
+        if page not in self._list_pages:
+            logger.info(f"Fetching tracks, page {page}")
+            try:
+                response = web_request(
+                    f"{self.BASE_URL}?page={page}&genre=Hardstyle",
+                    endpoint="list_page",
+                )
+            except Exception as e:
+                logger.warning("Error fetching tracks. Exiting...")
+                raise Exception(f"Error fetching tracks: {e}")
+
+            soup_track_list = parse_html(
+                response.content, parse_only=self.LIST_STRAINER
             )
-            soup_track_detail = BeautifulSoup(
-                response_track_detail.content, "html.parser"
+            self._list_pages[page] = soup_track_list.find_all(
+                "div", class_="trackContent"
             )
-            release_date_str = soup_track_detail.find("span", class_="date").text
+        return self._list_pages[page]
 
-            # 2. Exclude track if it's before the from_date
-            if self._before_from_date(release_date_str):
-                continue
+    def _page_in_window(self, page: int) -> bool:
+        # Pages list the newest releases first, once the first track of a
+        # page is older than from_date, so are the page and all after it
+        tracks = self._fetch_list_page(page)
+        if not tracks:
+            return False
 
-            # 3. Extract track details
-            title = track_node[0].get("title")
-            mix_type = track_node[1].get("title")
-            if "remix" not in mix_type.lower():
-                mix_type = ""
+        detail_url = tracks[0].find("a", class_="linkTitle").get("href")
+        release_date = self._release_date(tracks[0], self._known_tracks([detail_url]))
+        return not self._before_from_date(release_date)
 
-            artist = self._extract_artist(track)
+    def _last_page_in_window(self) -> int:
+        """
+        Find the last page holding releases of the window, probing only the
+        first track of a page. Gallops over pages 2, 4, 8, ... until a page
+        is outside the window, then binary searches the pages in between.
+        Page 1 is known to be within the window.
 
-            track_object.title = f"{title} {mix_type}" if mix_type else title
-            track_object.artist_name = artist
+        :return: Number of the last page within the window.
+        """
+        inside, outside = 1, self.MAX_PAGES + 1
+        page = 2
+        while page <= self.MAX_PAGES:
+            if not self._page_in_window(page):
+                outside = page
+                break
+            inside = page
+            page *= 2
 
-            track_data.append(track_object)
+        while outside - inside > 1:
+            page = (inside + outside) // 2
+            if self._page_in_window(page):
+                inside = page
+            else:
+                outside = page
 
-        return track_data
+        return inside
 
-    def fetch_tracks(self) -> List[TrackData]:
-        track_data = []
-        web = requests.Session()
+    def _extract_tracks_out_of_list(
+        self, track_soup
+    ) -> Generator[TrackData, None, Tuple[bool, bool]]:
+        """
+        Parse a list page, yielding the tracks within the window.
+
+        :return: Whether the page ended in a block of releases known from
+            earlier runs, and whether it reached a release older than
+            from_date.
+        """
+        track_nodes = [track.find_all("a", class_="linkTitle") for track in track_soup]
+        detail_urls = [track_node[0].get("href") for track_node in track_nodes]
+        known = self._known_tracks(detail_urls)
+
+        # 1. Fetch the release dates concurrently, results keep the list
+        # order, fetches queued behind the first old release are cancelled
+        consecutive_known = 0
+        with closing(
+            map_ordered(
+                lambda track: self._release_date(track, known),
+                track_soup,
+                max_workers=self.max_workers,
+            )
+        ) as release_dates:
+            for track, track_node, detail_url, release_date in zip(
+                track_soup, track_nodes, detail_urls, release_dates
+            ):
+                # 2. Releases are listed newest first, the rest is older
+                if self._before_from_date(release_date):
+                    return consecutive_known >= self.known_block, True
+
+                if detail_url in known:
+                    consecutive_known += 1
+                    track_object = known[detail_url]
+                else:
+                    consecutive_known = 0
+
+                    # 3. Extract track details
+                    title = track_node[0].get("title")
+                    mix_type = track_node[1].get("title")
+                    if "remix" not in mix_type.lower():
+                        mix_type = ""
+
+                    track_object = TrackData(
+                        track_name=f"{title} {mix_type}" if mix_type else title,
+                        artist_name=self._extract_artist(track),
+                        track_date=release_date,
+                        source=self.SOURCE,
+                        source_id=detail_url,
+                    )
+                    self._remember(track_object)
 
+                yield track_object
+
+        return consecutive_known >= self.known_block, False
+
+    def iter_tracks(self) -> Iterator[TrackData]:
         logger.info("Fetching tracks...")
-        for i in range(1, 5):
-            time.sleep(0.5)
-            logger.info(f"Fetching tracks, page {i}")
+        self._list_pages = {}
+        self._release_dates = {}
 
-            # 1. Retrieve track list
-            try:
-                response = web_request(f"{self.BASE_URL}?page={i}&genre=Hardstyle")
-            except Exception as e:
-                logger.warning("Error fetching tracks. Exiting...")
-                raise Exception(f"Error fetching tracks: {e}")
+        # 1. A short window usually ends on the first page
+        reached_known, reached_cutoff = yield from self._extract_tracks_out_of_list(
+            self._fetch_list_page(1)
+        )
+
+        # 2. For longer windows find the last page first, then walk the
+        # pages up to it with the next list page fetched ahead
+        if not (reached_known or reached_cutoff):
+            last_page = self._last_page_in_window()
+            logger.info(f"Window ends on page {last_page}")
+            with closing(
+                map_ordered(
+                    self._fetch_list_page, range(2, last_page + 1), max_workers=2
+                )
+            ) as pages:
+                for track_list in pages:
+                    reached_known, reached_cutoff = (
+                        yield from self._extract_tracks_out_of_list(track_list)
+                    )
+                    if reached_known or reached_cutoff:
+                        break
 
-            soup_track_list = BeautifulSoup(response.content, "html.parser")
-            track_list = soup_track_list.find_all("div", class_="trackContent")
+        # Later pages were processed by an earlier run, take the rest
+        # of the window from the store
+        if reached_known:
+            logger.info("Reached known tracks, using stored ones")
+            yield from self._known_tracks_in_window()
 
-            # 2. Parse track list
-            tracks: List[TrackData] = self._extract_tracks_out_of_list(track_list)
-            track_data.extend(tracks)
+    def backfill_shards(self) -> List[int]:
+        """
+        One shard per list page of the window.
+        """
+        self._list_pages = {}
+        self._release_dates = {}
+        if not self._page_in_window(1):
+            return []
 
-        # 3. Remove duplicate tracks
-        track_data = list(set(track_data))
+        last_page = self._last_page_in_window()
+        # Probed pages past the window are not needed anymore
+        self._list_pages = {
+            page: tracks
+            for page, tracks in self._list_pages.items()
+            if page <= last_page
+        }
+        return list(range(1, last_page + 1))
+
+    def iter_shard(self, page: int) -> Iterator[TrackData]:
+        track_list = self._fetch_list_page(page)
+        # Keep memory flat over long backfills, the page is scraped only once
+        self._list_pages.pop(page, None)
+
+        yield from self._extract_tracks_out_of_list(track_list)
+
+        for track in track_list:
+            self._release_dates.pop(
+                track.find("a", class_="linkTitle").get("href"), None
+            )
+
+    def fetch_tracks(self) -> List[TrackData]:
+        # Remove duplicate tracks
+        track_data = list(set(self.iter_tracks()))
 
         logger.info(f"Fetched a total of {len(track_data)} entries from hardstyle.com")
 
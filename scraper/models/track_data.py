@@ -1,5 +1,7 @@
 from datetime import datetime
 from enum import Enum
+from typing import Optional, Tuple
+from utils.normalize import normalize_query
 
 
 class Genre(Enum):
@@ -8,22 +10,140 @@ class Genre(Enum):
     Hardcore = 2
 
 
+# Constructor arguments named differently from the attribute they set
+_CONSTRUCTOR_ARGS = {"title": "track_name", "release_date": "track_date"}
+
+
 class TrackData:
+    """
+    Immutable record of a scraped release.
+
+    Equality and hashing use `key`, the normalized title and artist computed
+    on first use and kept, so large sets and diffs don't rebuild tuples and
+    tracks that are never compared don't carry it. Use `replace` to derive
+    a changed copy.
+    """
+
+    __slots__ = (
+        "title",
+        "artist_name",
+        "release_date",
+        "genre",
+        "spotify_uri",
+        # Name of the scraper and the stable id of the track within it
+        "source",
+        "source_id",
+        "_key",
+    )
 
-    spotify_uri: str = None
     title: str
     artist_name: str
     release_date: datetime
-    genre: Genre = Genre.Hardstyle
+    genre: Genre
+    spotify_uri: Optional[str]
+    source: Optional[str]
+    source_id: Optional[str]
+
+    def __init__(
+        self,
+        track_name=None,
+        artist_name=None,
+        track_date=None,
+        genre=None,
+        spotify_uri=None,
+        source=None,
+        source_id=None,
+    ):
+        _set = object.__setattr__
+        _set(self, "title", track_name)
+        _set(self, "artist_name", artist_name)
+        _set(self, "release_date", track_date)
+        _set(self, "genre", genre)
+        _set(self, "spotify_uri", spotify_uri)
+        _set(self, "source", source)
+        _set(self, "source_id", source_id)
+
+    @property
+    def key(self) -> str:
+        try:
+            return self._key
+        except AttributeError:
+            key = normalize_query(self.title, self.artist_name)
+            object.__setattr__(self, "_key", key)
+            return key
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
 
-    def __init__(self, track_name=None, artist_name=None, track_date=None, genre=None):
-        self.title: str = track_name
-        self.artist_name: str = artist_name
-        self.release_date: datetime = track_date
-        self.genre: Genre = genre
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
 
     def __hash__(self) -> int:
-        return hash((self.title, self.artist_name))
+        # str caches its hash, so this is computed once per track
+        return hash(self.key)
 
     def __eq__(self, other) -> bool:
-        return self.title == other.title and self.artist_name == other.artist_name
+        if not isinstance(other, TrackData):
+            return NotImplemented
+        return self.key == other.key
+
+    def __repr__(self) -> str:
+        return (
+            f"TrackData(title={self.title!r}, artist_name={self.artist_name!r},"
+            f" release_date={self.release_date!r}, source={self.source!r},"
+            f" source_id={self.source_id!r}, spotify_uri={self.spotify_uri!r})"
+        )
+
+    def __reduce__(self):
+        return TrackData.from_row, (self.to_row(),)
+
+    def replace(self, **changes) -> "TrackData":
+        """
+        Copy of the track with the given fields changed.
+
+        :param changes: Field names and their new values.
+        :return: New track.
+        """
+        fields = {
+            "track_name": self.title,
+            "artist_name": self.artist_name,
+            "track_date": self.release_date,
+            "genre": self.genre,
+            "spotify_uri": self.spotify_uri,
+            "source": self.source,
+            "source_id": self.source_id,
+        }
+        for name, value in changes.items():
+            fields[_CONSTRUCTOR_ARGS.get(name, name)] = value
+        return TrackData(**fields)
+
+    def to_row(self) -> Tuple:
+        """
+        Plain tuple of the fields, dates as ISO strings and the genre as its
+        value, suitable for SQLite rows, JSON and pickling.
+        """
+        return (
+            self.title,
+            self.artist_name,
+            self.release_date.isoformat() if self.release_date else None,
+            self.genre.value if self.genre is not None else None,
+            self.spotify_uri,
+            self.source,
+            self.source_id,
+        )
+
+    @classmethod
+    def from_row(cls, row) -> "TrackData":
+        """
+        Inverse of `to_row`.
+        """
+        title, artist_name, release_date, genre, spotify_uri, source, source_id = row
+        return cls(
+            track_name=title,
+            artist_name=artist_name,
+            track_date=datetime.fromisoformat(release_date) if release_date else None,
+            genre=Genre(genre) if genre is not None else None,
+            spotify_uri=spotify_uri,
+            source=source,
+            source_id=source_id,
+        )
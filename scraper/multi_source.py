@@ -0,0 +1,178 @@
+import logging
+import queue
+import threading
+
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from scraper.base import BaseScraper
+from scraper.models import TrackData
+from utils.metrics import metrics
+from utils.normalize import normalize_text
+
+logger = logging.getLogger("hardstyle_watcher.scraper.multi_source")
+
+# Marks the end of a scraper's stream on the queue
+_DONE = object()
+
+
+def _variants(track: TrackData) -> List[Tuple[str, str]]:
+    """
+    Normalized (title, artist) pairs a track may be known by. Sources
+    without an artist field (releasehardstyle.nl) put "Artist - Title" in the
+    title.
+    """
+    title = normalize_text(track.title)
+    artist = normalize_text(track.artist_name)
+    variants = [(title, artist)]
+    if not artist and " - " in (track.title or ""):
+        artist_part, title_part = track.title.split(" - ", 1)
+        variants.append((normalize_text(title_part), normalize_text(artist_part)))
+    return variants
+
+
+class _Releases:
+    """
+    Tracks emitted so far by normalized title. Tracks are the same release
+    when their titles are equal and their artists match or one is unknown.
+    """
+
+    def __init__(self):
+        self._by_title: Dict[str, List[Tuple[str, TrackData]]] = {}
+
+    def find(self, track: TrackData) -> Optional[TrackData]:
+        for title, artist in _variants(track):
+            for other_artist, other in self._by_title.get(title, ()):
+                if not artist or not other_artist or artist == other_artist:
+                    return other
+        return None
+
+    def add(self, track: TrackData):
+        for title, artist in _variants(track):
+            self._by_title.setdefault(title, []).append((artist, track))
+
+
+class MultiSourceScraper:
+    """
+    Runs several scrapers concurrently and merges their tracks into one
+    stream, without duplicates across sources.
+
+    Each scraper runs in its own thread under the rate limit of its host.
+    Tracks are the same release when their normalized titles are equal and
+    their artists match or one of them is unknown. Of duplicates the record
+    carrying a `spotify_uri` wins, so it needs no search.
+
+    :param scrapers: Scrapers to run.
+    :param queue_size: Capacity of the queue the scrapers feed.
+    """
+
+    def __init__(self, scrapers: Sequence[BaseScraper], queue_size: int = 100):
+        self.scrapers = list(scrapers)
+        self.queue_size = queue_size
+
+    def _produce(
+        self,
+        scraper: BaseScraper,
+        tracks: "queue.Queue",
+        stop: threading.Event,
+        errors: Dict[str, Exception],
+    ):
+        def put(entry):
+            # Give up once the consumer stopped reading
+            while not stop.is_set():
+                try:
+                    tracks.put(entry, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            for track in scraper.iter_tracks():
+                if not put(track):
+                    return
+        except Exception as e:
+            logger.warning(f"Scraper {scraper.SOURCE} failed: {e}")
+            metrics.inc("scraper_failures_total", source=scraper.SOURCE)
+            errors[scraper.SOURCE] = e
+        finally:
+            put(_DONE)
+
+    def iter_releases(self) -> Iterator[Tuple[TrackData, Optional[TrackData]]]:
+        """
+        Stream the tracks of all scrapers as they are parsed, with the
+        already emitted record each one supersedes.
+
+        Duplicates are dropped, unless the duplicate carries a `spotify_uri`
+        the emitted record lacks. It is emitted then, paired with the record
+        it replaces, which consumers drop.
+
+        :return: Iterator of (track, superseded track or None) pairs.
+        """
+        tracks = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors = {}
+        threads = [
+            threading.Thread(
+                target=self._produce,
+                args=(scraper, tracks, stop, errors),
+                name=f"scraper-{scraper.SOURCE}",
+                daemon=True,
+            )
+            for scraper in self.scrapers
+        ]
+        for thread in threads:
+            thread.start()
+
+        releases = _Releases()
+        running = len(threads)
+        try:
+            while running:
+                track = tracks.get()
+                if track is _DONE:
+                    running -= 1
+                    continue
+
+                other = releases.find(track)
+                if other is not None and (other.spotify_uri or not track.spotify_uri):
+                    metrics.inc("scraper_duplicates_total", source=track.source)
+                    continue
+
+                releases.add(track)
+                # The record carrying a spotify_uri supersedes the other one
+                yield track, other
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        if errors and len(errors) == len(self.scrapers):
+            raise Exception(f"All scrapers failed: {errors}")
+
+    def iter_tracks(self) -> Iterator[TrackData]:
+        """
+        Stream the tracks of all scrapers as they are parsed.
+
+        Duplicates are dropped, unless the duplicate carries a `spotify_uri`
+        the already emitted record lacks. It is emitted as well then, as it
+        resolves without a search, so both records of the release come out.
+        Consumers that keep the tracks use `iter_releases` or `fetch_tracks`.
+        """
+        for track, _ in self.iter_releases():
+            yield track
+
+    def fetch_tracks(self) -> List[TrackData]:
+        """
+        Tracks of all scrapers, one record per release.
+        """
+        # Keyed by identity, superseded records are removed in place
+        merged = {}
+        for track, superseded in self.iter_releases():
+            if superseded is not None:
+                merged.pop(id(superseded), None)
+            merged[id(track)] = track
+
+        track_data = list(merged.values())
+        logger.info(
+            f"Fetched a total of {len(track_data)} entries from"
+            f" {len(self.scrapers)} sources"
+        )
+        return track_data
@@ -1,12 +1,13 @@
 import logging
-import requests
-import time
 
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
 from scraper import BaseScraper
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 from scraper.models import TrackData
 from datetime import datetime, timedelta
+from contextlib import closing
+from utils.concurrency import map_ordered
+from utils.parsing import parse_html
 from utils.utils import web_request
 
 logger = logging.getLogger("hardstyle_watcher.scraper.releasehardstyle")
@@ -16,6 +17,22 @@ class ReleaseHardstyle(BaseScraper):
     """https://releasehardstyle.nl/releases/"""
 
     BASE_URL = "https://releasehardstyle.nl/releases/"
+    SOURCE = "releasehardstyle"
+    SYNC_WINDOW = timedelta(days=2)
+    # Only the nodes the scraper reads are built
+    LIST_STRAINER = SoupStrainer("div", class_="releasetracker-list-container")
+    DETAIL_STRAINER = SoupStrainer(
+        "div", class_="releasetracker_details-info_container-inner"
+    )
+    # List entries per backfill shard
+    SHARD_SIZE = 50
+    # List entries of a backfill, read once
+    _entries: Optional[List[Tuple[str, str]]] = None
+    CACHE_TTLS = [
+        # Release details hardly change once published
+        (r"releasehardstyle\.nl/release/", 30 * 24 * 3600),
+        (r"releasehardstyle\.nl/releases/", 10 * 60),
+    ]
 
     def _before_from_date(self, date_obj: datetime) -> bool:
         # Check if the date is before from_date
@@ -29,77 +46,156 @@ class ReleaseHardstyle(BaseScraper):
 
         return track.find("span", class_="artists").text
 
-    def _extract_tracks_out_of_list(self, track_soup):
-        track_data = []
-        web = requests.Session()
-        print(len(track_soup))
-        for track in track_soup:
-            time.sleep(1)
-            track_object = TrackData()
+    def _fetch_track_detail(self, entry) -> TrackData:
+        track_id, spotify_uri = entry
 
-            track_id = track.get("targetid")
-
-            spotify_uri = track.find(id="releasetracker-a").get("href").split("/")[-1]
-
-            # 1. Extract the release date out of the track details
-            response_track_detail = web_request(
-                f"https://releasehardstyle.nl/release/{track_id}/"
-            )
-            soup_track_detail = BeautifulSoup(
-                response_track_detail.content, "html.parser"
-            )
-
-            text_content = soup_track_detail.find(
-                "div", class_="releasetracker_details-info_container-inner"
-            ).get_text(separator="\n")
-
-            # Extract the title and release date using simple string operations
-            lines = text_content.split("\n")
-            title_line = next(line for line in lines if "Title:" in line)
-            release_date_line = next(line for line in lines if "Release date:" in line)
-
-            # Clean up the extracted lines to get the desired values
-            title = title_line.replace("Title:", "").strip()
-            release_date = release_date_line.replace("Release date:", "").strip()
-
-            # 2. Exclude track if it's before the from_date
-            track_object.spotify_uri = spotify_uri
-            track_object.title = title
-            track_object.artist_name = ""
-            track_object.release_date = datetime.strptime(release_date, "%d %b %Y")
-
-            if self._before_from_date(track_object.release_date):
-                break
+        # 1. Extract the release date out of the track details
+        response_track_detail = web_request(
+            f"https://releasehardstyle.nl/release/{track_id}/", endpoint="detail_page"
+        )
+        soup_track_detail = parse_html(
+            response_track_detail.content, parse_only=self.DETAIL_STRAINER
+        )
 
-            logger.info(
-                f"Retrieved track: {track_object.title}, {track_object.release_date}"
-            )
-            track_data.append(track_object)
-        return track_data
+        text_content = soup_track_detail.find(
+            "div", class_="releasetracker_details-info_container-inner"
+        ).get_text(separator="\n")
+
+        # Extract the title and release date using simple string operations
+        lines = text_content.split("\n")
+        title_line = next(line for line in lines if "Title:" in line)
+        release_date_line = next(line for line in lines if "Release date:" in line)
+
+        # Clean up the extracted lines to get the desired values
+        title = title_line.replace("Title:", "").strip()
+        release_date = release_date_line.replace("Release date:", "").strip()
+
+        return TrackData(
+            track_name=title,
+            artist_name="",
+            track_date=datetime.strptime(release_date, "%d %b %Y"),
+            spotify_uri=spotify_uri,
+            source=self.SOURCE,
+            source_id=track_id,
+        )
 
-    def fetch_tracks(self) -> List[TrackData]:
-        track_data = []
-        logger.info("Fetching tracks...")
+    def _fetch_list_entries(self) -> List[Tuple[str, str]]:
         # 1. Retrieve track list
         try:
-            response = web_request(self.BASE_URL)
+            response = web_request(self.BASE_URL, endpoint="list_page")
         except Exception as e:
             logger.warning("Error fetching tracks. Exiting...")
             raise Exception(f"Error fetching tracks: {e}")
 
-        soup_track_list = BeautifulSoup(response.content, "html.parser")
+        soup_track_list = parse_html(response.content, parse_only=self.LIST_STRAINER)
         track_divs = soup_track_list.find_all(
             "div", class_="releasetracker-list-container"
         )
 
         track_list = track_divs[1].find_all("div", class_="releasetracker-list-entry")
+        logger.info(f"Found {len(track_list)} list entries")
 
+        # (targetid, Spotify URI) of every entry, newest first
+        entries = []
+        for track in track_list:
+            track_id = track.get("targetid")
+            spotify_uri = track.find(id="releasetracker-a").get("href").split("/")[-1]
+            entries.append((track_id, spotify_uri))
+        return entries
+
+    def _extract_tracks_out_of_list(
+        self, entries: List[Tuple[str, str]]
+    ) -> Iterator[TrackData]:
+        known = self._known_tracks(track_id for track_id, _ in entries)
+
+        def _track_for_entry(entry):
+            return known.get(entry[0]) or self._fetch_track_detail(entry)
+
+        # Details are fetched concurrently but consumed in list order,
+        # so the first release older than from_date still ends the scan
+        # and cancels the fetches queued behind it
+        consecutive_known = 0
+        with closing(
+            map_ordered(_track_for_entry, entries, max_workers=self.max_workers)
+        ) as track_objects:
+            for (track_id, _), track_object in zip(entries, track_objects):
+                if track_id in known:
+                    consecutive_known += 1
+                else:
+                    consecutive_known = 0
+                    self._remember(track_object)
+
+                # 2. Exclude track if it's before the from_date
+                if self._before_from_date(track_object.release_date):
+                    break
+
+                logger.info(
+                    f"Retrieved track: {track_object.title}, {track_object.release_date}"
+                )
+                yield track_object
+
+                # 3. Everything past a block of known releases was processed
+                # by an earlier run, take the rest of the window from the store
+                if consecutive_known >= self.known_block:
+                    logger.info("Reached known releases, using stored ones")
+                    yield from self._known_tracks_in_window()
+                    break
+
+    def iter_tracks(self) -> Iterator[TrackData]:
+        logger.info("Fetching tracks...")
         # 2. Parse track list
-        tracks: List[TrackData] = self._extract_tracks_out_of_list(track_list)
-        track_data.extend(tracks)
+        yield from self._extract_tracks_out_of_list(self._fetch_list_entries())
+
+    def backfill_shards(self) -> List[List[int]]:
+        """
+        Ranges of `SHARD_SIZE` list entries. The entry where the window ends
+        is binary searched, probing the release date of single entries.
+        """
+        self._entries = self._fetch_list_entries()
+
+        # Entries are listed newest first
+        low, high = 0, len(self._entries)
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._entries[middle]
+            track = self._known_tracks([entry[0]]).get(entry[0])
+            if track is None:
+                track = self._fetch_track_detail(entry)
+            if self._before_from_date(track.release_date):
+                high = middle
+            else:
+                low = middle + 1
+
+        return [
+            [start, min(start + self.SHARD_SIZE, low)]
+            for start in range(0, low, self.SHARD_SIZE)
+        ]
+
+    def iter_shard(self, shard: List[int]) -> Iterator[TrackData]:
+        # Resumed backfills read the list again, benign if two shards race
+        if self._entries is None:
+            self._entries = self._fetch_list_entries()
+
+        start, end = shard
+        entries = self._entries[start:end]
+        known = self._known_tracks(track_id for track_id, _ in entries)
+
+        with closing(
+            map_ordered(
+                lambda entry: known.get(entry[0]) or self._fetch_track_detail(entry),
+                entries,
+                max_workers=self.max_workers,
+            )
+        ) as track_objects:
+            for (track_id, _), track_object in zip(entries, track_objects):
+                if track_id not in known:
+                    self._remember(track_object)
+                if not self._before_from_date(track_object.release_date):
+                    yield track_object
 
-        # 3. Remove duplicate tracks
-        track_data = list(set(track_data))
+    def fetch_tracks(self) -> List[TrackData]:
+        # Remove duplicate tracks
+        track_data = list(set(self.iter_tracks()))
 
         logger.info(
             f"Fetched a total of {len(track_data)} entries from releasehardstyle.nl"
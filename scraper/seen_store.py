@@ -0,0 +1,214 @@
+import logging
+import sqlite3
+import threading
+import time
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from scraper.models import TrackData
+from utils.normalize import release_key
+
+logger = logging.getLogger("hardstyle_watcher.scraper.seen_store")
+
+# Insert of a parsed track, the resolution of a known one is kept when the
+# new record has none
+_UPSERT = """
+    INSERT INTO seen VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (source, source_id) DO UPDATE SET
+        title = excluded.title,
+        artist_name = excluded.artist_name,
+        release_date = excluded.release_date,
+        spotify_uri = COALESCE(excluded.spotify_uri, seen.spotify_uri),
+        key = excluded.key,
+        release_key = excluded.release_key,
+        -- Known records are emitted again with their stored URI
+        linked = CASE
+            WHEN excluded.spotify_uri IS NULL
+                OR excluded.spotify_uri = seen.spotify_uri
+            THEN seen.linked
+            ELSE excluded.linked
+        END,
+        spotify_release_date = CASE
+            WHEN excluded.spotify_uri IS NULL
+                OR excluded.spotify_uri = seen.spotify_uri
+            THEN COALESCE(
+                excluded.spotify_release_date, seen.spotify_release_date
+            )
+            ELSE excluded.spotify_release_date
+        END
+"""
+
+
+class SeenStore:
+    """
+    Persistent record of the releases earlier runs already processed, keyed
+    by the stable id each source exposes (a targetid, a detail href, ...).
+
+    Scrapers use it to skip the detail pages of known releases and to stop
+    scanning once they reach a block of known ids. What a release resolved
+    to on Spotify is kept with it, see `Catalog` for the queries on top.
+
+    :param path: Path of the SQLite database.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS seen (
+                source TEXT NOT NULL,
+                source_id TEXT NOT NULL,
+                title TEXT,
+                artist_name TEXT,
+                release_date TEXT,
+                spotify_uri TEXT,
+                seen_at REAL NOT NULL,
+                key TEXT,
+                -- Same for the records of a release on different sources
+                release_key TEXT,
+                spotify_release_date TEXT,
+                -- Whether spotify_uri was linked by the scraped page rather
+                -- than found by a search
+                linked INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (source, source_id)
+            );
+            CREATE INDEX IF NOT EXISTS seen_release_date
+                ON seen (source, release_date);
+            CREATE INDEX IF NOT EXISTS seen_key ON seen (key);
+            CREATE INDEX IF NOT EXISTS seen_spotify_uri ON seen (spotify_uri);
+            CREATE INDEX IF NOT EXISTS seen_release_key ON seen (release_key);
+            """)
+
+    @staticmethod
+    def _to_track(source: str, row) -> TrackData:
+        source_id, title, artist_name, release_date, spotify_uri = row
+        return TrackData(
+            track_name=title,
+            artist_name=artist_name,
+            track_date=datetime.fromisoformat(release_date) if release_date else None,
+            spotify_uri=spotify_uri,
+            source=source,
+            source_id=source_id,
+        )
+
+    def get_many(self, source: str, source_ids: Iterable[str]) -> Dict[str, TrackData]:
+        """
+        Look up the stored records of the given ids.
+
+        :param source: Name of the scraper source.
+        :param source_ids: Ids to look up.
+        :return: Mapping of the known ids to their stored track.
+        """
+        source_ids = list(source_ids)
+        known = {}
+        with self._lock:
+            # Stay well below SQLite's bound parameter limit
+            for i in range(0, len(source_ids), 500):
+                chunk = source_ids[i : i + 500]
+                rows = self._db.execute(
+                    "SELECT source_id, title, artist_name, release_date, spotify_uri"
+                    f" FROM seen WHERE source = ? AND source_id IN ({','.join('?' * len(chunk))})",
+                    (source, *chunk),
+                ).fetchall()
+                for row in rows:
+                    known[row[0]] = self._to_track(source, row)
+        return known
+
+    def add(
+        self,
+        track: TrackData,
+        spotify_release_date: Optional[str] = None,
+        linked: bool = True,
+    ):
+        """
+        Remember a parsed track. The resolved Spotify URI and release date
+        of an already known track are kept when the new record has none.
+
+        :param track: Track with `source` and `source_id` set.
+        :param spotify_release_date: Release date of the track on Spotify.
+        :param linked: Whether the track's `spotify_uri` was linked by the
+            scraped page, False when it was found by a search.
+        """
+        with self._lock:
+            self._db.execute(_UPSERT, self._row(track, spotify_release_date, linked))
+            self._db.commit()
+
+    def add_many(self, tracks: Iterable[TrackData]) -> int:
+        """
+        Remember parsed tracks in one transaction, like `add` does with
+        each of them.
+
+        :param tracks: Tracks with `source` and `source_id` set.
+        :return: Number of tracks stored.
+        """
+        rows = [self._row(track) for track in tracks]
+        with self._lock:
+            self._db.executemany(_UPSERT, rows)
+            self._db.commit()
+        return len(rows)
+
+    @staticmethod
+    def _row(
+        track: TrackData,
+        spotify_release_date: Optional[str] = None,
+        linked: bool = True,
+    ) -> tuple:
+        # Unlinked list entries carry an empty URI
+        spotify_uri = track.spotify_uri or None
+        return (
+            track.source,
+            track.source_id,
+            track.title,
+            track.artist_name,
+            track.release_date.isoformat() if track.release_date else None,
+            spotify_uri,
+            time.time(),
+            track.key,
+            release_key(track.title, track.artist_name),
+            spotify_release_date if spotify_uri else None,
+            int(bool(spotify_uri) and linked),
+        )
+
+    def set_spotify_uri(
+        self,
+        source: str,
+        source_id: str,
+        spotify_uri: Optional[str],
+        spotify_release_date: Optional[str] = None,
+    ):
+        """
+        Store the Spotify URI a search resolved a track to.
+
+        :param source: Name of the scraper source.
+        :param source_id: Id of the track within the source.
+        :param spotify_uri: Resolved Spotify URI, None to forget it.
+        :param spotify_release_date: Release date of the track on Spotify.
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE seen SET spotify_uri = ?, spotify_release_date = ?,"
+                " linked = 0 WHERE source = ? AND source_id = ?",
+                (spotify_uri, spotify_release_date, source, source_id),
+            )
+            self._db.commit()
+
+    def since(self, source: str, from_date: datetime) -> List[TrackData]:
+        """
+        Stored tracks of a source released on or after `from_date`.
+
+        :param source: Name of the scraper source.
+        :param from_date: Start of the window.
+        :return: List of tracks.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT source_id, title, artist_name, release_date, spotify_uri"
+                " FROM seen WHERE source = ? AND release_date >= ?",
+                (source, from_date.isoformat()),
+            ).fetchall()
+        return [self._to_track(source, row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
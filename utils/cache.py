@@ -0,0 +1,230 @@
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import requests
+
+from typing import Callable, List, Tuple
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+logger = logging.getLogger("hardstyle_watcher.utils.cache")
+
+# Response headers worth keeping, the body is stored decoded so
+# Content-Encoding and Content-Length no longer apply
+STORED_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Cache-Control", "Date")
+
+
+class HttpCache:
+    """
+    Persistent SQLite cache for GET responses with conditional revalidation.
+
+    Fresh entries are served without a request. Expired entries are
+    revalidated with If-None-Match / If-Modified-Since, a 304 answer renews
+    them without downloading the page again. The least recently used entries
+    are evicted once the stored bodies exceed `max_bytes`.
+
+    :param path: Path of the SQLite database.
+    :param ttls: List of (URL regex, seconds) pairs, the first match wins.
+    :param default_ttl: TTL of URLs matching none of the patterns. 0 disables
+        caching for those URLs.
+    :param max_bytes: Size cap of the stored bodies.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttls: List[Tuple[str, float]] = None,
+        default_ttl: float = 0,
+        max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.path = path
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls or []]
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "revalidated": 0,
+            "bypassed": 0,
+            "evicted": 0,
+        }
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                status INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                content BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_accessed_at
+                ON responses (accessed_at);
+            """)
+
+    def ttl_for(self, url: str) -> float:
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    def fetch(
+        self, url: str, get: Callable[[str, dict], requests.Response]
+    ) -> requests.Response:
+        """
+        Return the response for `url`, from the cache when possible.
+
+        :param url: URL to fetch.
+        :param get: Function performing the actual request, called with the
+            URL and the conditional request headers.
+        :return: Response object, `from_cache` is set on cached responses.
+        """
+        ttl = self.ttl_for(url)
+        if ttl <= 0:
+            self._count("bypassed")
+            return get(url, {})
+
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, headers, content, etag, last_modified, expires_at"
+                " FROM responses WHERE url = ?",
+                (url,),
+            ).fetchone()
+
+        if row is not None and row[5] > now:
+            self._count("hits")
+            self._touch(url, now)
+            return self._build_response(url, row)
+
+        conditional_headers = {}
+        if row is not None:
+            if row[3]:
+                conditional_headers["If-None-Match"] = row[3]
+            if row[4]:
+                conditional_headers["If-Modified-Since"] = row[4]
+
+        response = get(url, conditional_headers)
+
+        if response.status_code == 304 and row is not None:
+            self._count("revalidated")
+            self._touch(url, now, expires_at=now + ttl)
+            return self._build_response(url, row)
+
+        self._count("misses")
+        if response.status_code == 200:
+            self._store(url, response, now + ttl, now)
+
+        return response
+
+    def _build_response(self, url: str, row) -> requests.Response:
+        response = requests.Response()
+        response.url = url
+        response.status_code = row[0]
+        response.headers = CaseInsensitiveDict(json.loads(row[1]))
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = row[2]
+        response.from_cache = True
+        return response
+
+    def _touch(self, url: str, now: float, expires_at: float = None):
+        with self._lock:
+            if expires_at is None:
+                self._db.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE url = ?", (now, url)
+                )
+            else:
+                self._db.execute(
+                    "UPDATE responses SET accessed_at = ?, expires_at = ? WHERE url = ?",
+                    (now, expires_at, url),
+                )
+            self._db.commit()
+
+    def _store(self, url: str, response: requests.Response, expires_at, now):
+        content = response.content
+        if len(content) > self.max_bytes:
+            return
+
+        headers = {
+            name: response.headers[name]
+            for name in STORED_HEADERS
+            if name in response.headers
+        }
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    response.status_code,
+                    json.dumps(headers),
+                    content,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    expires_at,
+                    now,
+                    len(content),
+                ),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+
+        rows = self._db.execute(
+            "SELECT url, size FROM responses ORDER BY accessed_at"
+        ).fetchall()
+        evicted = []
+        for url, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((url,))
+            total -= size
+
+        self._db.executemany("DELETE FROM responses WHERE url = ?", evicted)
+        self._stats["evicted"] += len(evicted)
+        logger.debug(f"Evicted {len(evicted)} cached responses")
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_cache: HttpCache = None
+
+
+def get_cache() -> HttpCache:
+    """
+    Return the response cache used by `web_request`, None when caching is off.
+    """
+    return _cache
+
+
+def set_cache(cache: HttpCache):
+    """
+    Enable (or with None, disable) the response cache used by `web_request`.
+
+    :param cache: Cache to use from now on.
+    """
+    global _cache
+    _cache = cache
@@ -0,0 +1,56 @@
+import itertools
+import threading
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def map_ordered(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    max_workers: int = 4,
+    prefetch: int = None,
+) -> Iterator[R]:
+    """
+    Apply `func` to every item on a bounded worker pool and yield the results
+    in input order.
+
+    At most `prefetch` items are submitted ahead of the one being consumed.
+    Closing the generator (e.g. breaking out of a `with closing(...)` block)
+    cancels the work that has not started yet.
+
+    :param func: Function to apply to every item.
+    :param items: Items to process.
+    :param max_workers: Number of worker threads.
+    :param prefetch: Number of items submitted ahead. Defaults to max_workers.
+    :return: Iterator over the results, in the order of `items`.
+    """
+    prefetch = max(1, prefetch or max_workers)
+    stopped = threading.Event()
+
+    def _run(item):
+        if stopped.is_set():
+            return None
+        return func(item)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    iterator = iter(items)
+    pending = deque(
+        executor.submit(_run, item) for item in itertools.islice(iterator, prefetch)
+    )
+
+    try:
+        while pending:
+            result = pending.popleft().result()
+            for item in itertools.islice(iterator, 1):
+                pending.append(executor.submit(_run, item))
+            yield result
+    finally:
+        stopped.set()
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
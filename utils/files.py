@@ -0,0 +1,28 @@
+import os
+
+from contextlib import contextmanager
+from typing import Iterator, TextIO
+
+
+@contextmanager
+def atomic_write(path: str, mode: int = 0o666) -> Iterator[TextIO]:
+    """
+    Write a text file through a temporary file that is synced to disk and
+    renamed over `path`, so readers and a crash mid-write only ever see the
+    old or the new content. Nothing is replaced when the block raises.
+
+    :param path: Path of the file to write.
+    :param mode: Permissions of a newly created file, before the umask.
+    :return: Context yielding the open temporary file.
+    """
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    try:
+        with os.fdopen(fd, "w") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    os.replace(tmp_path, path)
@@ -0,0 +1,150 @@
+import logging
+import threading
+import requests
+
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("hardstyle_watcher.utils.http")
+
+DEFAULT_HEADERS = {
+    "User-Agent": "hardstyle-sonar/1.0 (+https://open.spotify.com/playlist/0J4ajfoQIajAnderVJZDgl)",
+    "Accept-Encoding": "gzip, deflate",
+    "Accept": "*/*",
+    "Connection": "keep-alive",
+}
+
+
+class HttpClient:
+    """
+    Keep-alive HTTP client shared by the scrapers and the playlist services.
+
+    Connections are pooled per host, so a run performs roughly one TCP/TLS
+    handshake per host instead of one per request.
+
+    :param pool_connections: Number of host pools to keep.
+    :param pool_maxsize: Number of connections kept alive per host. Should be
+        at least the number of threads requesting the same host.
+    :param timeout: Default (connect, read) timeout in seconds.
+    :param headers: Headers added to (or overriding) the default headers.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        timeout: tuple = (5, 30),
+        headers: dict = None,
+    ):
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        if headers:
+            self.session.headers.update(headers)
+
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+
+        # Counters of host pools that were evicted from the pool manager
+        self._evicted = {}
+        self._lock = threading.Lock()
+        self._track_evictions()
+
+    def _track_evictions(self):
+        pools = self._adapter.poolmanager.pools
+        dispose = pools.dispose_func
+
+        def _dispose(pool):
+            self._add_counters(self._evicted, pool)
+            if dispose:
+                dispose(pool)
+
+        pools.dispose_func = _dispose
+
+    def _add_counters(self, counters: dict, pool):
+        with self._lock:
+            host_counters = counters.setdefault(
+                pool.host, {"requests": 0, "connections": 0}
+            )
+            host_counters["requests"] += pool.num_requests
+            host_counters["connections"] += pool.num_connections
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Make a request through the pooled session.
+
+        :param method: HTTP method.
+        :param url: URL to make the request to.
+        :param kwargs: Arguments passed on to `requests.Session.request`.
+        :return: Response object.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def stats(self) -> dict:
+        """
+        Connection reuse counters per host.
+
+        :return: Mapping of host to the number of requests, new connections
+            (handshakes) and requests that reused a kept-alive connection.
+        """
+        counters = {
+            host: dict(host_counters) for host, host_counters in self._evicted.items()
+        }
+
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                self._add_counters(counters, pool)
+
+        for host_counters in counters.values():
+            host_counters["reused"] = max(
+                0, host_counters["requests"] - host_counters["connections"]
+            )
+
+        return counters
+
+    def close(self):
+        self.session.close()
+
+
+_client: HttpClient = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """
+    Return the process wide HTTP client, creating it with default settings
+    on first use.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def set_client(client: HttpClient):
+    """
+    Replace the process wide HTTP client, e.g. to change pool sizes or timeouts.
+
+    :param client: Client to use from now on.
+    """
+    global _client
+    with _client_lock:
+        _client = client
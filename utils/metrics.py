@@ -0,0 +1,201 @@
+import json
+import logging
+import threading
+import time
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from utils.files import atomic_write
+
+logger = logging.getLogger("hardstyle_watcher.utils.metrics")
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+PREFIX = "hardstyle"
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> dict:
+        cumulative, total = {}, 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            cumulative[str(bound)] = total
+        return {"buckets": cumulative, "sum": self.sum, "count": self.count}
+
+
+class Metrics:
+    """
+    In-process recorder of request latencies, status codes, transferred bytes,
+    retries and per-stage spans of a sync run.
+
+    Every recording method returns right away while the recorder is disabled,
+    so instrumented code costs next to nothing when metrics are off.
+
+    :param enabled: Whether to record.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+            self._spans = {}
+            self._started_at = time.time()
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram()
+            self._histograms[key].observe(value)
+
+    def record_request(
+        self, endpoint: str, url: str, seconds: float, response=None, error=None
+    ):
+        """
+        Record one HTTP request.
+
+        :param endpoint: Logical endpoint, e.g. "detail_page" or "search".
+        :param url: Requested URL, its host becomes a label.
+        :param seconds: Time the request took.
+        :param response: Response object, None when the request raised.
+        :param error: Exception the request raised.
+        """
+        if not self.enabled:
+            return
+        host = urlparse(url).netloc
+        status = str(response.status_code) if response is not None else "error"
+        self.observe("request_seconds", seconds, endpoint=endpoint, host=host)
+        self.inc("requests_total", endpoint=endpoint, host=host, status=status)
+        if response is not None:
+            self.inc(
+                "response_bytes_total",
+                len(response.content),
+                endpoint=endpoint,
+                host=host,
+            )
+        if error is not None:
+            self.inc("request_errors_total", endpoint=endpoint, host=host)
+
+    def add_span(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._spans[name] = self._spans.get(name, 0.0) + seconds
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        Time the `with` block as stage `name`.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, time.perf_counter() - start)
+
+    def to_dict(self) -> dict:
+        def _entries(items, value):
+            return [
+                {"name": name, "labels": dict(labels), "value": value(metric)}
+                for (name, labels), metric in sorted(items, key=lambda i: i[0])
+            ]
+
+        with self._lock:
+            return {
+                "started_at": self._started_at,
+                "duration_seconds": time.time() - self._started_at,
+                "spans": dict(self._spans),
+                "counters": _entries(self._counters.items(), lambda v: v),
+                "histograms": _entries(self._histograms.items(), lambda h: h.to_dict()),
+            }
+
+    def to_prometheus(self) -> str:
+        def _labels(labels, **extra) -> str:
+            labels = dict(labels, **extra)
+            if not labels:
+                return ""
+            body = ",".join(f'{name}="{value}"' for name, value in labels.items())
+            return "{" + body + "}"
+
+        lines = []
+        typed = set()
+
+        def _type(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                metric = f"{PREFIX}_{name}"
+                _type(metric, "counter")
+                lines.append(f"{metric}{_labels(labels)} {value}")
+
+            for (name, labels), histogram in sorted(
+                self._histograms.items(), key=lambda i: i[0]
+            ):
+                metric = f"{PREFIX}_{name}"
+                _type(metric, "histogram")
+                for bound, count in histogram.to_dict()["buckets"].items():
+                    lines.append(f"{metric}_bucket{_labels(labels, le=bound)} {count}")
+                lines.append(f"{metric}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+
+            metric = f"{PREFIX}_stage_seconds"
+            for name, seconds in sorted(self._spans.items()):
+                _type(metric, "gauge")
+                lines.append(f'{metric}{{stage="{name}"}} {seconds}')
+
+            _type(f"{PREFIX}_last_run_timestamp_seconds", "gauge")
+            lines.append(f"{PREFIX}_last_run_timestamp_seconds {self._started_at}")
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _write(path: str, content: str):
+        # Collectors never read a partial file
+        with atomic_write(path) as f:
+            f.write(content)
+
+    def write_json(self, path: str):
+        self._write(path, json.dumps(self.to_dict(), indent=2))
+
+    def write_prometheus(self, path: str):
+        self._write(path, self.to_prometheus())
+
+
+metrics = Metrics()
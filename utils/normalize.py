@@ -0,0 +1,49 @@
+import re
+import unicodedata
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize a title or artist name for matching: casefolded, accents
+    stripped, punctuation replaced by spaces and whitespace collapsed.
+
+    "Lose Control (Remix)" and "lose control  remix" normalize the same.
+
+    :param text: Text to normalize, None is treated as empty.
+    :return: Normalized text.
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = _PUNCTUATION.sub(" ", text.casefold()).replace("_", " ")
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def normalize_query(title: str, artist_name: str) -> str:
+    """
+    Normalized (title, artist) key of a track.
+
+    :param title: Track title.
+    :param artist_name: Artist name, may be empty.
+    :return: Key of the form "title|artist".
+    """
+    return f"{normalize_text(title)}|{normalize_text(artist_name)}"
+
+
+def release_key(title: str, artist_name: str) -> str:
+    """
+    Normalized (title, artist) key of a release across sources. Sources
+    without an artist field (releasehardstyle.nl) put "Artist - Title" in
+    the title, it is split so both sources give the same key.
+
+    :param title: Track title.
+    :param artist_name: Artist name, may be empty.
+    :return: Key of the form "title|artist".
+    """
+    if not artist_name and " - " in (title or ""):
+        artist_name, title = title.split(" - ", 1)
+    return normalize_query(title, artist_name)
@@ -0,0 +1,38 @@
+import logging
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+logger = logging.getLogger("hardstyle_watcher.utils.parsing")
+
+try:
+    import lxml  # noqa: F401
+
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+FALLBACK_PARSER = "html.parser"
+
+
+def parse_html(
+    content: bytes, parse_only: SoupStrainer = None, parser: str = None
+) -> BeautifulSoup:
+    """
+    Parse an HTML page, optionally only the subtrees matching `parse_only`.
+
+    Uses lxml when it is installed and falls back to Python's html.parser
+    otherwise, or when lxml fails on the page.
+
+    :param content: Raw page content.
+    :param parse_only: Strainer selecting the subtrees to build.
+    :param parser: Parser to use instead of the fastest available one.
+    :return: Parsed document.
+    """
+    parser = parser or PARSER
+    try:
+        return BeautifulSoup(content, parser, parse_only=parse_only)
+    except Exception as e:
+        if parser == FALLBACK_PARSER:
+            raise
+        logger.warning(f"{parser} failed to parse page, using {FALLBACK_PARSER}: {e}")
+        return BeautifulSoup(content, FALLBACK_PARSER, parse_only=parse_only)
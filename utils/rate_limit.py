@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+logger = logging.getLogger("hardstyle_watcher.utils.rate_limit")
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` acquisitions per second with bursts up to `capacity`.
+
+    :param rate: Tokens added per second. A value <= 0 disables the limit.
+    :param capacity: Maximum number of tokens the bucket holds. Defaults to max(1, rate).
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """
+    Per-host politeness limits: a token bucket for the request rate and a
+    semaphore for the number of requests in flight.
+
+    :param requests_per_second: Default rate for hosts that were not configured.
+    :param max_in_flight: Default number of concurrent requests per host.
+    """
+
+    def __init__(self, requests_per_second: float = 2.0, max_in_flight: int = 4):
+        self.requests_per_second = requests_per_second
+        self.max_in_flight = max_in_flight
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def configure(
+        self, host: str, requests_per_second: float = None, max_in_flight: int = None
+    ):
+        """
+        Set the limits of a host. Replaces any previous limits for that host.
+
+        :param host: Host name, e.g. "hardstyle.com".
+        :param requests_per_second: Allowed request rate for the host.
+        :param max_in_flight: Allowed number of concurrent requests for the host.
+        """
+        if requests_per_second is None:
+            requests_per_second = self.requests_per_second
+        if max_in_flight is None:
+            max_in_flight = self.max_in_flight
+
+        with self._lock:
+            self._hosts[host] = (
+                TokenBucket(requests_per_second),
+                threading.BoundedSemaphore(max_in_flight),
+            )
+        logger.debug(
+            f"Rate limit for {host}: {requests_per_second} req/s, {max_in_flight} in flight"
+        )
+
+    def _get(self, host: str):
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = (
+                    TokenBucket(self.requests_per_second),
+                    threading.BoundedSemaphore(self.max_in_flight),
+                )
+            return self._hosts[host]
+
+    @contextmanager
+    def limit(self, url: str):
+        """
+        Block until a request to the host of `url` is allowed, and hold an
+        in-flight slot for the duration of the `with` block.
+
+        :param url: URL that is about to be requested.
+        """
+        bucket, in_flight = self._get(urlparse(url).netloc)
+        with in_flight:
+            bucket.acquire()
+            yield
+
+
+class AdaptiveConcurrency:
+    """
+    Cap on the number of requests in flight that adapts to rate limiting:
+    a throttled (429) answer halves the cap, every `limit` answers in a row
+    that were not throttled raise it by one again, up to `max_in_flight`.
+
+    :param max_in_flight: Upper bound of the cap, where it starts.
+    :param min_in_flight: Lower bound of the cap.
+    """
+
+    def __init__(self, max_in_flight: int, min_in_flight: int = 1):
+        self.max_in_flight = max(1, max_in_flight)
+        self.min_in_flight = max(1, min(min_in_flight, self.max_in_flight))
+        self.limit = self.max_in_flight
+        self.throttled = 0
+        self._in_flight = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """
+        Block until a request may be sent, and hold its slot for the
+        duration of the `with` block.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify()
+
+    def record(self, throttled: bool):
+        """
+        Adapt the cap to an answer.
+
+        :param throttled: Whether the answer was a 429.
+        """
+        with self._condition:
+            if throttled:
+                self.throttled += 1
+                self._successes = 0
+                limit = max(self.min_in_flight, self.limit // 2)
+                if limit < self.limit:
+                    logger.info(f"Throttled, lowering the concurrency to {limit}")
+                self.limit = limit
+                return
+
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_in_flight:
+                self._successes = 0
+                self.limit += 1
+                self._condition.notify()
+
+
+rate_limiter = HostRateLimiter()
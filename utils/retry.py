@@ -0,0 +1,186 @@
+import logging
+import random
+import threading
+import time
+import requests
+
+from email.utils import parsedate_to_datetime
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+from utils.metrics import metrics
+
+logger = logging.getLogger("hardstyle_watcher.utils.retry")
+
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# Answers telling that the request was not processed
+NOT_PROCESSED_STATUS_CODES = frozenset({429, 503})
+# Methods whose requests can be repeated without repeating their effect. PUT
+# is not one of them, Spotify's reorder moves a range relative to the
+# current order
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "DELETE"})
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a request to a host that is considered down."""
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_failure_status(status_code: int) -> bool:
+    return status_code in RETRYABLE_STATUS_CODES
+
+
+class RetryPolicy:
+    """
+    Decides which failures are retried and how long to wait before the next
+    attempt.
+
+    Timeouts, connection errors, 429 and 5xx answers are retried, other
+    errors are not. Non-idempotent requests (POST, PUT) are only retried
+    on 429 and 503, which mean the request was not processed: after a
+    timeout, a dropped connection or another 5xx the server may have
+    applied it. A Retry-After header is respected,
+    otherwise the wait is a full-jitter exponential backoff. All waits of a
+    run share a deadline, so a degraded host cannot stall the run for
+    minutes.
+
+    :param max_delay: Upper bound of a single wait in seconds.
+    :param deadline: Seconds after `start_run` during which retries are allowed.
+    """
+
+    def __init__(self, max_delay: float = 30, deadline: float = 300):
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self._deadline_at = None
+        self._random = random.Random()
+
+    def start_run(self, deadline: float = None):
+        """
+        Start the retry budget of a new run.
+
+        :param deadline: Seconds of the budget, defaults to the policy's.
+        """
+        if deadline is not None:
+            self.deadline = deadline
+        self._deadline_at = time.monotonic() + self.deadline
+
+    def classify(
+        self, error: Exception, idempotent: bool = None
+    ) -> Tuple[bool, Optional[float]]:
+        """
+        :param error: Exception raised by an attempt.
+        :param idempotent: Whether the request can be repeated safely,
+            derived from the method of the failed request when None.
+        :return: Whether to retry, and the server requested wait if any.
+        """
+        if isinstance(error, CircuitOpenError):
+            return False, None
+        if idempotent is None:
+            request = getattr(error, "request", None)
+            method = getattr(request, "method", None) or "GET"
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+
+        if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+            return idempotent, None
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            status_code = error.response.status_code
+            if status_code in NOT_PROCESSED_STATUS_CODES or (
+                idempotent and is_failure_status(status_code)
+            ):
+                return True, _retry_after(error.response)
+        return False, None
+
+    def wait_time(self, delay: float, retry_after: Optional[float]) -> float:
+        """
+        :param delay: Exponential backoff of this attempt.
+        :param retry_after: Server requested wait, if any.
+        :return: Seconds to wait before the next attempt.
+        """
+        if retry_after is not None:
+            # A little jitter keeps concurrent callers from retrying in lockstep
+            return retry_after + self._random.uniform(0, 0.5)
+        return self._random.uniform(0, min(self.max_delay, delay))
+
+    def within_deadline(self, wait: float) -> bool:
+        if self._deadline_at is None:
+            return True
+        return time.monotonic() + wait < self._deadline_at
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker. After `failure_threshold` consecutive failures
+    (5xx, timeouts, connection errors) requests to the host fail fast for
+    `reset_timeout` seconds, then a single trial request is let through.
+
+    :param failure_threshold: Consecutive failures that open the circuit.
+    :param reset_timeout: Seconds the circuit stays open.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = {}
+        self._opened_at = {}
+        self._lock = threading.Lock()
+
+    def check(self, url: str):
+        """
+        Raise `CircuitOpenError` when the host of `url` is considered down.
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return
+            if time.monotonic() - opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"Circuit open for {host}")
+
+            # Half-open, let this request through as the trial
+            self._opened_at[host] = time.monotonic()
+
+    def record(self, url: str, failed: bool):
+        host = urlparse(url).netloc
+        with self._lock:
+            if not failed:
+                self._failures.pop(host, None)
+                self._opened_at.pop(host, None)
+                return
+
+            self._failures[host] = self._failures.get(host, 0) + 1
+            if self._failures[host] >= self.failure_threshold:
+                if host not in self._opened_at:
+                    logger.warning(
+                        f"{host} failed {self._failures[host]} times in a row, opening circuit"
+                    )
+                    metrics.inc("circuit_open_total", host=host)
+                self._opened_at[host] = time.monotonic()
+
+    def record_response(self, url: str, response: requests.Response):
+        # 429 means the host is up but throttling, it does not count
+        self.record(
+            url,
+            failed=response.status_code != 429
+            and is_failure_status(response.status_code),
+        )
+
+    def record_error(self, url: str, error: Exception):
+        self.record(
+            url, failed=isinstance(error, (requests.Timeout, requests.ConnectionError))
+        )
+
+
+retry_policy = RetryPolicy()
+circuit_breaker = CircuitBreaker()
@@ -2,31 +2,62 @@ import requests
 import logging
 import time
 
+from utils.cache import get_cache
+from functools import partial
+from utils.http import get_client
+from utils.metrics import metrics
+from utils.rate_limit import rate_limiter
+from utils.retry import RetryPolicy, circuit_breaker, retry_policy
+
 logger = logging.getLogger("hardstyle_watcher.utils")
 
 
-def retry_with_backoff(tries=3, delay=1, backoff=2):
+def retry_with_backoff(
+    tries=3, delay=1, backoff=2, policy: RetryPolicy = None, idempotent: bool = None
+):
     """
     Retry calling the decorated function using an exponential backoff.
 
+    Only failures the policy classifies as transient (timeouts, connection
+    errors, 429 and 5xx) are retried, non-idempotent requests only on 429
+    and 503. Waits are jittered, respect Retry-After
+    and stop once the run's retry deadline would be exceeded.
+
     :param tries: Number of times to try before giving up.
     :param delay: Initial delay between retries in seconds.
     :param backoff: Backoff multiplier (e.g. value of 2 will double the delay each retry).
+    :param policy: Retry policy, defaults to the shared `retry_policy`.
+    :param idempotent: Whether the decorated call can be repeated safely,
+        derived from the method of the failed request when None.
     """
 
     def decorator(func):
         def wrapper(*args, **kwargs):
+            active_policy = policy or retry_policy
             local_delay = delay
             for i in range(tries):
                 try:
                     return func(*args, **kwargs)
                 except Exception as e:
-                    if i == tries - 1:
+                    retryable, retry_after = active_policy.classify(e, idempotent)
+                    if not retryable or i == tries - 1:
+                        raise
+
+                    wait = active_policy.wait_time(local_delay, retry_after)
+                    if not active_policy.within_deadline(wait):
+                        logger.warning(
+                            f"Not retrying {func.__name__}, retry deadline reached"
+                        )
                         raise
+
                     logger.warning(
-                        f"Failed to call {func.__name__} with {args} and {kwargs}. Retrying in {local_delay}s"
+                        f"Failed to call {func.__name__}: {e}. Retrying in {wait:.1f}s"
+                    )
+                    metrics.inc("retries_total", function=func.__name__)
+                    metrics.inc(
+                        "retry_sleep_seconds_total", wait, function=func.__name__
                     )
-                    time.sleep(local_delay)
+                    time.sleep(wait)
                     local_delay *= backoff
 
         return wrapper
@@ -34,14 +65,39 @@ def retry_with_backoff(tries=3, delay=1, backoff=2):
     return decorator
 
 
+def _get(url: str, headers: dict = None, endpoint: str = "page") -> requests.Response:
+    circuit_breaker.check(url)
+    with rate_limiter.limit(url):
+        start = time.perf_counter()
+        try:
+            response = get_client().get(url, headers=headers)
+        except Exception as e:
+            metrics.record_request(endpoint, url, time.perf_counter() - start, error=e)
+            circuit_breaker.record_error(url, e)
+            raise
+        metrics.record_request(endpoint, url, time.perf_counter() - start, response)
+        circuit_breaker.record_response(url, response)
+
+    # Error pages must not reach the parsers
+    response.raise_for_status()
+    return response
+
+
 @retry_with_backoff(tries=3, delay=1, backoff=2)
-def web_request(url: str) -> requests.Response:
+def web_request(url: str, endpoint: str = "page") -> requests.Response:
     """
-    Make a web request to the given URL.
+    Make a web request to the given URL through the shared keep-alive client,
+    respecting the rate limit of its host. Served from the response cache
+    when one is enabled.
 
     :param url: URL to make the request to.
+    :param endpoint: Kind of page requested, used to group the metrics.
     :return: Response object.
     """
-    web = requests.Session()
-    response = web.get(url)
-    return response
+    cache = get_cache()
+    if cache is not None:
+        response = cache.fetch(url, partial(_get, endpoint=endpoint))
+        if getattr(response, "from_cache", False):
+            metrics.inc("cache_served_total", endpoint=endpoint)
+        return response
+    return _get(url, endpoint=endpoint)